@@ -9,6 +9,10 @@ from django.conf import settings
 from django.core.mail import send_mail, get_connection
 from .forms import RegisterForm
 from store.models import SiteSettings, VerificationCode, Order
+from store.metrics import emails_sent
+import logging
+
+logger = logging.getLogger(__name__)
 
 def login_view(request):
     """User login"""
@@ -97,7 +101,7 @@ If you did not register, please ignore this email.
                     )
                     from_email = site_settings.email_host_user
             except Exception as e:
-                print(f"SiteSettings error: {e}")
+                logger.warning('Using default email settings; SiteSettings lookup failed: %s', e)
 
             try:
                 send_mail(
@@ -108,8 +112,11 @@ If you did not register, please ignore this email.
                     connection=connection,
                     fail_silently=False,
                 )
+                emails_sent.inc(kind='verification', outcome='sent')
                 messages.success(request, 'Please check your email for a verification code.')
             except Exception as e:
+                emails_sent.inc(kind='verification', outcome='failed')
+                logger.exception('Verification email to user %s failed', user.pk)
                 messages.error(request, f'Account created but error sending email. Please contact support.')
                 
             # Store email in session for verification page
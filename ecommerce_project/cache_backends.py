@@ -0,0 +1,279 @@
+"""
+Two-level cache: a bounded in-process LRU in front of a shared cache.
+
+Configured as the ``default`` alias with ``LOCATION`` naming the shared
+alias (a FileBasedCache every worker on the host can read). Reads check the
+worker's LRU first, then the shared cache, and keep what they found locally
+for at most LOCAL_TIMEOUT seconds, so a delete in one worker reaches the
+others within that window. Almost every key in this project embeds a
+version or timestamp, which makes that window harmless.
+
+Timeouts are shortened by up to JITTER (a fraction) so entries written
+together do not all expire in the same second, and get_or_set() with a
+callable is single-flight: concurrent misses for a key in one process wait
+for the first caller, and other processes back off while a short lock key
+in the shared cache says someone is already computing it. Taking that lock
+relies on add() being atomic, which FileCache guarantees for the file cache.
+"""
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+
+from store.metrics import cache_lookups
+
+# One LRU per process and LOCATION; Django creates a backend instance per thread
+_stores = {}
+_stores_lock = threading.Lock()
+
+# Next time each FileCache directory may be culled (monotonic seconds)
+_next_cull = {}
+
+
+class FileCache(FileBasedCache):
+    """
+    FileBasedCache with an atomic add() and a rate-limited cull.
+
+    add() hard-links a fully written temporary file to the entry's name,
+    which fails if the entry exists, so exactly one process wins. Django's
+    version checks and then writes, letting two processes both "add".
+
+    Django culls on every write, and every cull lists the whole directory
+    even when it is below MAX_ENTRIES. Here a directory is culled at most
+    once per CULL_INTERVAL seconds per process, so it can briefly exceed
+    MAX_ENTRIES by what is written in between.
+    """
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self.cull_interval = params.get('OPTIONS', {}).get('CULL_INTERVAL', 60)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._createdir()
+        fname = self._key_to_file(key, version)
+        self._cull()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as f:
+                self._write_content(f, timeout, value)
+            for _ in range(2):
+                try:
+                    os.link(tmp_path, fname)
+                    return True
+                except FileExistsError:
+                    # has_key() removes an expired entry, which then gets one more try
+                    if self.has_key(key, version):
+                        return False
+            return False
+        finally:
+            os.remove(tmp_path)
+
+    def _cull(self):
+        now = time.monotonic()
+        if now < _next_cull.get(self._dir, 0):
+            return
+        _next_cull[self._dir] = now + self.cull_interval
+        super()._cull()
+
+
+class LocalStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (expires_at, pickled value)
+        self.flights = {}  # key -> [lock, callers], for get_or_set()
+
+
+class TwoLevelCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = location
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.jitter = options.get('JITTER', 0.1)
+        self.lock_timeout = options.get('LOCK_TIMEOUT', 10)
+        with _stores_lock:
+            self.store = _stores.setdefault(location, LocalStore())
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def jittered(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        # None caches forever and 0 not at all; neither gets jitter
+        if timeout is None or timeout <= 0:
+            return timeout
+        return max(1, round(timeout * (1 - random.uniform(0, self.jitter))))
+
+    # -- local LRU ------------------------------------------------------------
+
+    def local_get(self, key):
+        with self.store.lock:
+            entry = self.store.entries.get(key)
+            if entry is None:
+                return self._missing_key
+            expires_at, pickled = entry
+            if expires_at < time.monotonic():
+                del self.store.entries[key]
+                return self._missing_key
+            self.store.entries.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def local_set(self, key, value, timeout=None):
+        lifetime = self.local_timeout if timeout is None else min(timeout, self.local_timeout)
+        if lifetime <= 0:
+            return
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        with self.store.lock:
+            self.store.entries[key] = (time.monotonic() + lifetime, pickled)
+            self.store.entries.move_to_end(key)
+            while len(self.store.entries) > self._max_entries:
+                self.store.entries.popitem(last=False)
+
+    def local_delete(self, key):
+        with self.store.lock:
+            return self.store.entries.pop(key, None) is not None
+
+    @contextmanager
+    def flight(self, key):
+        """Hold this process's lock for computing ``key``; other keys never wait on it."""
+        with self.store.lock:
+            flight = self.store.flights.setdefault(key, [threading.Lock(), 0])
+            flight[1] += 1
+        try:
+            with flight[0]:
+                yield
+        finally:
+            with self.store.lock:
+                flight[1] -= 1
+                if not flight[1]:
+                    del self.store.flights[key]
+
+    # -- cache API --------------------------------------------------------------
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        value = self.local_get(local_key)
+        if value is not self._missing_key:
+            cache_lookups.inc(cache='default', result='local')
+            return value
+        value = self.shared.get(key, self._missing_key, version=version)
+        if value is self._missing_key:
+            cache_lookups.inc(cache='default', result='miss')
+            return default
+        cache_lookups.inc(cache='default', result='shared')
+        self.local_set(local_key, value)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self.jittered(timeout)
+        self.shared.set(key, value, timeout, version=version)
+        self.local_set(self.make_and_validate_key(key, version=version), value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self.jittered(timeout)
+        if not self.shared.add(key, value, timeout, version=version):
+            return False
+        self.local_set(self.make_and_validate_key(key, version=version), value, timeout)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, self.jittered(timeout), version=version)
+
+    def delete(self, key, version=None):
+        local = self.local_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.delete(key, version=version) or local
+
+    def has_key(self, key, version=None):
+        return self.get(key, self._missing_key, version=version) is not self._missing_key
+
+    def get_many(self, keys, version=None):
+        found = {}
+        misses = []
+        for key in keys:
+            value = self.local_get(self.make_and_validate_key(key, version=version))
+            if value is self._missing_key:
+                misses.append(key)
+            else:
+                found[key] = value
+        fetched = self.shared.get_many(misses, version=version) if misses else {}
+        for key, value in fetched.items():
+            self.local_set(self.make_and_validate_key(key, version=version), value)
+        cache_lookups.inc(len(found), cache='default', result='local')
+        cache_lookups.inc(len(fetched), cache='default', result='shared')
+        cache_lookups.inc(len(misses) - len(fetched), cache='default', result='miss')
+        found.update(fetched)
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self.jittered(timeout)
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self.local_set(self.make_and_validate_key(key, version=version), value, timeout)
+        return failed
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.local_delete(self.make_and_validate_key(key, version=version))
+        self.shared.delete_many(keys, version=version)
+
+    def clear(self):
+        with self.store.lock:
+            self.store.entries.clear()
+        self.shared.clear()
+
+    # -- single flight ----------------------------------------------------------
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Like BaseCache.get_or_set(), but a callable ``default`` runs once per
+        miss rather than once per concurrent caller. A None result is
+        returned without being cached.
+        """
+        value = self.get(key, self._missing_key, version=version)
+        if value is not self._missing_key:
+            return value
+        if not callable(default):
+            return super().get_or_set(key, default, timeout=timeout, version=version)
+
+        with self.flight(self.make_and_validate_key(key, version=version)):
+            value = self.get(key, self._missing_key, version=version)
+            if value is not self._missing_key:
+                return value
+            lock_key = f'{key}:computing'
+            locked = self.shared.add(lock_key, True, self.lock_timeout, version=version)
+            if not locked:
+                value = self.wait_for(key, version)
+                if value is not self._missing_key:
+                    return value
+            try:
+                value = default()
+                if value is not None:
+                    self.set(key, value, timeout, version=version)
+            finally:
+                if locked:
+                    self.shared.delete(lock_key, version=version)
+            return value
+
+    def wait_for(self, key, version, interval=0.05):
+        """Poll the shared cache while another process computes ``key``."""
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(interval)
+            value = self.shared.get(key, self._missing_key, version=version)
+            if value is not self._missing_key:
+                self.local_set(self.make_and_validate_key(key, version=version), value)
+                return value
+        return self._missing_key
@@ -0,0 +1,56 @@
+from django.conf import settings
+
+CHURN_DB = 'churn'
+
+
+class ChurnRouter:
+    """
+    Keeps high-churn, low-value tables (sessions, which also carry flash
+    messages, cart items and verification codes) in their own SQLite file,
+    so cart clicks and session saves do not queue for the same writer lock
+    as checkout and catalogue edits.
+
+    Rows in the churn database point at users and products by id only:
+    the foreign keys there have no database constraint, and cleanup on
+    delete is done by signals in store/signals.py.
+    """
+    churn_models = {
+        ('sessions', 'session'),
+        ('store', 'cartitem'),
+        ('store', 'verificationcode'),
+    }
+
+    @staticmethod
+    def enabled():
+        return CHURN_DB in settings.DATABASES
+
+    def is_churn(self, app_label, model_name):
+        return (app_label, model_name) in self.churn_models
+
+    def db_for_read(self, model, **hints):
+        if not self.enabled():
+            return None
+        if self.is_churn(model._meta.app_label, model._meta.model_name):
+            return CHURN_DB
+        # Following cart_item.product: Django would otherwise stay on the
+        # instance's database
+        instance = hints.get('instance')
+        if instance is not None and self.is_churn(instance._meta.app_label, instance._meta.model_name):
+            return 'default'
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if self.enabled() and any(self.is_churn(obj._meta.app_label, obj._meta.model_name) for obj in (obj1, obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if not self.enabled():
+            return None
+        model_name = model_name or hints.get('model_name')
+        # Operations without a model (RunPython, RunSQL) only run on default,
+        # except for the sessions app, which lives entirely in churn
+        churn = app_label == 'sessions' or self.is_churn(app_label, model_name)
+        return churn if db == CHURN_DB else not churn
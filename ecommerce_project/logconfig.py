@@ -0,0 +1,137 @@
+"""
+JSON-lines logging that never blocks a request on log I/O.
+
+Records are stamped with the current request's context (request id, user
+id, and an order id once a view binds one) in the request thread, then
+handed to a bounded queue; a background listener thread formats them as
+one JSON object per line and does the writing. When the queue is full
+records are dropped and counted rather than waited on.
+
+    from ecommerce_project.logconfig import bind
+    bind(order_id=order.id)   # included in every later record of this request
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+request_context = contextvars.ContextVar('request_context', default={})
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+STANDARD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+# Incoming X-Request-ID values are reused only if they look like an id
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+def bind(**fields):
+    """Add fields to the context of every record logged for the rest of this request."""
+    request_context.set({**request_context.get(), **fields})
+
+
+class RequestContextFilter(logging.Filter):
+    def filter(self, record):
+        for name, value in request_context.get().items():
+            if not hasattr(record, name):
+                setattr(record, name, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data.update(
+            (name, value) for name, value in vars(record).items()
+            if name not in STANDARD_ATTRIBUTES and not name.startswith('_')
+        )
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Queues records for a listener thread that writes JSON lines to
+    ``filename``, or to stderr when no filename is given.
+    """
+
+    def __init__(self, filename=None, queue_size=10000):
+        self.filename = filename
+        self.queue_size = queue_size
+        self.dropped = 0
+        super().__init__(queue.Queue(queue_size))
+        self.start()
+        atexit.register(self.stop)
+
+    def start(self):
+        """(Re)start the listener; also called in a forked worker, which has no thread."""
+        self.pid = os.getpid()
+        target = logging.FileHandler(self.filename) if self.filename else logging.StreamHandler(sys.stderr)
+        target.setFormatter(JsonFormatter())
+        self.listener = QueueListener(self.queue, target)
+        self.listener.start()
+
+    def stop(self):
+        if self.pid == os.getpid():
+            self.listener.stop()
+
+    def prepare(self, record):
+        # Resolve everything that depends on the calling thread before the
+        # record crosses to the listener: message arguments and the traceback
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record = logging.makeLogRecord(vars(record))
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def enqueue(self, record):
+        if self.pid != os.getpid():
+            self.queue = queue.Queue(self.queue_size)
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RequestContextMiddleware:
+    """
+    Binds a request id (the incoming X-Request-ID if it looks valid, else a
+    new one) for the whole request, and the user id once authentication
+    has run. The id is echoed back in the X-Request-ID response header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        incoming = request.headers.get('X-Request-ID', '')
+        request_id = incoming if REQUEST_ID_PATTERN.match(incoming) else uuid.uuid4().hex
+        request.request_id = request_id
+        token = request_context.set({'request_id': request_id})
+        try:
+            response = self.get_response(request)
+        finally:
+            request_context.reset(token)
+        response.headers['X-Request-ID'] = request_id
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            bind(user_id=user.pk)
@@ -0,0 +1,44 @@
+"""
+Session engine: Django's cached_db store without the writes that change nothing.
+
+Reads come from the cache and only fall back to the django_session table
+on a miss. SessionMiddleware saves whenever a view assigns to the session,
+even if it stores the value that was already there (checkout does this on
+every visit); here such a save is dropped unless the row is past half its
+lifetime, so the expiry still slides forward for active shoppers.
+
+Expired rows are deleted by the scheduled "python manage.py clearsessions",
+never during a request.
+"""
+import time
+
+from django.contrib.sessions.backends import cached_db
+
+# When the row was last written (epoch seconds); stored with the session data
+SAVED_AT_KEY = '_session_saved_at'
+
+
+class SessionStore(cached_db.SessionStore):
+    loaded_state = None
+
+    def state(self, data):
+        """Serialized session data, ignoring the saved-at stamp."""
+        return self.serializer().dumps({key: value for key, value in data.items() if key != SAVED_AT_KEY})
+
+    def load(self):
+        data = super().load()
+        self.loaded_state = self.state(data)
+        return data
+
+    def unchanged(self):
+        if self.session_key is None or self.loaded_state is None:
+            return False
+        age = time.time() - self._session.get(SAVED_AT_KEY, 0)
+        return age < self.get_expiry_age() / 2 and self.state(self._session) == self.loaded_state
+
+    def save(self, must_create=False):
+        if not must_create and self.unchanged():
+            return
+        self._session[SAVED_AT_KEY] = int(time.time())
+        super().save(must_create=must_create)
+        self.loaded_state = self.state(self._session)
@@ -139,11 +139,17 @@ JAZZMIN_UI_TWEAKS = {
 }
 
 MIDDLEWARE = [
+    # Request id / user id for log records (ecommerce_project/logconfig.py)
+    'ecommerce_project.logconfig.RequestContextMiddleware',
+    # Early, so its timings cover the rest of the stack (store/instrumentation.py)
+    'store.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # ?profile=1 / X-Profile: 1 from staff (store/profiling.py); needs request.user
+    'store.profiling.RequestProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -152,7 +158,8 @@ ROOT_URLCONF = 'ecommerce_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render time to the request metrics
+        'BACKEND': 'store.instrumentation.InstrumentedTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -172,11 +179,116 @@ WSGI_APPLICATION = 'ecommerce_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Pragmas run on every new SQLite connection. WAL lets readers proceed
+# while a write is in progress; busy_timeout makes writers queue for the
+# lock instead of failing with "database is locked". WAL is persistent: it
+# marks the database file and keeps -wal/-shm files beside it (git-ignored).
+# "python manage.py benchmark_sqlite" compares these against the defaults.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000')),
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -32000,  # negative = KiB, i.e. ~32 MB of page cache
+    'temp_store': 'MEMORY',
+}
+
+SQLITE_OPTIONS = {
+    'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+    # Take the write lock at BEGIN so atomic() blocks wait on busy_timeout
+    # instead of failing when a read lock cannot be upgraded
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': SQLITE_OPTIONS,
+    },
+    # Sessions, cart items and verification codes (see db_routers.py);
+    # create it with "python manage.py migrate --database churn"
+    'churn': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'churn.sqlite3',
+        'OPTIONS': SQLITE_OPTIONS,
+    },
+}
+
+DATABASE_ROUTERS = ['ecommerce_project.db_routers.ChurnRouter']
+
+# Sessions are read from the "sessions" cache and written through to the
+# churn database only when their data changes (ecommerce_project/sessions.py).
+# Expired rows are deleted by the scheduled clearsessions command only.
+# django.contrib.sessions.backends.signed_cookies keeps them client-side instead.
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'ecommerce_project.sessions')
+SESSION_CACHE_ALIAS = 'sessions'
+
+# "default" is a per-worker LRU (MAX_ENTRIES) in front of the "shared"
+# file cache, which all workers on the host see; see cache_backends.py.
+# File caches cull down by 1/CULL_FREQUENCY once past MAX_ENTRIES, checked
+# at most every CULL_INTERVAL seconds per worker (each check lists the directory)
+CACHES = {
+    'default': {
+        'BACKEND': 'ecommerce_project.cache_backends.TwoLevelCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'MAX_ENTRIES': 500,
+            'LOCAL_TIMEOUT': 5,  # seconds a worker may serve a key deleted elsewhere
+            'JITTER': 0.1,  # timeouts are shortened by up to 10%
+            'LOCK_TIMEOUT': 10,  # longest wait for another worker's get_or_set()
+        },
+    },
+    'shared': {
+        'BACKEND': 'ecommerce_project.cache_backends.FileCache',
+        'LOCATION': BASE_DIR / '.cache' / 'shared',
+        'OPTIONS': {'MAX_ENTRIES': 20000, 'CULL_FREQUENCY': 4, 'CULL_INTERVAL': 60},
+    },
+    # No per-worker layer: a session saved by one worker must never be
+    # served stale by another
+    'sessions': {
+        'BACKEND': 'ecommerce_project.cache_backends.FileCache',
+        'LOCATION': BASE_DIR / '.cache' / 'sessions',
+        'OPTIONS': {'MAX_ENTRIES': 10000, 'CULL_FREQUENCY': 4, 'CULL_INTERVAL': 60},
+    },
+}
+
+
+# JSON lines with request_id/user_id/order_id, written by a background
+# thread (ecommerce_project/logconfig.py); LOG_FILE instead of stderr
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_context': {'()': 'ecommerce_project.logconfig.RequestContextFilter'},
+        'require_debug_false': {'()': 'django.utils.log.RequireDebugFalse'},
+    },
+    'handlers': {
+        'json': {
+            '()': 'ecommerce_project.logconfig.BackgroundHandler',
+            'filename': os.getenv('LOG_FILE') or None,
+            'filters': ['request_context'],
+        },
+        # Django's own: emails ADMINS about server errors when DEBUG is off
+        'mail_admins': {
+            'class': 'django.utils.log.AdminEmailHandler',
+            'level': 'ERROR',
+            'filters': ['require_debug_false'],
+        },
+    },
+    'root': {
+        'handlers': ['json'],
+        'level': os.getenv('LOG_LEVEL', 'INFO'),
+    },
+    'loggers': {
+        # Replaces Django's console/mail_admins handlers; records reach root
+        'django': {'level': 'INFO'},
+        # ...but keeps the 500 emails to ADMINS (records still reach root too)
+        'django.request': {'handlers': ['mail_admins']},
+        # One line per request from store.instrumentation; WARNING shows only over-budget ones
+        'store.requests': {'level': os.getenv('REQUEST_LOG_LEVEL', 'INFO')},
+    },
 }
 
 
@@ -218,6 +330,82 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# collectstatic writes content-hashed names plus precompressed .gz siblings,
+# so assets can be cached forever and served without on-the-fly compression.
+# With DEBUG off, pages 500 until collectstatic has written the manifest.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'store.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Page-type CSS bundles, built from store/static/store/css/pages/ with
+# "python manage.py build_css" (re-run after editing any page stylesheet)
+CSS_BUNDLES = {
+    'store/css/bundles/catalogue.min.css': ['store/css/pages/catalogue.css'],
+    'store/css/bundles/category_legacy.min.css': ['store/css/pages/category_legacy.css'],
+    'store/css/bundles/cart.min.css': ['store/css/pages/cart.css'],
+    'store/css/bundles/invoice.min.css': ['store/css/pages/invoice.css'],
+}
+
+# Anonymous storefront page cache (seconds); 0 disables it.
+# Entries are keyed on the catalogue version, so edits invalidate them early.
+STORE_PAGE_CACHE_TIMEOUT = int(os.getenv('STORE_PAGE_CACHE_TIMEOUT', '300'))
+
+# Cache-Control for the anonymous variant of storefront pages. Browsers
+# revalidate with the ETag; shared caches keep pages until a surrogate-key
+# purge (see store/purging.py) or s-maxage, whichever comes first.
+STORE_CACHE_POLICIES = {
+    'listing': {'max_age': 0, 'must_revalidate': True, 's_maxage': 600},
+    'product': {'max_age': 60, 's_maxage': 3600},
+}
+
+# Receives surrogate-key purges: store.purging.LoggingPurger, or
+# store.purging.HttpPurger to POST them to STORE_CACHE_PURGE_URL
+STORE_CACHE_PURGER = os.getenv('STORE_CACHE_PURGER', 'store.purging.LoggingPurger')
+STORE_CACHE_PURGE_URL = os.getenv('STORE_CACHE_PURGE_URL', 'http://127.0.0.1:6081/purge')
+
+# Product card fragments are keyed on (id, updated_at) and can live long
+STORE_FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Filter listings against an in-memory copy of the catalogue columns held
+# by each worker (reloaded when the catalogue changes) instead of SQLite
+STORE_CATALOGUE_SNAPSHOT = os.getenv('STORE_CATALOGUE_SNAPSHOT', 'False') == 'True'
+
+# Seconds between flushes of each worker's buffered product view counts
+STORE_VIEW_FLUSH_INTERVAL = 30
+
+# Seconds per view-count epoch; the "Most Viewed" listing is re-validated once per epoch
+STORE_VIEW_COUNT_EPOCH = 300
+
+# Listing facet counts; keyed on the catalogue version like the page cache
+STORE_FACET_CACHE_TIMEOUT = 60 * 60
+
+# Per-request limits by URL name, then by namespace, then 'default';
+# requests over either limit are logged as warnings by store.instrumentation
+STORE_REQUEST_BUDGETS = {
+    'default': {'queries': 20, 'ms': 300},
+    'store:category': {'queries': 15, 'ms': 400},
+    'payment:process_payment': {'queries': 60, 'ms': 3000},
+    'admin:store_financialreport_changelist': {'queries': 40, 'ms': 1000},
+    'admin': {'queries': 50, 'ms': 1000},
+}
+
+# Prometheus metrics at /metrics/ (store/metrics.py). Workers sharing
+# STORE_METRICS_DIR report combined totals; unset, each reports its own.
+STORE_METRICS_DIR = os.getenv('STORE_METRICS_DIR', str(BASE_DIR / '.metrics'))
+STORE_METRICS_FLUSH_INTERVAL = 10
+# Scrapers without a staff login send "Authorization: Bearer <token>";
+# unset, only staff can read /metrics/
+STORE_METRICS_TOKEN = os.getenv('STORE_METRICS_TOKEN', '')
+
+# Where staff-triggered request profiles are written, and how many are kept
+STORE_PROFILE_DIR = BASE_DIR / 'profiles'
+STORE_PROFILE_KEEP = 50
+
 # Media files (User uploads)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -14,3 +14,16 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce_project.settings')
 
 application = get_wsgi_application()
+
+# Build the in-memory search index (and the catalogue snapshot, when
+# enabled) now rather than on the first request
+from django.db import DatabaseError
+from store.caching import catalogue_version
+from store.search import catalogue_index
+from store.snapshot import catalogue_snapshot
+
+try:
+    catalogue_index.ensure_fresh()
+    catalogue_snapshot.current(catalogue_version()[0])
+except DatabaseError:
+    pass  # Not migrated yet; the index builds lazily on first use
@@ -5,14 +5,21 @@ from django.contrib import messages
 from django.conf import settings
 from .forms import CheckoutForm
 from store.models import CartItem, Order, OrderItem, Product, SiteSettings
+from store.purging import purge_products
+from store.metrics import emails_sent, gateway_session_duration, orders_placed
 from django.views.decorators.csrf import csrf_exempt
 from django.db.models import F
-from django.db import transaction
+from django.db import router, transaction
+import logging
+import time
+from ecommerce_project.logconfig import bind
+
+logger = logging.getLogger(__name__)
 
 @login_required
 def checkout(request):
     """Collection shipping address"""
-    cart_items = CartItem.objects.filter(user=request.user)
+    cart_items = CartItem.objects.filter(user=request.user).prefetch_related('product')
     
     if not cart_items.exists():
         messages.error(request, 'Your cart is empty')
@@ -44,7 +51,7 @@ def checkout(request):
 @login_required
 def payment_selection(request):
     """Render payment selection page"""
-    cart_items = CartItem.objects.filter(user=request.user)
+    cart_items = CartItem.objects.filter(user=request.user).prefetch_related('product')
     
     if not cart_items.exists():
         return redirect('store:cart')
@@ -59,8 +66,9 @@ def payment_selection(request):
 def send_order_confirmation_email(request, order, recipient_email=None):
     """Send detailed order confirmation email"""
     items_list = ""
-    for item in order.items.all():
-        items_list += f"- {item.product.name} x {item.quantity}: Tk {item.price}\n"
+    for item in order.items.select_related('product'):
+        product_url = request.build_absolute_uri(item.product.get_absolute_url())
+        items_list += f"- {item.product.name} x {item.quantity}: Tk {item.price}\n  {product_url}\n"
     
     # Needs update when urls are fixed
     invoice_url = request.build_absolute_uri(reverse('accounts:customer_order_invoice', args=[order.id]))
@@ -111,7 +119,7 @@ Thank you for shopping with RB Trading!
             )
             from_email = site_settings.email_host_user
     except Exception as e:
-        print(f"Using default email settings. Dynamic config error: {e}")
+        logger.warning('Using default email settings; SiteSettings lookup failed: %s', e)
 
     try:
         send_mail(
@@ -122,9 +130,11 @@ Thank you for shopping with RB Trading!
             connection=connection, # Use custom connection if available
             fail_silently=False,
         )
-        print(f"SUCCESS: Email sent to {recipient_email or request.user.email}")
+        logger.info('Order confirmation email sent', extra={'order_id': order.id})
+        emails_sent.inc(kind='order_confirmation', outcome='sent')
     except Exception as e:
-        print(f"FAILURE: Email sending failed: {e}")
+        logger.exception('Order confirmation email failed', extra={'order_id': order.id})
+        emails_sent.inc(kind='order_confirmation', outcome='failed')
 
 @login_required
 def process_payment(request):
@@ -133,7 +143,7 @@ def process_payment(request):
         return redirect('payment:checkout')
         
     payment_method = request.POST.get('payment_method')
-    cart_items = CartItem.objects.filter(user=request.user)
+    cart_items = CartItem.objects.filter(user=request.user).prefetch_related('product')
     
     if not cart_items.exists():
         return redirect('store:cart')
@@ -149,35 +159,49 @@ def process_payment(request):
 
     # Create order
     shipping_address = request.session.get('shipping_address', 'Address not provided')
+    ordered_items = [cart_item.pk for cart_item in cart_items]
     
-    order = Order.objects.create(
-        user=request.user,
-        total=total,
-        shipping_address=shipping_address,
-        status='pending',
-        payment_status='pending'
-    )
-    
-    # Create order items and decrement stock atomically
-    for cart_item in cart_items:
-        # Atomic Stock Decrement
-        Product.objects.filter(id=cart_item.product.id).update(stock=F('stock') - cart_item.quantity)
-        
-        OrderItem.objects.create(
-            order=order,
-            product=cart_item.product,
-            quantity=cart_item.quantity,
-            price=cart_item.product.discounted_price,
-            purchase_price=cart_item.product.purchase_price
+    # The cart lives in the churn database and cannot share the order's
+    # transaction, so its transaction wraps the order's: a failed order rolls
+    # both back and leaves the cart for a retry, and the cart delete (which
+    # already holds the churn write lock) commits right after the order.
+    # Only the ordered rows are removed, never items added meanwhile.
+    with transaction.atomic(using=router.db_for_write(CartItem)), transaction.atomic():
+        order = Order.objects.create(
+            user=request.user,
+            total=total,
+            shipping_address=shipping_address,
+            status='pending',
+            payment_status='pending'
         )
+        bind(order_id=order.id)
         
-    if payment_method == 'cod':
-        # Handle Cash on Delivery
-        order.payment_intent_id = 'COD'
-        order.save()
+        # Create order items and decrement stock atomically
+        for cart_item in cart_items:
+            # Atomic Stock Decrement
+            # updated_at and the catalogue version stay: stock is only shown
+            # on the product's own page, whose ETag includes it
+            Product.objects.filter(id=cart_item.product.id).update(stock=F('stock') - cart_item.quantity)
+            purge_products([cart_item.product.id])
+            
+            OrderItem.objects.create(
+                order=order,
+                product=cart_item.product,
+                quantity=cart_item.quantity,
+                price=cart_item.product.discounted_price,
+                purchase_price=cart_item.product.purchase_price
+            )
         
-        # Clear cart
-        cart_items.delete()
+        if payment_method == 'cod':
+            # Handle Cash on Delivery
+            order.payment_intent_id = 'COD'
+            order.save()
+            
+            # Clear cart
+            CartItem.objects.filter(pk__in=ordered_items).delete()
+        
+    if payment_method == 'cod':
+        orders_placed.inc(payment_method='cod')
         
         # Send confirmation email
         order_email = request.session.get('order_email')
@@ -233,8 +257,11 @@ def process_payment(request):
             'product_profile': 'general',
         }
         
+        started = time.perf_counter()
         try:
             response = sslcz.createSession(post_body)
+            outcome = 'success' if response.get('status') == 'SUCCESS' else 'failed'
+            gateway_session_duration.observe(time.perf_counter() - started, gateway='sslcommerz', outcome=outcome)
             
             if response.get('status') == 'SUCCESS':
                 # Save transaction ID
@@ -243,11 +270,14 @@ def process_payment(request):
                 
                 return redirect(response['GatewayPageURL'])
             else:
+                logger.warning('SSLCommerz session failed: %s', response.get('failedreason'))
                 messages.error(request, f"Payment gateway error: {response.get('failedreason', 'Unknown error')}")
                 order.delete()
                 return redirect('store:cart')
                 
         except Exception as e:
+            gateway_session_duration.observe(time.perf_counter() - started, gateway='sslcommerz', outcome='error')
+            logger.exception('SSLCommerz session could not be created')
             messages.error(request, f'Error creating payment session: {str(e)}')
             order.delete()
             return redirect('store:cart')
@@ -318,15 +348,19 @@ def sslcommerz_success(request):
             order_id = int(tran_id.split('-')[1])
             order = Order.objects.get(id=order_id, payment_intent_id=tran_id)
         except (ValueError, IndexError, Order.DoesNotExist):
+            logger.warning('SSLCommerz success callback for unknown transaction %s', tran_id)
             messages.error(request, 'Order not found')
             return redirect('store:cart')
+        bind(order_id=order.id)
         
         # Check payment status from SSLCommerz POST data
         # SSLCommerz sends VALID or VALIDATED for successful payments
         payment_status = request.POST.get('status', '')
         
         if payment_status in ['VALID', 'VALIDATED']:
-            # Payment successful
+            # Payment successful; a repeated callback must not count the order twice
+            if order.payment_status != 'paid':
+                orders_placed.inc(payment_method='sslcommerz')
             order.payment_status = 'paid'
             order.status = 'processing'
             order.save()
@@ -339,6 +373,7 @@ def sslcommerz_success(request):
             
             return redirect(f"{reverse('payment:payment_success')}?order_id={order.id}")
         else:
+            logger.warning('SSLCommerz payment not valid: status %s', payment_status)
             messages.error(request, 'Payment validation failed')
             order.delete()
             return redirect('store:cart')
@@ -1,14 +1,18 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
-from .models import Category, Product, CartItem, Order, OrderItem, SiteSettings, Brand, FinancialReport, AccountingEntry
+from .models import Category, CatalogueVersion, Product, CartItem, Order, OrderItem, SiteSettings, Brand, FinancialReport, AccountingEntry, RelatedProduct, SalesRank, RequestProfile
 from django.utils.safestring import mark_safe
-from django.db.models import Sum, F
-from django.db.models.functions import TruncDate
+from django.db import transaction
+from django.db.models import Sum, F, Q
+from django.contrib.auth.models import User
+from django.db.models.functions import Round, TruncDate
 import json
 from django.core.serializers.json import DjangoJSONEncoder
 import datetime
 from django.utils import timezone
+from decimal import Decimal
+from .purging import LISTING_KEY, product_key, purge_keys
 
 @admin.register(Brand)
 class BrandAdmin(admin.ModelAdmin):
@@ -44,7 +48,7 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['image_preview', 'name', 'category', 'brand', 'price', 'discounted_price_display', 'stock_status', 'available', 'featured', 'created_at']
+    list_display = ['image_preview', 'name', 'category', 'brand', 'price', 'discounted_price_display', 'stock_status', 'available', 'featured', 'view_count', 'created_at']
     list_filter = ['available', 'featured', 'category', 'brand', 'created_at']
     list_editable = ['price', 'available', 'featured']
     prepopulated_fields = {'slug': ('name',)}
@@ -85,27 +89,49 @@ class ProductAdmin(admin.ModelAdmin):
         )
     stock_status.short_description = "Stock Status"
 
+    def update_and_purge(self, queryset, **changes):
+        """Bulk update (no model signals fire), then bump the catalogue version and purge the affected pages ourselves."""
+        product_ids = list(queryset.values_list('id', flat=True))
+        with transaction.atomic():
+            queryset.update(updated_at=timezone.now(), **changes)
+            CatalogueVersion.bump()
+        purge_keys([LISTING_KEY, *(product_key(product_id) for product_id in product_ids)])
+
     @admin.action(description='Mark selected products as unavailable')
     def make_unavailable(self, request, queryset):
-        queryset.update(available=False)
+        self.update_and_purge(queryset, available=False)
 
     @admin.action(description='Mark selected products as available')
     def make_available(self, request, queryset):
-        queryset.update(available=True)
+        self.update_and_purge(queryset, available=True)
 
     @admin.action(description='Apply 10%% discount to selected products')
     def apply_10_percent_discount(self, request, queryset):
-        queryset.update(discount_percentage=10)
+        # Rounded in SQL the way Product.save() rounds it (half up, 2 places)
+        self.update_and_purge(queryset, discount_percentage=10, effective_price=Round(F('price') * Decimal('0.90'), 2))
 
     @admin.action(description='Remove discount from selected products')
     def remove_discount(self, request, queryset):
-        queryset.update(discount_percentage=0)
+        self.update_and_purge(queryset, discount_percentage=0, effective_price=F('price'))
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ['user', 'product', 'quantity', 'subtotal_display', 'created_at']
     list_filter = ['created_at']
     search_fields = ['user__username', 'product__name']
+    # Cart items are in the churn database, so users/products cannot be joined in
+    list_select_related = ()
+    raw_id_fields = ['user', 'product']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('user', 'product')
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        user_ids = list(User.objects.filter(username__icontains=search_term).values_list('id', flat=True))
+        product_ids = list(Product.objects.filter(name__icontains=search_term).values_list('id', flat=True))
+        return queryset.filter(Q(user_id__in=user_ids) | Q(product_id__in=product_ids)), False
     
     def subtotal_display(self, obj):
         return f"Tk {obj.subtotal}"
@@ -299,3 +325,59 @@ class OrderItemAdmin(admin.ModelAdmin):
     list_display = ['order', 'product', 'quantity', 'price']
     list_filter = ['order__created_at']
     search_fields = ['product__name', 'order__id']
+
+@admin.register(RelatedProduct)
+class RelatedProductAdmin(admin.ModelAdmin):
+    list_display = ['product', 'rank', 'related', 'score']
+    search_fields = ['product__name', 'related__name']
+    raw_id_fields = ['product', 'related']
+
+@admin.register(SalesRank)
+class SalesRankAdmin(admin.ModelAdmin):
+    list_display = ['rank', 'product', 'category', 'window_days', 'units', 'computed_at']
+    list_filter = ['window_days', 'category']
+    search_fields = ['product__name']
+    raw_id_fields = ['product']
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """Profiles captured with ?profile=1 or X-Profile: 1 (store/profiling.py)"""
+    list_display = ['created_at', 'method', 'path', 'status_code', 'duration_ms', 'queries', 'user']
+    list_filter = ['method', 'status_code']
+    search_fields = ['path']
+    readonly_fields = ['method', 'path', 'user', 'status_code', 'duration_ms', 'queries', 'created_at', 'download', 'summary_display']
+    exclude = ['filename', 'summary']
+
+    def get_urls(self):
+        from django.urls import path
+        custom_urls = [
+            path('<int:profile_id>/download/', self.admin_site.admin_view(self.download_view), name='store_requestprofile_download'),
+        ]
+        return custom_urls + super().get_urls()
+
+    def download_view(self, request, profile_id):
+        from django.http import FileResponse, Http404
+        from .profiling import profile_paths
+
+        profile = self.get_object(request, str(profile_id))
+        if profile is None or not self.has_view_permission(request, profile):
+            raise Http404
+        prof_path, _ = profile_paths(profile.filename)
+        if not prof_path.exists():
+            raise Http404('Profile file was rotated away')
+        return FileResponse(prof_path.open('rb'), as_attachment=True, filename=prof_path.name)
+
+    def download(self, obj):
+        url = reverse('admin:store_requestprofile_download', args=[obj.id])
+        return format_html('<a href="{}">{}.prof</a>', url, obj.filename)
+    download.short_description = "cProfile data"
+
+    def summary_display(self, obj):
+        return format_html('<pre style="font-size: 12px; white-space: pre;">{}</pre>', obj.summary)
+    summary_display.short_description = "Top frames"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,119 @@
+"""
+Best-seller ranks, materialized from order history.
+
+One aggregated query sums OrderItem quantities per product for every
+rolling window at once (conditional SUMs over the longest window). Ranks
+are then cut store-wide and per category and written to SalesRank. The
+sort window's totals are also copied onto Product.units_sold for the
+"Best Selling" listing sort. Pages read both back with plain indexed
+queries, so nothing is aggregated at request time.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .models import CatalogueVersion, OrderItem, Product, SalesRank
+from .purging import LISTING_KEY, purge_keys
+
+# Rolling windows in days; 0 means all time
+WINDOWS = (7, 30, 90, 0)
+# Window behind Product.units_sold and the homepage best sellers
+SORT_WINDOW = 30
+# Ranks kept per (scope, window)
+TOP_N = 100
+
+
+def counted_items():
+    """Items on orders that were paid for, or delivered (cash on delivery), and not cancelled."""
+    return OrderItem.objects.filter(
+        Q(order__payment_status='paid') | Q(order__status='delivered')
+    ).exclude(order__status='cancelled')
+
+
+def aggregate_units(now=None):
+    """{window_days: {(product_id, category_id): units}} in one GROUP BY query."""
+    now = now or timezone.now()
+    sums = {
+        f'w{days}': Sum('quantity', filter=Q(order__created_at__gte=now - timedelta(days=days)) if days else None)
+        for days in WINDOWS
+    }
+    rows = (
+        counted_items()
+        .order_by()
+        .values('product_id', 'product__category_id')
+        .annotate(**sums)
+    )
+    units = {days: {} for days in WINDOWS}
+    for row in rows:
+        key = (row['product_id'], row['product__category_id'])
+        for days in WINDOWS:
+            total = row[f'w{days}']
+            if total:
+                units[days][key] = total
+    return units
+
+
+def rank(totals):
+    """[(product_id, units, rank)] best first; ties broken by product id."""
+    ordered = sorted(totals.items(), key=lambda item: (-item[1], item[0]))[:TOP_N]
+    return [(product_id, units, position) for position, (product_id, units) in enumerate(ordered, start=1)]
+
+
+def refresh_sales_ranks(now=None, purge=True):
+    """
+    Recompute every ranking and the units_sold sort column; returns row counts.
+    ``purge=False`` leaves proxy purges to the caller.
+    """
+    units = aggregate_units(now)
+    ranks = []
+    for days, totals in units.items():
+        overall = {product_id: total for (product_id, _), total in totals.items()}
+        ranks.extend(
+            SalesRank(product_id=product_id, category=None, window_days=days, units=total, rank=position)
+            for product_id, total, position in rank(overall)
+        )
+        by_category = defaultdict(dict)
+        for (product_id, category_id), total in totals.items():
+            by_category[category_id][product_id] = total
+        for category_id, category_totals in by_category.items():
+            ranks.extend(
+                SalesRank(product_id=product_id, category_id=category_id, window_days=days, units=total, rank=position)
+                for product_id, total, position in rank(category_totals)
+            )
+
+    sold = {product_id: total for (product_id, _), total in units[SORT_WINDOW].items()}
+    fields = ('product_id', 'category_id', 'window_days', 'units', 'rank')
+    with transaction.atomic():
+        previous = set(SalesRank.objects.values_list(*fields))
+        SalesRank.objects.all().delete()
+        SalesRank.objects.bulk_create(ranks, batch_size=1000)
+
+        # Only touch rows whose count moved. updated_at stays: sales do
+        # not change a product's page, only listings, which follow the
+        # ranks counter bumped below
+        changed = [
+            Product(id=product_id, units_sold=sold.get(product_id, 0))
+            for product_id, current in Product.objects.values_list('id', 'units_sold').iterator()
+            if current != sold.get(product_id, 0)
+        ]
+        Product.objects.bulk_update(changed, ['units_sold'], batch_size=500)
+        if changed or previous != {tuple(getattr(entry, field) for field in fields) for entry in ranks}:
+            CatalogueVersion.bump(catalogue=False, ranks=True)
+            if purge:
+                purge_keys([LISTING_KEY])
+
+    return {'ranks': len(ranks), 'products_updated': len(changed)}
+
+
+def best_sellers(category=None, window_days=SORT_WINDOW, limit=8):
+    """Top-ranked available products for a scope, in one indexed query."""
+    ranks = (
+        SalesRank.objects
+        .filter(category=category, window_days=window_days, product__available=True)
+        .select_related('product__brand', 'product__category')
+        .order_by('rank')[:limit]
+    )
+    return [entry.product for entry in ranks]
@@ -0,0 +1,230 @@
+import hashlib
+import threading
+from collections import Counter
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db.models import Subquery
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.http import http_date
+
+from .metrics import cache_lookups
+from .models import CatalogueVersion, Product
+from .sorting import get_sort
+from .viewcounts import view_epoch
+
+# Query parameters that never change the rendered page
+IGNORED_QUERY_PARAMS = {'fbclid', 'gclid', 'msclkid', 'ref'}
+
+_stats_lock = threading.Lock()
+page_cache_stats = Counter()
+
+
+def record_page_cache(event):
+    with _stats_lock:
+        page_cache_stats[event] += 1
+    cache_lookups.inc(cache='page', result=event)
+
+
+def get_page_cache_stats():
+    """Per-process page cache counters plus the derived hit ratio."""
+    with _stats_lock:
+        stats = dict(page_cache_stats)
+    lookups = stats.get('hit', 0) + stats.get('miss', 0)
+    stats['hit_ratio'] = round(stats.get('hit', 0) / lookups, 4) if lookups else 0.0
+    return stats
+
+
+def stamp(moment):
+    return f'{int(moment.timestamp() * 1000000):x}' if moment else '0'
+
+
+def catalogue_version():
+    """
+    Catalogue-wide version for listing pages, as ``(version, last_modified,
+    taxonomy_version)``.
+
+    One primary-key lookup of the CatalogueVersion row, whose counters are
+    bumped by the writes that change pages (see store.signals), so nothing
+    is aggregated per request. Categories and brands bump the catalogue
+    counter as well as the taxonomy one.
+    """
+    row = (
+        CatalogueVersion.objects.filter(pk=CatalogueVersion.SINGLETON_ID)
+        .values_list('catalogue', 'ranks', 'taxonomy', 'modified').first()
+    )
+    catalogue, ranks, taxonomy, modified = row or (0, 0, 0, None)
+    return f'{catalogue}.{ranks}', modified, str(taxonomy)
+
+
+def request_taxonomy_version(request):
+    """Taxonomy counter, read at most once per request."""
+    if request is None:
+        return catalogue_version()[2]
+    if not hasattr(request, 'taxonomy_version'):
+        request_catalogue_version(request)
+    return request.taxonomy_version
+
+
+def request_catalogue_version(request):
+    """catalogue_version() string, computed at most once per request."""
+    if not hasattr(request, 'catalogue_version'):
+        request.catalogue_version, _, request.taxonomy_version = catalogue_version()
+    return request.catalogue_version
+
+
+def is_conditional_candidate(request):
+    """
+    Only anonymous GET/HEAD requests with no pending flash messages get
+    validators or cached pages: logged-in pages carry per-user state (cart
+    count, nav links) that the catalogue version knows nothing about.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if request.user.is_authenticated:
+        return False
+    return not len(messages.get_messages(request))
+
+
+def normalized_query_string(request):
+    """Sorted query string without blank values or tracking parameters."""
+    items = []
+    for key, values in request.GET.lists():
+        if key in IGNORED_QUERY_PARAMS or key.startswith('utm_'):
+            continue
+        items.extend((key, value) for value in values if value != '')
+    return urlencode(sorted(items))
+
+
+def page_cache_key(request, etag):
+    raw = f'{request.path}?{normalized_query_string(request)}'
+    digest = hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+    return f'store:page:v2:{etag}:{digest}'
+
+
+def is_response_cacheable(request, response):
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return False
+    # A rendered {% csrf_token %} needs the matching cookie set per visitor
+    if request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+        return False
+    return 'private' not in response.get('Cache-Control', '')
+
+
+def conditional_page(validator, policy):
+    """
+    Like django.views.decorators.http.condition, but ``validator(request,
+    *args, **kwargs)`` returns ``(etag, last_modified)`` in a single call, so
+    both headers come from the same query. A ``None`` ETag means "no
+    validators": the view runs normally.
+
+    When settings.STORE_PAGE_CACHE_TIMEOUT is set, rendered pages are also
+    kept in the cache, keyed on path, normalized query string and the ETag,
+    so any change that moves the validator also invalidates the page.
+
+    ``policy`` names an entry of settings.STORE_CACHE_POLICIES, the
+    Cache-Control directives for the public (anonymous) variant of the
+    page; that variant also gets a Surrogate-Key header (see
+    store.purging). Everyone else gets ``Cache-Control: private``.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if not is_conditional_candidate(request):
+                record_page_cache('bypass')
+                response = view_func(request, *args, **kwargs)
+                patch_cache_control(response, private=True)
+                return response
+
+            etag, last_modified = validator(request, *args, **kwargs)
+            if etag is None:
+                return view_func(request, *args, **kwargs)
+
+            etag = quote_etag(etag)
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = cached_view_response(view_func, request, etag, *args, **kwargs)
+
+            if response.status_code in (200, 304):
+                if timestamp and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(timestamp)
+                if not response.has_header('ETag'):
+                    response.headers['ETag'] = etag
+                patch_cache_control(response, public=True, **settings.STORE_CACHE_POLICIES[policy])
+                keys = getattr(request, 'surrogate_keys', None)
+                if keys and not response.has_header('Surrogate-Key'):
+                    response.headers['Surrogate-Key'] = ' '.join(sorted(keys))
+            return response
+        return _wrapped_view
+    return decorator
+
+
+def cached_view_response(view_func, request, etag, *args, **kwargs):
+    timeout = getattr(settings, 'STORE_PAGE_CACHE_TIMEOUT', 0)
+    if not timeout:
+        return view_func(request, *args, **kwargs)
+
+    key = page_cache_key(request, etag)
+    cached = cache.get(key)
+    if cached is not None:
+        record_page_cache('hit')
+        content, content_type, surrogate_key = cached
+        response = HttpResponse(content, content_type=content_type)
+        if surrogate_key:
+            response.headers['Surrogate-Key'] = surrogate_key
+        return response
+
+    record_page_cache('miss')
+    response = view_func(request, *args, **kwargs)
+    if is_response_cacheable(request, response):
+        surrogate_key = ' '.join(sorted(getattr(request, 'surrogate_keys', ())))
+        cache.set(key, (response.content, response['Content-Type'], surrogate_key), timeout)
+        record_page_cache('store')
+    return response
+
+
+def listing_validator(request, *args, **kwargs):
+    """
+    The catalogue version; the "Most Viewed" sort also moves with the
+    view-count epoch, since flushed views do not touch the catalogue.
+    """
+    version, last_modified, request.taxonomy_version = catalogue_version()
+    request.catalogue_version = version
+    etag = f'catalogue-{version}'
+    if get_sort(request) == 'popular':
+        epoch, started = view_epoch()
+        etag = f'{etag}-views{epoch}'
+        last_modified = started if last_modified is None else max(last_modified, started)
+    return etag, last_modified
+
+
+def product_validator(request, slug, *args, **kwargs):
+    """
+    Covers what the product page shows, in one query on the slug index:
+    the product row and its stock, the related list (related_version is
+    bumped when RelatedProduct is rewritten) and the catalogue counter,
+    which moves when a related card's product or the taxonomy changes.
+
+    No Last-Modified: stock and related-list changes do not move a
+    timestamp, so only the ETag can validate the page.
+    """
+    version = CatalogueVersion.objects.filter(pk=CatalogueVersion.SINGLETON_ID)
+    row = (
+        Product.objects.filter(slug=slug, available=True)
+        .annotate(
+            catalogue=Subquery(version.values('catalogue')),
+            taxonomy=Subquery(version.values('taxonomy')),
+        )
+        .values_list('id', 'updated_at', 'stock', 'related_version', 'catalogue', 'taxonomy')
+        .first()
+    )
+    if row is None:
+        return None, None
+    product_id, updated_at, stock, related_version, catalogue, taxonomy = row
+    request.taxonomy_version = str(taxonomy or 0)
+    return f'product-{product_id}-{stamp(updated_at)}-{stock}-{related_version}-{catalogue or 0}', None
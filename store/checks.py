@@ -0,0 +1,70 @@
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestFilesMixin, staticfiles_storage
+from django.core.checks import Error, Tags, register
+from django.template.utils import get_app_template_dirs
+
+STATIC_TAG_RE = re.compile(r"""{%\s*static\s+(['"])(?P<path>[^'"]+)\1""")
+
+
+def iter_template_files():
+    """Yield the project's own template files (third-party apps are skipped)."""
+    base_dir = Path(settings.BASE_DIR).resolve()
+    dirs = []
+    for engine in settings.TEMPLATES:
+        dirs.extend(Path(d) for d in engine.get('DIRS', []))
+    dirs.extend(Path(d) for d in get_app_template_dirs('templates'))
+
+    seen = set()
+    for directory in dirs:
+        directory = directory.resolve()
+        if not directory.is_dir() or not directory.is_relative_to(base_dir):
+            continue
+        for path in directory.rglob('*.html'):
+            if path not in seen:
+                seen.add(path)
+                yield path
+
+
+def find_static_references():
+    """Return {asset_path: [template files]} for literal {% static %} tags."""
+    references = {}
+    for path in iter_template_files():
+        try:
+            source = path.read_text(encoding='utf-8')
+        except (OSError, UnicodeDecodeError):
+            continue
+        for match in STATIC_TAG_RE.finditer(source):
+            references.setdefault(match.group('path'), []).append(str(path))
+    return references
+
+
+@register(Tags.staticfiles, deploy=True)
+def check_static_manifest(app_configs, **kwargs):
+    """
+    Deploy check: every asset referenced from a template must be present in
+    the staticfiles manifest, otherwise {% static %} raises at render time
+    (or silently serves an un-hashed, un-cacheable URL).
+    """
+    if not isinstance(staticfiles_storage, ManifestFilesMixin):
+        return []
+
+    manifest = staticfiles_storage.hashed_files
+    if not manifest:
+        return [Error(
+            'Static files manifest is missing or empty.',
+            hint='Run "python manage.py collectstatic" before deploying.',
+            id='store.E001',
+        )]
+
+    errors = []
+    for asset, templates in sorted(find_static_references().items()):
+        if asset not in manifest:
+            errors.append(Error(
+                f"Template references static asset '{asset}' which is not in the manifest.",
+                hint=f"Referenced from: {', '.join(sorted(set(templates)))}",
+                id='store.E002',
+            ))
+    return errors
@@ -1,10 +1,22 @@
+from django.core.cache import cache
+
 from .models import Category, Brand
 
+# Dropped on any Category/Brand save or delete (see store/signals.py)
+NAV_CACHE_KEY = 'store:nav'
+NAV_CACHE_TIMEOUT = 60 * 60
+
+
+def nav_links():
+    return list(Category.objects.all()[:8]), list(Brand.objects.all()[:10])
+
+
 def global_store_data(request):
     """
     Makes categories and brands available to all templates
     """
+    nav_categories, nav_brands = cache.get_or_set(NAV_CACHE_KEY, nav_links, NAV_CACHE_TIMEOUT)
     return {
-        'nav_categories': Category.objects.all()[:8], # Limit to 8 for nav
-        'nav_brands': Brand.objects.all()[:10], # Limit to 10 for nav
+        'nav_categories': nav_categories, # Limit to 8 for nav
+        'nav_brands': nav_brands, # Limit to 10 for nav
     }
@@ -0,0 +1,334 @@
+"""
+Seeded synthetic datasets for load testing and benchmarks.
+
+DatasetGenerator builds brands, categories, products, users, carts, orders,
+order items and ledger entries. The same seed and sizes always give the
+same rows. Everything is written with bulk_create in batches of
+``batch_size`` orders, each batch in its own transaction, so memory stays
+flat. A million orders take minutes rather than hours.
+
+The distributions are skewed the way shop data is:
+
+- Product popularity, category and brand sizes, and orders per customer
+  follow Zipf-like weights.
+- Prices are log-normal around a per-category level.
+- Most products have no discount.
+- Order volume grows towards the present.
+- An order's status and payment depend on its age and on whether it was
+  cash on delivery or paid online.
+
+bulk_create skips save() and signals. The generator therefore fills in
+what those would have set: slugs, effective_price, timestamps, and the
+ledger entries that sync_order_to_ledger writes.
+"""
+import math
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .bestsellers import refresh_sales_ranks
+from .context_processors import NAV_CACHE_KEY
+from .invalidation import invalidate
+from .models import AccountingEntry, Brand, CartItem, CatalogueVersion, Category, Order, OrderItem, Product
+from .purging import LISTING_KEY, brand_key, category_key, purge_keys
+
+# (category, product lines, typical price in Tk)
+CATALOGUE = [
+    ('Smartphones', ('Phone', 'Phone Pro', 'Phone Lite'), 30000),
+    ('Tablets', ('Tab', 'Tab Plus'), 35000),
+    ('Laptops', ('Book', 'Book Air', 'Book Pro'), 90000),
+    ('Audio', ('Earbuds', 'Headphones', 'Neckband'), 3000),
+    ('Speakers', ('Speaker', 'Soundbar'), 6000),
+    ('Wearables', ('Watch', 'Band'), 5000),
+    ('Chargers & Cables', ('Charger', 'Cable', 'Power Bank'), 1200),
+    ('Cameras', ('Action Cam', 'Webcam', 'Dash Cam'), 12000),
+    ('Gaming', ('Controller', 'Headset', 'Keyboard'), 4500),
+    ('Home Appliances', ('Blender', 'Kettle', 'Air Fryer'), 7000),
+    ('Televisions', ('Smart TV', 'Monitor'), 45000),
+    ('Networking', ('Router', 'Mesh Wi-Fi', 'Range Extender'), 3500),
+]
+BRAND_NAMES = [
+    'Xiaomi', 'Samsung', 'Realme', 'Vivo', 'Oppo', 'OnePlus', 'Apple', 'Anker', 'Baseus', 'JBL', 'Sony',
+    'Lenovo', 'Asus', 'HP', 'Walton', 'Symphony', 'Infinix', 'Tecno', 'Huawei', 'Nokia', 'Philips',
+    'Haier', 'TP-Link', 'Logitech', 'Havit', 'Edifier', 'QCY', 'Amazfit', 'Ugreen', 'Redragon',
+]
+CITIES = ['Dhaka', 'Chattogram', 'Khulna', 'Rajshahi', 'Sylhet', 'Barishal', 'Rangpur', 'Mymensingh']
+CITY_WEIGHTS = [45, 18, 8, 8, 7, 5, 5, 4]
+
+# Discount percentages and how often products carry them
+DISCOUNTS = [0, 5, 10, 15, 20, 25, 30]
+DISCOUNT_WEIGHTS = [70, 8, 8, 5, 4, 3, 2]
+# Lines per order and units per line
+LINES_PER_ORDER = [1, 2, 3, 4, 5, 6]
+LINES_WEIGHTS = [50, 25, 12, 7, 4, 2]
+QUANTITIES = [1, 2, 3, 4]
+QUANTITY_WEIGHTS = [80, 13, 5, 2]
+# Share of orders paid online (SSLCommerz) rather than cash on delivery
+ONLINE_SHARE = 0.45
+
+
+def zipf_weights(count, exponent):
+    """Cumulative weights for ranks 1..count, for rng.choices(cum_weights=...)."""
+    return list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the auto_now/auto_now_add values set on the instances."""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class DatasetGenerator:
+    """
+    Fills an empty catalogue. Orders get explicit ids after the current
+    maximum, so the ledger can refer to them and to their transaction ids
+    without reading the rows back.
+    """
+
+    def __init__(self, rng, days=365, batch_size=5000, password=None, now=None, log=None):
+        self.rng = rng
+        self.days = days
+        self.batch_size = batch_size
+        # One hash for everyone; without a password the accounts cannot log in
+        self.password = make_password(password)
+        self.now = now or timezone.now()
+        self.start = self.now - timedelta(days=days)
+        self.log = log or (lambda message: None)
+        self.categories, self.brands, self.products, self.users = [], [], [], []
+
+    def moment(self, position):
+        """A time in the period; ``position`` 0..1 is the share of the period's volume before it."""
+        # Volume grows linearly, so the cumulative share is quadratic in time
+        return self.start + timedelta(days=self.days * math.sqrt(position))
+
+    def generate(self, brands=30, categories=12, products=5000, users=10000, carts=1000, orders=100000):
+        with explicit_timestamps(Category, Product, CartItem, Order):
+            self.make_categories(categories)
+            self.make_brands(brands)
+            self.make_products(products)
+            self.make_users(users)
+            self.make_carts(carts)
+            counts = self.make_orders(orders)
+        # The new products' pages were never cached: one version bump and
+        # one purge for the listings and taxonomy pages rather than a key
+        # per product
+        ranks = refresh_sales_ranks(purge=False)
+        CatalogueVersion.bump(taxonomy=True)
+        invalidate([NAV_CACHE_KEY])
+        purge_keys([
+            LISTING_KEY,
+            *(brand_key(brand.pk) for brand in self.brands),
+            *(category_key(category.pk) for category in self.categories),
+        ])
+        return {
+            'brands': len(self.brands), 'categories': len(self.categories), 'products': len(self.products),
+            'users': len(self.users), 'carts': carts, **counts, 'ranks': ranks['ranks'],
+        }
+
+    # -- catalogue ----------------------------------------------------------------
+
+    def make_categories(self, count):
+        rows = []
+        for i in range(count):
+            name, _, _ = CATALOGUE[i % len(CATALOGUE)]
+            if i >= len(CATALOGUE):
+                name = f'{name} {i // len(CATALOGUE) + 1}'
+            rows.append(Category(
+                name=name, slug=slugify(name), description=f'{name} from the brands we carry', created_at=self.start,
+            ))
+        self.categories = Category.objects.bulk_create(rows)
+        self.log(f'{count} categories')
+
+    def make_brands(self, count):
+        names = [
+            BRAND_NAMES[i % len(BRAND_NAMES)] + (f' {i // len(BRAND_NAMES) + 1}' if i >= len(BRAND_NAMES) else '')
+            for i in range(count)
+        ]
+        self.brands = Brand.objects.bulk_create(Brand(name=name, slug=slugify(name)) for name in names)
+        self.log(f'{count} brands')
+
+    def make_products(self, count):
+        rng = self.rng
+        category_weights = zipf_weights(len(self.categories), 0.8)
+        brand_weights = zipf_weights(len(self.brands), 1.0)
+        chosen_categories = rng.choices(range(len(self.categories)), cum_weights=category_weights, k=count)
+        chosen_brands = rng.choices(self.brands, cum_weights=brand_weights, k=count)
+        discounts = rng.choices(DISCOUNTS, weights=DISCOUNT_WEIGHTS, k=count)
+
+        rows = []
+        for i in range(count):
+            index = chosen_categories[i]
+            category = self.categories[index]
+            _, lines, typical_price = CATALOGUE[index % len(CATALOGUE)]
+            brand = chosen_brands[i]
+            name = f'{brand.name} {rng.choice(lines)} {rng.choice("ACGMSX")}{i + 1}'
+            price = Decimal(max(99, round(typical_price * rng.lognormvariate(0, 0.5), -1) - 1))
+            discount = Decimal(discounts[i])
+            created = self.moment(rng.random() * 0.9)
+            rows.append(Product(
+                name=name,
+                slug=slugify(name),
+                category=category,
+                brand=brand,
+                description=f'{name} by {brand.name}. Official warranty, delivered anywhere in Bangladesh.',
+                price=price,
+                purchase_price=(price * Decimal(rng.uniform(0.6, 0.85))).quantize(Decimal('0.01')),
+                discount_percentage=discount,
+                effective_price=(price - price * discount / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
+                stock=0 if rng.random() < 0.05 else rng.randint(1, 200),
+                available=rng.random() >= 0.03,
+                featured=rng.random() < 0.02,
+                created_at=created,
+                updated_at=created,
+            ))
+        with transaction.atomic():
+            self.products = Product.objects.bulk_create(rows, batch_size=self.batch_size)
+        # Popularity is independent of id and category
+        self.popular = list(self.products)
+        rng.shuffle(self.popular)
+        self.popularity = zipf_weights(len(self.popular), 1.1)
+        self.log(f'{count} products')
+
+    # -- customers ------------------------------------------------------------------
+
+    def make_users(self, count):
+        rng = self.rng
+        offset = (User.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        rows = (
+            User(
+                username=f'customer{offset + i}',
+                email=f'customer{offset + i}@example.com',
+                first_name=f'Customer {offset + i}',
+                password=self.password,
+                date_joined=self.moment(rng.random()),
+            )
+            for i in range(count)
+        )
+        with transaction.atomic():
+            self.users = User.objects.bulk_create(rows, batch_size=self.batch_size)
+        # Repeat customers: a few users place many of the orders
+        self.buyers = list(self.users)
+        rng.shuffle(self.buyers)
+        self.buyer_weights = zipf_weights(len(self.buyers), 0.7)
+        self.log(f'{count} users')
+
+    def basket(self):
+        """{product: quantity} for one cart or order."""
+        rng = self.rng
+        lines = rng.choices(LINES_PER_ORDER, weights=LINES_WEIGHTS)[0]
+        picked = rng.choices(self.popular, cum_weights=self.popularity, k=lines)
+        quantities = rng.choices(QUANTITIES, weights=QUANTITY_WEIGHTS, k=lines)
+        return dict(zip(picked, quantities))
+
+    def make_carts(self, count):
+        rng = self.rng
+        rows = []
+        for user in rng.sample(self.users, min(count, len(self.users))):
+            added = self.now - timedelta(minutes=rng.randint(1, 60 * 24 * 14))
+            rows.extend(
+                CartItem(user_id=user.id, product_id=product.id, quantity=quantity, created_at=added)
+                for product, quantity in self.basket().items()
+            )
+        with transaction.atomic(using=CartItem.objects.db):
+            CartItem.objects.bulk_create(rows, batch_size=self.batch_size)
+        self.log(f'{count} carts ({len(rows)} items)')
+
+    # -- orders ---------------------------------------------------------------------
+
+    def order_state(self, age, online):
+        """(status, payment_status, days until the last update) for an order ``age`` days old."""
+        rng = self.rng
+        if online and rng.random() < 0.08:
+            return 'cancelled', 'failed', 0
+        if age < 1:
+            status = rng.choice(('pending', 'processing'))
+        elif age < 4:
+            status = rng.choice(('processing', 'shipped', 'shipped'))
+        elif age < 10:
+            status = rng.choices(('shipped', 'delivered', 'cancelled'), weights=(30, 62, 8))[0]
+        else:
+            status = rng.choices(('delivered', 'cancelled'), weights=(92, 8))[0]
+        if online:
+            payment = 'paid'
+        else:
+            # Cash on delivery is marked paid by staff once delivered, usually
+            payment = 'paid' if status == 'delivered' and rng.random() < 0.85 else 'pending'
+        return status, payment, min(age, rng.uniform(0, 7))
+
+    def make_orders(self, count):
+        rng = self.rng
+        first_id = (Order.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        totals = {'orders': 0, 'order_items': 0, 'ledger_entries': 0}
+        for batch_start in range(0, count, self.batch_size):
+            orders, items, entries = [], [], []
+            size = min(self.batch_size, count - batch_start)
+            buyers = rng.choices(self.buyers, cum_weights=self.buyer_weights, k=size)
+            for offset in range(size):
+                number = batch_start + offset
+                order_id = first_id + number
+                created = self.moment((number + rng.random()) / count)
+                age = (self.now - created) / timedelta(days=1)
+                online = rng.random() < ONLINE_SHARE
+                status, payment, settled_after = self.order_state(age, online)
+                updated = created + timedelta(days=settled_after)
+
+                total = Decimal(0)
+                for product, quantity in self.basket().items():
+                    items.append(OrderItem(
+                        order_id=order_id, product_id=product.id, quantity=quantity,
+                        price=product.effective_price, purchase_price=product.purchase_price,
+                    ))
+                    total += product.effective_price * quantity
+                orders.append(Order(
+                    id=order_id,
+                    user_id=buyers[offset].id,
+                    total=total,
+                    status=status,
+                    payment_status=payment,
+                    payment_intent_id=f'ORDER-{order_id}' if online else 'COD',
+                    shipping_address=(
+                        f'House {rng.randint(1, 250)}, Road {rng.randint(1, 40)}, '
+                        f'{rng.choices(CITIES, weights=CITY_WEIGHTS)[0]}'
+                    ),
+                    created_at=created,
+                    updated_at=updated,
+                ))
+                # What sync_order_to_ledger records on save
+                if payment == 'paid':
+                    entries.append(AccountingEntry(
+                        description=f'Order #{order_id} Revenue', amount=total, entry_type='income',
+                        related_order_id=order_id, date=created,
+                    ))
+                    if status == 'cancelled':
+                        entries.append(AccountingEntry(
+                            description=f'Refund/Cancel Order #{order_id}', amount=total, entry_type='expense',
+                            related_order_id=order_id, date=updated,
+                        ))
+            with transaction.atomic():
+                Order.objects.bulk_create(orders)
+                OrderItem.objects.bulk_create(items)
+                AccountingEntry.objects.bulk_create(entries)
+            totals['orders'] += len(orders)
+            totals['order_items'] += len(items)
+            totals['ledger_entries'] += len(entries)
+            self.log(f"{totals['orders']}/{count} orders")
+        return totals
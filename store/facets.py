@@ -0,0 +1,193 @@
+"""
+Facet counts for the product listing.
+
+A single GROUP BY over (brand, category, price bucket) for the searched
+product set gives a small "cube" of counts, cached per catalogue version,
+so its key changes whenever a product does. Every facet is then counted
+from the cube in Python: brand counts apply the category selection but
+not the brand selection (and vice versa), so shoppers can see what adding
+another brand or category would return.
+"""
+import hashlib
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Value, When
+
+# Lower bounds (Tk) of the price buckets; the last bucket is open-ended
+PRICE_BUCKETS = [0, 1000, 5000, 20000, 50000]
+
+
+def bucket_label(index):
+    low = PRICE_BUCKETS[index]
+    if index + 1 == len(PRICE_BUCKETS):
+        return f'Tk {low:,}+'
+    return f'Tk {low:,} - {PRICE_BUCKETS[index + 1]:,}'
+
+
+def bucket_lookups(index):
+    """Half-open [low, next low) range of a bucket, matching bucket_expression()."""
+    lookups = {'price__gte': Decimal(PRICE_BUCKETS[index])}
+    if index + 1 < len(PRICE_BUCKETS):
+        lookups['price__lt'] = Decimal(PRICE_BUCKETS[index + 1])
+    return lookups
+
+
+def selected_bucket(params):
+    """Index of the ``price`` bucket in the query, or None."""
+    value = params.get('price', '')
+    if value.isdigit() and int(value) < len(PRICE_BUCKETS):
+        return int(value)
+    return None
+
+
+def price_lookups(params):
+    """
+    The listing's price filter as ORM lookups. Typed min_price/max_price
+    bounds are inclusive; a facet bucket (``price=<index>``) is half-open,
+    so a product at 999.50 is counted and listed in the same bucket.
+    """
+    min_price = parse_price(params.get('min_price'))
+    max_price = parse_price(params.get('max_price'))
+    if min_price is None and max_price is None:
+        bucket = selected_bucket(params)
+        return {} if bucket is None else bucket_lookups(bucket)
+    lookups = {}
+    if min_price is not None:
+        lookups['price__gte'] = min_price
+    if max_price is not None:
+        lookups['price__lte'] = max_price
+    return lookups
+
+
+def bucket_expression():
+    whens = [
+        When(price__gte=low, then=Value(index))
+        for index, low in reversed(list(enumerate(PRICE_BUCKETS)))
+    ]
+    return Case(*whens, default=Value(0), output_field=IntegerField())
+
+
+def parse_price(value):
+    try:
+        return Decimal(value) if value else None
+    except InvalidOperation:
+        return None
+
+
+def facet_cube(queryset, version, key_parts):
+    """
+    {(brand_id, category_id, bucket): count} for ``queryset``, cached under
+    the catalogue version plus whatever filters produced the queryset.
+    """
+    raw = '|'.join(str(part) for part in key_parts)
+    digest = hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+    key = f'store:facets:{version}:{digest}'
+
+    def count():
+        rows = (
+            queryset.order_by()
+            .annotate(bucket=bucket_expression())
+            .values_list('brand_id', 'category_id', 'bucket')
+            .annotate(total=Count('id'))
+        )
+        return {(brand, category, bucket): total for brand, category, bucket, total in rows}
+
+    # Single-flight: a new catalogue version is counted once, not per request
+    return cache.get_or_set(key, count, getattr(settings, 'STORE_FACET_CACHE_TIMEOUT', 3600))
+
+
+def toggle_url(request, name, value):
+    """Current query string with ``value`` added to / removed from ``name``; resets paging."""
+    query = request.GET.copy()
+    query.pop('page', None)
+    values = query.getlist(name)
+    if value in values:
+        values.remove(value)
+    else:
+        values.append(value)
+    query.setlist(name, values)
+    return f'?{query.urlencode()}'
+
+
+def price_url(request, index):
+    query = request.GET.copy()
+    for name in ('page', 'min_price', 'max_price'):
+        query.pop(name, None)
+    query['price'] = index
+    return f'?{query.urlencode()}'
+
+
+def build_facets(request, searched, version, search, brands, categories):
+    """
+    Facet lists for the listing sidebar.
+
+    ``searched`` is the product queryset after the search filter only;
+    ``brands`` and ``categories`` are the full Brand/Category lists, used
+    for labels and ordering.
+    """
+    selected_brands = set(request.GET.getlist('brand'))
+    selected_categories = set(request.GET.getlist('category'))
+    lookups = price_lookups(request.GET)
+
+    # Unknown names and slugs are ignored here and by the listing alike
+    brand_ids = {brand.name: brand.id for brand in brands if brand.name in selected_brands}
+    category_ids = {category.slug: category.id for category in categories if category.slug in selected_categories}
+
+    cube = facet_cube(searched.filter(**lookups), version, (search, sorted(lookups.items())))
+    # Price buckets ignore the price range itself
+    unpriced = facet_cube(searched, version, (search, [])) if lookups else cube
+
+    def matches(brand_id, category_id, skip):
+        if skip != 'brand' and brand_ids and brand_id not in brand_ids.values():
+            return False
+        if skip != 'category' and category_ids and category_id not in category_ids.values():
+            return False
+        return True
+
+    brand_counts, category_counts, bucket_counts = Counter(), Counter(), Counter()
+    for (brand_id, category_id, bucket), total in cube.items():
+        if matches(brand_id, category_id, 'brand'):
+            brand_counts[brand_id] += total
+        if matches(brand_id, category_id, 'category'):
+            category_counts[category_id] += total
+    for (brand_id, category_id, bucket), total in unpriced.items():
+        if matches(brand_id, category_id, None):
+            bucket_counts[bucket] += total
+
+    typed = request.GET.get('min_price') or request.GET.get('max_price')
+    current_bucket = None if typed else selected_bucket(request.GET)
+    return {
+        'brand': [
+            {
+                'label': brand.name,
+                'count': brand_counts[brand.id],
+                'selected': brand.name in selected_brands,
+                'url': toggle_url(request, 'brand', brand.name),
+            }
+            for brand in brands
+            if brand_counts[brand.id] or brand.name in selected_brands
+        ],
+        'category': [
+            {
+                'label': category.name,
+                'count': category_counts[category.id],
+                'selected': category.slug in selected_categories,
+                'url': toggle_url(request, 'category', category.slug),
+            }
+            for category in categories
+            if category_counts[category.id] or category.slug in selected_categories
+        ],
+        'price': [
+            {
+                'label': bucket_label(index),
+                'count': bucket_counts[index],
+                'selected': index == current_bucket,
+                'url': price_url(request, index),
+            }
+            for index in range(len(PRICE_BUCKETS))
+            if bucket_counts[index]
+        ],
+    }
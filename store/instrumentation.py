@@ -0,0 +1,148 @@
+"""
+Per-request cost accounting: SQL queries and time, template rendering time
+and view time.
+
+RequestMetricsMiddleware wraps every database connection's cursor calls
+for the duration of the request, and templates rendered through
+InstrumentedTemplates (the TEMPLATES backend) add their render time to the
+request's metrics. Each response is then
+
+* logged to ``store.requests``: INFO normally, WARNING when it goes over
+  the settings.STORE_REQUEST_BUDGETS entry for its URL name or namespace, and
+* given a ``Server-Timing`` header when the user is staff, so the numbers
+  show up in the browser's network panel.
+"""
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+from .metrics import observe_request
+
+logger = logging.getLogger('store.requests')
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.view_started = None
+        self.view_time = 0.0
+        self.total_time = 0.0
+        self.rendering = False
+
+    def __call__(self, execute, sql, params, many, context):
+        """connection.execute_wrapper() hook: time every query."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'sql_ms': round(self.sql_time * 1000, 1),
+            'template_ms': round(self.template_time * 1000, 1),
+            'view_ms': round(self.view_time * 1000, 1),
+            'total_ms': round(self.total_time * 1000, 1),
+        }
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'view;dur={self.view_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ])
+
+
+def budget_for(match):
+    """STORE_REQUEST_BUDGETS entry for a resolved URL: its name, its namespace, then 'default'."""
+    budgets = getattr(settings, 'STORE_REQUEST_BUDGETS', {})
+    if match is not None:
+        for name in (match.view_name, match.namespace):
+            if name in budgets:
+                return budgets[name]
+    return budgets.get('default', {})
+
+
+def over_budget(metrics, budget):
+    """Human-readable list of exceeded limits (empty when within budget)."""
+    exceeded = []
+    if 'queries' in budget and metrics.queries > budget['queries']:
+        exceeded.append(f"{metrics.queries} queries > {budget['queries']}")
+    duration_ms = metrics.total_time * 1000
+    if 'ms' in budget and duration_ms > budget['ms']:
+        exceeded.append(f"{duration_ms:.0f}ms > {budget['ms']}ms")
+    return exceeded
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = request.metrics = RequestMetrics()
+        with ExitStack() as stack:
+            for connection in connections.all(initialized_only=False):
+                stack.enter_context(connection.execute_wrapper(metrics))
+            response = self.get_response(request)
+
+        metrics.total_time = time.perf_counter() - metrics.started
+        if metrics.view_started is not None:
+            metrics.view_time = time.perf_counter() - metrics.view_started
+        self.report(request, response, metrics)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics.view_started = time.perf_counter()
+
+    def report(self, request, response, metrics):
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        exceeded = over_budget(metrics, budget_for(match))
+        stats = metrics.as_dict()
+        observe_request(view_name, request.method, response.status_code, metrics.total_time, metrics.queries)
+        logger.log(
+            logging.WARNING if exceeded else logging.INFO,
+            '%s %s %s %s%s',
+            request.method, request.path, response.status_code,
+            ' '.join(f'{name}={value}' for name, value in stats.items()),
+            f" over budget: {', '.join(exceeded)}" if exceeded else '',
+            extra={'view_name': view_name, 'metrics': stats, 'over_budget': exceeded},
+        )
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            response.headers['Server-Timing'] = metrics.server_timing()
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = getattr(request, 'metrics', None)
+        # Nested renders are already inside the outer one's time
+        if metrics is None or metrics.rendering:
+            return super().render(context, request)
+        metrics.rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - started
+            metrics.rendering = False
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    """DjangoTemplates whose templates report render time to request.metrics."""
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name).template, self)
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super().from_string(template_code).template, self)
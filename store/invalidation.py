@@ -0,0 +1,50 @@
+"""
+Which model changes invalidate which cache keys.
+
+Most cache keys here embed a version (the catalogue version, a product's
+updated_at), so edits simply stop them from being read. Entries that
+cannot carry a version are registered instead:
+
+    invalidate_on(Category, Brand, keys=[NAV_CACHE_KEY])
+    invalidate_on(Product, keys=lambda product: [f'store:thing:{product.pk}'])
+
+Every post_save/post_delete of a registered model deletes its keys once
+the transaction commits, so a reader cannot re-cache the old rows in
+between. Registrations live in store/signals.py, which is imported when
+the app is ready. Bulk updates send no signals; they call invalidate().
+"""
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+# model -> [list of keys, or callable(instance) -> keys]
+registry = defaultdict(list)
+
+
+def invalidate_on(*models, keys):
+    for model in models:
+        registry[model].append(keys)
+
+
+def keys_for(instance):
+    keys = set()
+    for entry in registry.get(type(instance), ()):
+        keys.update(entry(instance) if callable(entry) else entry)
+    return keys
+
+
+def invalidate(keys):
+    """Delete ``keys`` once the current transaction (if any) commits."""
+    keys = sorted(set(keys))
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_registered_keys(sender, instance, **kwargs):
+    if sender in registry:
+        invalidate(keys_for(instance))
@@ -0,0 +1,216 @@
+import json
+import logging
+import math
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.test.utils import setup_databases, teardown_databases
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from store.datagen import DatasetGenerator
+from store.instrumentation import budget_for
+from store.models import CartItem
+from store.sorting import SORT_OPTIONS
+from store.viewcounts import view_counter
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list."""
+    return values[max(math.ceil(pct / 100 * len(values)) - 1, 0)]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the main views through the test client on a throwaway database with a synthetic '
+        'catalogue; reports latency percentiles and query counts and writes them as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000, help='Products in the synthetic catalogue')
+        parser.add_argument('--users', type=int, default=200, help='Shopper accounts')
+        parser.add_argument('--orders', type=int, default=2000, help='Orders in the history (best sellers, dashboard)')
+        parser.add_argument('--iterations', type=int, default=50, help='Measured requests per case')
+        parser.add_argument('--warmup', type=int, default=3, help='Unmeasured requests per case')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed (dataset and request parameters)')
+        parser.add_argument('--page-cache', action='store_true', help='Keep the anonymous page cache on')
+        parser.add_argument('--output', default='benchmark.json', help='Where to write the JSON results')
+        parser.add_argument('--compare', help='Earlier JSON results to show the change against')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as cache_dir, override_settings(**self.benchmark_settings(cache_dir, options)):
+            old_config = setup_databases(
+                verbosity=0, interactive=False, aliases=set(settings.DATABASES), serialized_aliases=set(),
+            )
+            # Per-request logs (timings, purges, order mail) would drown the report
+            logging.disable(logging.INFO)
+            try:
+                started = time.perf_counter()
+                generator = DatasetGenerator(random.Random(options['seed']))
+                generator.generate(products=options['products'], users=options['users'], orders=options['orders'])
+                self.stdout.write(
+                    f"Generated {options['products']} products, {options['users']} users and "
+                    f"{options['orders']} orders in {time.perf_counter() - started:.1f}s"
+                )
+                data = {'categories': generator.categories, 'brands': generator.brands, 'products': generator.products}
+                results = self.run_cases(random.Random(options['seed']), data, options)
+            finally:
+                logging.disable(logging.NOTSET)
+                # Buffered product views belong to the throwaway database
+                with view_counter.lock:
+                    view_counter.pending.clear()
+                teardown_databases(old_config, verbosity=0)
+
+        report = {
+            'commit': git_commit(),
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'options': {name: options[name] for name in ('products', 'users', 'orders', 'iterations', 'seed', 'page_cache')},
+            'results': results,
+        }
+        self.print_table(results, self.load_baseline(options['compare']))
+        with open(options['output'], 'w') as handle:
+            json.dump(report, handle, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def benchmark_settings(self, cache_dir, options):
+        """Keep caches, mail and metrics away from the real ones."""
+        caches = {alias: dict(config) for alias, config in settings.CACHES.items()}
+        for alias, config in caches.items():
+            if 'filebased' in config['BACKEND']:
+                config['LOCATION'] = f'{cache_dir}/{alias}'
+        overrides = {
+            'CACHES': caches,
+            'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+            'STORE_METRICS_DIR': None,
+        }
+        if not options['page_cache']:
+            overrides['STORE_PAGE_CACHE_TIMEOUT'] = 0
+        return overrides
+
+    def cases(self, rng, data):
+        """(name, client, request factory, preparation) for every measured case."""
+        categories, brands = data['categories'], data['brands']
+        products = [product for product in data['products'] if product.available]
+        # Every iteration's COD order takes a unit off each product in the cart
+        stocked = [product for product in products if product.stock >= 100]
+        shopper = User.objects.create_user('bench-shopper', 'bench@example.com')
+        staff = User.objects.create_user('bench-staff', 'staff@example.com', is_staff=True, is_superuser=True)
+        anonymous, shopper_client, staff_client = Client(), Client(), Client()
+        shopper_client.force_login(shopper)
+        staff_client.force_login(staff)
+        session = shopper_client.session
+        session['shipping_address'] = 'Benchmark Street 1'
+        session['order_email'] = shopper.email
+        session.save()
+
+        def fill_cart():
+            CartItem.objects.filter(user=shopper).delete()
+            CartItem.objects.bulk_create(
+                CartItem(user=shopper, product=product, quantity=1) for product in rng.sample(stocked, 3)
+            )
+
+        words = sorted({product.name.split()[1] for product in products[:200]})
+        low = rng.randrange(1000, 50000)
+        return [
+            ('index', anonymous, lambda: ('get', reverse('store:index'), {}), None),
+            ('category', anonymous, lambda: ('get', reverse('store:category'), {}), None),
+            ('category:search', anonymous, lambda: ('get', reverse('store:category'), {'search': rng.choice(words)}), None),
+            ('category:category', anonymous, lambda: ('get', reverse('store:category'), {'category': rng.choice(categories).slug}), None),
+            ('category:brand', anonymous, lambda: ('get', reverse('store:category'), {'brand': rng.choice(brands).name}), None),
+            ('category:price', anonymous, lambda: ('get', reverse('store:category'), {'min_price': low, 'max_price': low * 3}), None),
+            ('category:sort', anonymous, lambda: ('get', reverse('store:category'), {'sort': rng.choice(list(SORT_OPTIONS))}), None),
+            ('category:page', anonymous, lambda: ('get', reverse('store:category'), {'page': rng.randint(2, 20)}), None),
+            ('product', anonymous, lambda: ('get', reverse('store:product', args=[rng.choice(products).slug]), {}), None),
+            ('cart', shopper_client, lambda: ('get', reverse('store:cart'), {}), fill_cart),
+            ('checkout', shopper_client, lambda: ('get', reverse('payment:checkout'), {}), fill_cart),
+            ('process_payment', shopper_client, lambda: ('post', reverse('payment:process_payment'), {'payment_method': 'cod'}), fill_cart),
+            ('financial_dashboard', staff_client, lambda: ('get', reverse('admin:store_financialreport_changelist'), {}), None),
+        ]
+
+    def run_cases(self, rng, data, options):
+        from django.core import mail
+
+        results = {}
+        for name, client, make_request, prepare in self.cases(rng, data):
+            timings, queries = [], []
+            path = None
+            for iteration in range(options['warmup'] + options['iterations']):
+                if prepare:
+                    prepare()
+                method, path, params = make_request()
+                started = time.perf_counter()
+                response = getattr(client, method)(path, params)
+                elapsed = time.perf_counter() - started
+                if response.status_code >= 400:
+                    raise RuntimeError(f'{name}: {method.upper()} {path} returned {response.status_code}')
+                if iteration >= options['warmup']:
+                    timings.append(elapsed * 1000)
+                    queries.append(response.wsgi_request.metrics.queries)
+                mail.outbox = []
+            results[name] = self.summarize(timings, queries, budget_for(resolve(path)))
+            self.stdout.write(f"  {name}: p50 {results[name]['p50_ms']:.1f} ms")
+        return results
+
+    @staticmethod
+    def summarize(timings, queries, budget):
+        timings.sort()
+        result = {'requests': len(timings), 'mean_ms': round(statistics.fmean(timings), 2)}
+        for pct in PERCENTILES:
+            result[f'p{pct}_ms'] = round(percentile(timings, pct), 2)
+        result['queries'] = {'min': min(queries), 'median': statistics.median(queries), 'max': max(queries)}
+        result['budget'] = budget
+        over = []
+        if 'queries' in budget and max(queries) > budget['queries']:
+            over.append(f"{max(queries)} queries > {budget['queries']}")
+        if 'ms' in budget and result['p95_ms'] > budget['ms']:
+            over.append(f"p95 {result['p95_ms']:.0f}ms > {budget['ms']}ms")
+        result['over_budget'] = over
+        return result
+
+    def load_baseline(self, path):
+        if not path:
+            return {}
+        with open(path) as handle:
+            baseline = json.load(handle)
+        self.stdout.write(f"Comparing with {path} (commit {baseline.get('commit') or 'unknown'})")
+        return baseline['results']
+
+    def print_table(self, results, baseline):
+        header = f"\n{'case':<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}"
+        if baseline:
+            header += f"{'p95 vs base':>13}{'queries vs base':>17}"
+        self.stdout.write(header)
+        for name, result in results.items():
+            line = (
+                f"{name:<22}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+                f"{result['queries']['max']:>9}"
+            )
+            base = baseline.get(name)
+            if base:
+                change = (result['p95_ms'] - base['p95_ms']) / base['p95_ms'] * 100 if base['p95_ms'] else 0
+                line += f"{change:>+12.0f}%{result['queries']['max'] - base['queries']['max']:>+17}"
+            if result['over_budget']:
+                line += '  ' + self.style.WARNING('over budget: ' + ', '.join(result['over_budget']))
+            self.stdout.write(line)
@@ -0,0 +1,147 @@
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# What a bare sqlite3 connection does: rollback journal, full sync, the 5s
+# busy timeout and DEFERRED transactions (Django's default transaction mode)
+DEFAULT_PROFILE = {'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL'}, 'begin': 'BEGIN', 'timeout': 5.0}
+
+
+def tuned_profile():
+    options = settings.DATABASES['default'].get('OPTIONS', {})
+    return {
+        'pragmas': settings.SQLITE_PRAGMAS,
+        'begin': f"BEGIN {options.get('transaction_mode') or ''}".strip(),
+        'timeout': options.get('timeout', 5),
+    }
+
+
+def connect(path, profile):
+    conn = sqlite3.connect(path, timeout=profile['timeout'], isolation_level=None, check_same_thread=False)
+    for name, value in profile['pragmas'].items():
+        # journal_mode is persistent and was set by create_fixture()
+        if name != 'journal_mode':
+            conn.execute(f'PRAGMA {name}={value}')
+    return conn
+
+
+def create_fixture(path, rows, profile):
+    conn = sqlite3.connect(path)
+    conn.execute(f"PRAGMA journal_mode={profile['pragmas'].get('journal_mode', 'DELETE')}")
+    conn.execute('CREATE TABLE product (id INTEGER PRIMARY KEY, category INTEGER, price REAL, stock INTEGER, name TEXT)')
+    conn.execute('CREATE INDEX product_category ON product (category, price)')
+    conn.executemany(
+        'INSERT INTO product VALUES (?, ?, ?, ?, ?)',
+        ((i, i % 20, random.uniform(100, 100000), 1000, f'Product {i}') for i in range(1, rows + 1)),
+    )
+    conn.commit()
+    conn.close()
+
+
+class Command(BaseCommand):
+    help = 'Measures concurrent SQLite read/write throughput with default settings vs settings.SQLITE_PRAGMAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration of each run')
+        parser.add_argument('--readers', type=int, default=4, help='Reader threads (listing-style queries)')
+        parser.add_argument('--writers', type=int, default=2, help='Writer threads (checkout-style stock updates)')
+        parser.add_argument('--rows', type=int, default=20000, help='Rows in the scratch product table')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['readers']} readers, {options['writers']} writers, "
+            f"{options['seconds']:g}s per run, {options['rows']} rows (scratch database)"
+        )
+        results = {}
+        for label, profile in (('default', DEFAULT_PROFILE), ('tuned', tuned_profile())):
+            with tempfile.TemporaryDirectory() as directory:
+                path = str(Path(directory) / 'bench.sqlite3')
+                create_fixture(path, options['rows'], profile)
+                results[label] = self.run(path, profile, options)
+
+        self.stdout.write(f"\n{'profile':<10}{'reads/s':>12}{'writes/s':>12}{'lock errors':>14}{'p99 write ms':>15}")
+        for label, result in results.items():
+            self.stdout.write(
+                f"{label:<10}{result['reads']:>12.0f}{result['writes']:>12.0f}"
+                f"{result['errors']:>14}{result['p99_write_ms']:>15.1f}"
+            )
+        default, tuned = results['default'], results['tuned']
+        if default['writes']:
+            self.stdout.write(self.style.SUCCESS(
+                f"\nWrites x{tuned['writes'] / default['writes']:.1f}, "
+                f"reads x{tuned['reads'] / max(default['reads'], 1):.1f} with the tuned pragmas"
+            ))
+
+    def run(self, path, profile, options):
+        stop = threading.Event()
+        lock = threading.Lock()
+        totals = {'reads': 0, 'writes': 0, 'errors': 0}
+        write_times = []
+        rows = options['rows']
+
+        def reader():
+            conn = connect(path, profile)
+            count = errors = 0
+            while not stop.is_set():
+                try:
+                    conn.execute(
+                        'SELECT id, name, price FROM product WHERE category = ? ORDER BY price LIMIT 12',
+                        (random.randrange(20),),
+                    ).fetchall()
+                    count += 1
+                except sqlite3.OperationalError:
+                    errors += 1
+            conn.close()
+            with lock:
+                totals['reads'] += count
+                totals['errors'] += errors
+
+        def writer():
+            conn = connect(path, profile)
+            count = errors = 0
+            times = []
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    # Read-then-write, like checkout validating stock before decrementing it
+                    conn.execute(profile['begin'])
+                    product_id = random.randint(1, rows)
+                    conn.execute('SELECT stock FROM product WHERE id = ?', (product_id,)).fetchone()
+                    conn.execute('UPDATE product SET stock = stock - 1 WHERE id = ?', (product_id,))
+                    conn.execute('COMMIT')
+                    count += 1
+                    times.append(time.perf_counter() - started)
+                except sqlite3.OperationalError:
+                    errors += 1
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+            conn.close()
+            with lock:
+                totals['writes'] += count
+                totals['errors'] += errors
+                write_times.extend(times)
+
+        threads = [threading.Thread(target=reader) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=writer) for _ in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        write_times.sort()
+        p99 = write_times[int(len(write_times) * 0.99) - 1] * 1000 if write_times else 0.0
+        seconds = options['seconds']
+        return {
+            'reads': totals['reads'] / seconds,
+            'writes': totals['writes'] / seconds,
+            'errors': totals['errors'],
+            'p99_write_ms': p99,
+        }
@@ -0,0 +1,62 @@
+import re
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand, CommandError
+
+
+def minify_css(source):
+    """Conservative CSS minifier: strips comments and redundant whitespace only."""
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    # Only after the colon: a space *before* ':' is significant in selectors
+    source = re.sub(r':\s+', ':', source)
+    source = source.replace(';}', '}')
+    return source.strip()
+
+
+class Command(BaseCommand):
+    help = 'Minifies and concatenates page CSS into the bundles listed in settings.CSS_BUNDLES'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Exit with an error if any bundle is out of date instead of writing it',
+        )
+
+    def handle(self, *args, **options):
+        output_root = Path(apps.get_app_config('store').path) / 'static'
+        stale = []
+
+        for bundle_name, sources in settings.CSS_BUNDLES.items():
+            parts = []
+            for source in sources:
+                path = finders.find(source)
+                if not path:
+                    raise CommandError(f'CSS source not found: {source}')
+                parts.append(f'/* {source} */\n' + minify_css(Path(path).read_text(encoding='utf-8')))
+            content = '\n'.join(parts) + '\n'
+
+            output_path = output_root / bundle_name
+            current = output_path.read_text(encoding='utf-8') if output_path.exists() else None
+            if current == content:
+                self.stdout.write(f'Up to date: {bundle_name}')
+                continue
+
+            if options['check']:
+                stale.append(bundle_name)
+                continue
+
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            output_path.write_text(content, encoding='utf-8')
+            original = sum(Path(finders.find(s)).stat().st_size for s in sources)
+            self.stdout.write(self.style.SUCCESS(
+                f'Built {bundle_name}: {original} -> {len(content.encode())} bytes'
+            ))
+
+        if stale:
+            raise CommandError(f"Out-of-date CSS bundles: {', '.join(stale)}. Run 'python manage.py build_css'.")
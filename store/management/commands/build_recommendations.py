@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from store.recommendations import DEFAULT_TOP_K, update_copurchase
+
+
+class Command(BaseCommand):
+    help = 'Updates the "frequently bought together" lists from new orders (run periodically, e.g. from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild the co-purchase matrix from all orders')
+        parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help='Neighbours kept per product')
+
+    def handle(self, *args, **options):
+        result = update_copurchase(full=options['full'], top_k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {result['orders']} orders, refreshed {result['products']} products "
+            f"({result['changed']} with a different related list) "
+            f"(watermark: order #{result['last_order_id']})"
+        ))
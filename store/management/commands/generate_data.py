@@ -0,0 +1,53 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.datagen import DatasetGenerator
+from store.models import Brand, Category, Order, Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Fills an empty catalogue with a seeded synthetic dataset (brands, categories, products, users, carts, '
+        'orders and ledger entries) for load testing; the same seed and sizes always give the same data'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--brands', type=int, default=30)
+        parser.add_argument('--categories', type=int, default=12)
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--carts', type=int, default=1000, help='Users with items in their cart')
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--days', type=int, default=365, help='Order history spans this many days up to now')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=5000, help='Orders (or other rows) per transaction')
+        parser.add_argument('--password', help='Password for every generated user (default: none, they cannot log in)')
+
+    def handle(self, *args, **options):
+        if any(model.objects.exists() for model in (Category, Brand, Product, Order)):
+            raise CommandError('The catalogue is not empty; generate into a freshly migrated database.')
+        if options['orders'] or options['carts']:
+            if options['products'] < 1 or options['users'] < 1:
+                raise CommandError('Orders and carts need at least one product and one user.')
+        if options['products'] and (options['categories'] < 1 or options['brands'] < 1):
+            raise CommandError('Products need at least one category and one brand.')
+
+        generator = DatasetGenerator(
+            random.Random(options['seed']),
+            days=options['days'],
+            batch_size=options['batch_size'],
+            password=options['password'],
+            log=lambda message: self.stdout.write(f'  {message}'),
+        )
+        started = time.perf_counter()
+        counts = generator.generate(**{
+            name: options[name] for name in ('brands', 'categories', 'products', 'users', 'carts', 'orders')
+        })
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {counts['orders']} orders ({counts['order_items']} items, {counts['ledger_entries']} "
+            f"ledger entries), {counts['products']} products and {counts['users']} users "
+            f"in {time.perf_counter() - started:.0f}s"
+        ))
+        self.stdout.write('Run build_recommendations --full to fill "frequently bought together".')
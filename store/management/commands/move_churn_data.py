@@ -0,0 +1,117 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, models, transaction
+
+from ecommerce_project.db_routers import CHURN_DB, ChurnRouter
+from store.datagen import explicit_timestamps
+
+BATCH_SIZE = 500
+
+# Fields that identify the same row in both databases. Cart items and
+# verification codes get fresh ids in churn, whose own rows may already
+# use the old ones
+NATURAL_KEYS = {
+    ('sessions', 'session'): ('session_key',),
+    ('store', 'cartitem'): ('user_id', 'product_id'),
+    ('store', 'verificationcode'): ('email', 'code', 'created_at'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Copies sessions, cart items and verification codes left in the default database '
+        'into the churn database (run once after "migrate --database churn")'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true', help='Delete the moved rows from the default database')
+
+    def handle(self, *args, **options):
+        if not ChurnRouter.enabled():
+            raise CommandError(f'No "{CHURN_DB}" database is configured')
+        default_tables = set(connections['default'].introspection.table_names())
+        churn_tables = set(connections[CHURN_DB].introspection.table_names())
+
+        for app_label, model_name in sorted(ChurnRouter.churn_models):
+            model = apps.get_model(app_label, model_name)
+            table = model._meta.db_table
+            if table not in default_tables:
+                continue
+            if table not in churn_tables:
+                raise CommandError(f'{table} is missing from the churn database; run "migrate --database {CHURN_DB}" first')
+
+            totals = {'copied': 0, 'present': 0, 'conflicts': 0}
+            rows = model.objects.using('default').order_by('pk')
+            # Batches by primary key rather than one open cursor, since
+            # --delete removes rows from the table being read
+            batch = list(rows[:BATCH_SIZE])
+            while batch:
+                self.move(model, batch, options['delete'], totals)
+                batch = list(rows.filter(pk__gt=batch[-1].pk)[:BATCH_SIZE])
+
+            self.stdout.write(
+                f"{table}: {totals['copied']} rows copied, {totals['present']} already in {CHURN_DB}"
+            )
+            if totals['conflicts']:
+                self.stdout.write(self.style.WARNING(
+                    f"{table}: {totals['conflicts']} rows kept in default; {CHURN_DB} has different rows "
+                    f"with the same {', '.join(NATURAL_KEYS[app_label, model_name])}"
+                ))
+
+        self.stdout.write(self.style.SUCCESS('Churn data moved'))
+
+    def move(self, model, batch, delete, totals):
+        """
+        Copy one batch into churn and, with ``delete``, remove from default
+        the rows that are now in churn: those copied, and identical ones
+        left by an earlier run. A row whose natural key is taken by a
+        different churn row (a newer session or cart line) is left alone.
+        """
+        key_fields = NATURAL_KEYS[model._meta.app_label, model._meta.model_name]
+        autoincrement = isinstance(model._meta.pk, models.AutoField)
+        fields = [
+            field.attname for field in model._meta.concrete_fields
+            if not (autoincrement and field.primary_key)
+        ]
+
+        def key(values):
+            return tuple(values[name] for name in key_fields)
+
+        first = key_fields[0]
+        existing = {
+            key(values): values
+            for values in model.objects.using(CHURN_DB)
+            .filter(**{f'{first}__in': {getattr(row, first) for row in batch}})
+            .values(*fields)
+        }
+
+        copies, moved = [], []
+        for row in batch:
+            values = {name: getattr(row, name) for name in fields}
+            found = existing.get(key(values))
+            if found is None:
+                copies.append(model(**values))
+                moved.append(row.pk)
+                existing[key(values)] = values
+            elif found == values:
+                totals['present'] += 1
+                moved.append(row.pk)
+            else:
+                totals['conflicts'] += 1
+
+        # Copies keep their created_at
+        with transaction.atomic(using=CHURN_DB), explicit_timestamps(model):
+            model.objects.using(CHURN_DB).bulk_create(copies)
+        totals['copied'] += len(copies)
+
+        if delete and moved:
+            # A raw DELETE of exactly these rows, so no post_delete signals
+            # fire for rows that were moved
+            connection = connections['default']
+            quote = connection.ops.quote_name
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {quote(model._meta.db_table)} WHERE {quote(model._meta.pk.column)} '
+                    f'IN ({", ".join(["%s"] * len(moved))})',
+                    moved,
+                )
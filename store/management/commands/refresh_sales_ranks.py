@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from store.bestsellers import refresh_sales_ranks
+
+
+class Command(BaseCommand):
+    help = 'Recomputes best-seller ranks from paid/delivered orders (run periodically, e.g. from cron)'
+
+    def handle(self, *args, **kwargs):
+        result = refresh_sales_ranks()
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {result['ranks']} ranks, updated units sold on {result['products_updated']} products"
+        ))
@@ -0,0 +1,289 @@
+"""
+Shop metrics in the Prometheus text format, served at /metrics/.
+
+Counters and histograms live in process memory. With several workers,
+set settings.STORE_METRICS_DIR to a directory they all share: every
+worker writes its values to ``<pid>-<start time>.json`` there every
+STORE_METRICS_FLUSH_INTERVAL seconds (and at exit), and the endpoint sums
+all files, so a scrape sees the whole host whichever worker answers it.
+The start time keeps a reused pid from overwriting an exited worker's file.
+Files that have not been rewritten for a while belong to exited workers:
+a scrape folds them into ``retired.json`` and deletes them, so totals stay
+monotonic without the directory growing with every restart.
+"""
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+_lock = threading.Lock()
+
+# Running totals of exited workers; every other .json file is a live worker's
+RETIRED_FILE = 'retired.json'
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}  # json list of label values -> value
+        registry.register(self)
+
+    def key(self, labels):
+        return json.dumps([str(labels[label]) for label in self.labels])
+
+    def reset(self):
+        self.values = {}
+
+    def label_text(self, key, extra=()):
+        pairs = list(zip(self.labels, json.loads(key))) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        registry.touch()
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def samples(self, values):
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{self.label_text(key)} {value}'
+
+
+class Histogram(Metric):
+    """Values are [count per bucket..., count above the last bucket, sum]."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labels)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with _lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+        registry.touch()
+
+    @staticmethod
+    def merge(total, value):
+        return [a + b for a, b in zip(total, value)] if total else list(value)
+
+    def samples(self, values):
+        for key, entry in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), entry[:-1]):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else repr(float(bound))
+                yield f'{self.name}_bucket{self.label_text(key, [("le", le)])} {cumulative}'
+            yield f'{self.name}_sum{self.label_text(key)} {entry[-1]}'
+            yield f'{self.name}_count{self.label_text(key)} {cumulative}'
+
+
+def read_json(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None  # gone, being replaced, or written by an older release
+
+
+def write_json(path, data):
+    temporary = path.with_suffix('.tmp')
+    temporary.write_text(json.dumps(data))
+    os.replace(temporary, path)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.pid = None
+        self.filename = None
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    @staticmethod
+    def directory():
+        directory = getattr(settings, 'STORE_METRICS_DIR', None)
+        return Path(directory) if directory else None
+
+    def touch(self):
+        """Start this worker's flush thread on first use (again after a fork)."""
+        if self.pid == os.getpid() or self.directory() is None:
+            return
+        with _lock:
+            if self.pid == os.getpid():
+                return
+            if self.pid is not None:
+                # Forked: the parent's values are already in the parent's file
+                for metric in self.metrics.values():
+                    metric.reset()
+            self.pid = os.getpid()
+            self.filename = f'{self.pid}-{time.time_ns() // 1000}.json'
+            self.thread = threading.Thread(target=self.run, name='metrics-flusher', daemon=True)
+            self.thread.start()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def flush_interval():
+        return getattr(settings, 'STORE_METRICS_FLUSH_INTERVAL', 10)
+
+    def run(self):
+        while not self.stopped.wait(self.flush_interval()):
+            self.flush()
+
+    def snapshot(self):
+        with _lock:
+            return {name: dict(metric.values) for name, metric in self.metrics.items()}
+
+    def flush(self):
+        directory = self.directory()
+        if directory is None or self.filename is None:
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        write_json(directory / self.filename, self.snapshot())
+
+    def merge(self, totals, data):
+        for name, values in data.items():
+            metric = self.metrics.get(name)
+            if metric is None:
+                continue
+            merged = totals.setdefault(name, {})
+            for key, value in values.items():
+                merged[key] = metric.merge(merged.get(key), value)
+
+    def worker_files(self, directory):
+        return [path for path in directory.glob('*.json') if path.name != RETIRED_FILE]
+
+    def retire(self, directory):
+        """
+        Fold the files of workers that stopped flushing into RETIRED_FILE.
+
+        One scrape at a time does this (an O_EXCL lock file). The retired
+        file lists what it has folded, so a scrape that dies between writing
+        it and deleting the worker files does not count them twice.
+        """
+        cutoff = time.time() - max(60, 6 * self.flush_interval())
+        stale = []
+        for path in self.worker_files(directory):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    stale.append(path)
+            except OSError:
+                pass
+        if not stale:
+            return
+        lock = directory / 'retire.lock'
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            # Left behind by a scrape that died; the next one takes over
+            try:
+                if lock.stat().st_mtime < cutoff:
+                    lock.unlink()
+            except OSError:
+                pass
+            return
+        try:
+            retired = read_json(directory / RETIRED_FILE) or {'folded': [], 'values': {}}
+            folded = set(retired['folded'])
+            for path in stale:
+                data = read_json(path)
+                if data is not None and path.name not in folded:
+                    self.merge(retired['values'], data)
+                    folded.add(path.name)
+            retired['folded'] = sorted(folded & {path.name for path in self.worker_files(directory)})
+            write_json(directory / RETIRED_FILE, retired)
+            for path in stale:
+                path.unlink(missing_ok=True)
+        finally:
+            lock.unlink(missing_ok=True)
+
+    def collect(self):
+        """{metric name: {label key: value}} summed over every worker's file."""
+        directory = self.directory()
+        if directory is None:
+            return self.snapshot()
+        self.touch()
+        self.flush()
+        self.retire(directory)
+        totals = {name: {} for name in self.metrics}
+        retired = read_json(directory / RETIRED_FILE) or {'folded': [], 'values': {}}
+        self.merge(totals, retired['values'])
+        folded = set(retired['folded'])
+        for path in self.worker_files(directory):
+            if path.name in folded:
+                continue
+            data = read_json(path)
+            if data is not None:
+                self.merge(totals, data)
+        return totals
+
+    def render(self):
+        lines = []
+        for name, values in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            lines.extend(metric.samples(values))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_duration = Histogram(
+    'store_http_request_duration_seconds', 'Time to produce a response, by URL name', ['view', 'method'],
+)
+requests_total = Counter('store_http_requests_total', 'Responses by URL name and status code', ['view', 'status'])
+request_queries = Histogram(
+    'store_http_request_db_queries', 'SQL queries per request, by URL name', ['view'], buckets=QUERY_BUCKETS,
+)
+cache_lookups = Counter(
+    'store_cache_lookups_total',
+    'Cache lookups; page: page cache events (hit/miss/store/bypass), default: which cache level answered',
+    ['cache', 'result'],
+)
+cart_adds = Counter('store_cart_adds_total', 'Products added to carts')
+orders_placed = Counter(
+    'store_orders_placed_total', 'Orders placed (COD) or paid (gateways), by payment method', ['payment_method'],
+)
+gateway_session_duration = Histogram(
+    'store_payment_gateway_session_seconds', 'Time to open a payment gateway session', ['gateway', 'outcome'],
+)
+emails_sent = Counter('store_emails_total', 'Emails sent, by kind and outcome', ['kind', 'outcome'])
+
+
+def observe_request(view_name, method, status_code, duration, queries):
+    view = view_name or 'unmatched'
+    request_duration.observe(duration, view=view, method=method)
+    requests_total.inc(view=view, status=status_code)
+    request_queries.observe(queries, view=view)
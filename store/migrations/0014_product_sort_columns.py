@@ -0,0 +1,113 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:47
+
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+
+def backfill_sort_columns(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    OrderItem = apps.get_model('store', 'OrderItem')
+    # As refresh_sales_ranks() fills units_sold: paid or delivered, not
+    # cancelled, over the 30-day sort window (bestsellers.SORT_WINDOW)
+    sold = dict(
+        OrderItem.objects.filter(
+            Q(order__payment_status='paid') | Q(order__status='delivered'),
+            order__created_at__gte=timezone.now() - timedelta(days=30),
+        )
+        .exclude(order__status='cancelled')
+        .order_by()
+        .values_list('product_id')
+        .annotate(total=Sum('quantity'))
+    )
+    products = list(Product.objects.all())
+    for product in products:
+        discount = product.price * product.discount_percentage / 100
+        # Half up, as Product.save() rounds it
+        product.effective_price = (product.price - discount).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        product.units_sold = sold.get(product.id, 0)
+    Product.objects.bulk_update(products, ['effective_price', 'units_sold'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_copurchase'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text='Price after discount (kept in sync on save)', max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='units_sold',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_sort_columns, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['created_at', 'id'], name='product_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['effective_price', 'id'], name='product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['units_sold', 'id'], name='product_sold_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['discount_percentage', 'id'], name='product_discount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['name', 'id'], name='product_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['category', 'created_at', 'id'], name='product_cat_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['category', 'effective_price', 'id'], name='product_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['category', 'units_sold', 'id'], name='product_cat_sold_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['category', 'discount_percentage', 'id'], name='product_cat_discount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['category', 'name', 'id'], name='product_cat_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['brand', 'created_at', 'id'], name='product_brand_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['brand', 'effective_price', 'id'], name='product_brand_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['brand', 'units_sold', 'id'], name='product_brand_sold_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['brand', 'discount_percentage', 'id'], name='product_brand_discount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['brand', 'name', 'id'], name='product_brand_name_idx'),
+        ),
+    ]
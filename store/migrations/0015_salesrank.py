@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_product_sort_columns'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='units_sold',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Units on paid/delivered orders in the best-seller sort window (refreshed periodically)'),
+        ),
+        migrations.CreateModel(
+            name='SalesRank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window_days', models.PositiveSmallIntegerField(help_text='Rolling window in days; 0 means all time')),
+                ('units', models.PositiveIntegerField()),
+                ('rank', models.PositiveIntegerField()),
+                ('computed_at', models.DateTimeField(auto_now_add=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sales_ranks', to='store.category')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_ranks', to='store.product')),
+            ],
+            options={
+                'ordering': ['rank'],
+                'indexes': [models.Index(fields=['category', 'window_days', 'rank'], name='salesrank_scope_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:18
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def create_version_row(apps, schema_editor):
+    CatalogueVersion = apps.get_model('store', 'CatalogueVersion')
+    CatalogueVersion.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_requestprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('catalogue', models.PositiveBigIntegerField(default=0)),
+                ('taxonomy', models.PositiveBigIntegerField(default=0)),
+                ('ranks', models.PositiveBigIntegerField(default=0)),
+                ('modified', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='related_version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Bumped when the "frequently bought together" list changes (part of the page ETag)'),
+        ),
+        migrations.RunPython(create_version_row, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,5 @@
+from decimal import ROUND_HALF_UP, Decimal
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils.text import slugify
@@ -55,18 +57,54 @@ class Product(models.Model):
     available = models.BooleanField(default=True)
     featured = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Part of the product page ETag and card cache keys
+    # Denormalized for index-backed listing sorts
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False, help_text='Price after discount (kept in sync on save)')
+    units_sold = models.PositiveIntegerField(default=0, editable=False, help_text='Units on paid/delivered orders in the best-seller sort window (refreshed periodically)')
+    view_count = models.PositiveIntegerField(default=0, editable=False, help_text='Product page views (buffered per worker, flushed in batches)')
+    related_version = models.PositiveIntegerField(default=0, editable=False, help_text='Bumped when the "frequently bought together" list changes (part of the page ETag)')
     
     class Meta:
         ordering = ['-created_at']
+        # One partial index per listing sort (see store/sorting.py), store-wide
+        # and per category and brand, so the page is read in index order with
+        # no sort step. The ORM writes available=True as a bare
+        # "WHERE available", which matches the indexes' condition.
+        indexes = [
+            models.Index(fields=['created_at', 'id'], condition=models.Q(available=True), name='product_created_idx'),
+            models.Index(fields=['effective_price', 'id'], condition=models.Q(available=True), name='product_price_idx'),
+            models.Index(fields=['units_sold', 'id'], condition=models.Q(available=True), name='product_sold_idx'),
+            models.Index(fields=['discount_percentage', 'id'], condition=models.Q(available=True), name='product_discount_idx'),
+            models.Index(fields=['view_count', 'id'], condition=models.Q(available=True), name='product_views_idx'),
+            models.Index(fields=['name', 'id'], condition=models.Q(available=True), name='product_name_idx'),
+            models.Index(fields=['category', 'created_at', 'id'], condition=models.Q(available=True), name='product_cat_created_idx'),
+            models.Index(fields=['category', 'effective_price', 'id'], condition=models.Q(available=True), name='product_cat_price_idx'),
+            models.Index(fields=['category', 'units_sold', 'id'], condition=models.Q(available=True), name='product_cat_sold_idx'),
+            models.Index(fields=['category', 'discount_percentage', 'id'], condition=models.Q(available=True), name='product_cat_discount_idx'),
+            models.Index(fields=['category', 'view_count', 'id'], condition=models.Q(available=True), name='product_cat_views_idx'),
+            models.Index(fields=['category', 'name', 'id'], condition=models.Q(available=True), name='product_cat_name_idx'),
+            models.Index(fields=['brand', 'created_at', 'id'], condition=models.Q(available=True), name='product_brand_created_idx'),
+            models.Index(fields=['brand', 'effective_price', 'id'], condition=models.Q(available=True), name='product_brand_price_idx'),
+            models.Index(fields=['brand', 'units_sold', 'id'], condition=models.Q(available=True), name='product_brand_sold_idx'),
+            models.Index(fields=['brand', 'discount_percentage', 'id'], condition=models.Q(available=True), name='product_brand_discount_idx'),
+            models.Index(fields=['brand', 'view_count', 'id'], condition=models.Q(available=True), name='product_brand_views_idx'),
+            models.Index(fields=['brand', 'name', 'id'], condition=models.Q(available=True), name='product_brand_name_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        price = Decimal(str(self.price))
+        discount = Decimal(str(self.discount_percentage or 0))
+        # Half up, as SQL ROUND() does in the admin's bulk discount action
+        self.effective_price = (price - price * discount / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
         super().save(*args, **kwargs)
     
     def __str__(self):
         return self.name
+
+    def get_absolute_url(self):
+        return reverse('store:product', args=[self.slug])
     
     @property
     def in_stock(self):
@@ -87,8 +125,10 @@ class Product(models.Model):
 
 
 class CartItem(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart_items')
-    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    # Stored in the churn database: no cross-database constraints, and
+    # deleting a user or product removes its cart rows via signals
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='cart_items')
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False)
     quantity = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -155,6 +195,122 @@ class OrderItem(models.Model):
         return (self.price - self.purchase_price) * self.quantity
 
 
+class CoPurchase(models.Model):
+    """
+    Sparse item-item co-occurrence matrix built from order baskets.
+    The diagonal (product == other) holds the number of orders containing the product.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'other')
+
+    def __str__(self):
+        return f"{self.product_id} x {self.other_id}: {self.count}"
+
+
+class RelatedProduct(models.Model):
+    """Top-K "frequently bought together" neighbours, materialized from CoPurchase"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['product', 'rank']
+        unique_together = ('product', 'rank')  # Also the index the product page reads through
+
+    def __str__(self):
+        return f"{self.product} -> {self.related} (#{self.rank})"
+
+
+class CoPurchaseRun(models.Model):
+    """Watermark for incremental co-purchase updates"""
+    last_order_id = models.BigIntegerField(default=0)
+    orders_processed = models.PositiveIntegerField(default=0)
+    full_rebuild = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Run up to order #{self.last_order_id} ({self.orders_processed} orders)"
+
+
+class SalesRank(models.Model):
+    """Materialized best-seller rank; category is empty for the store-wide ranking"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales_ranks')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='sales_ranks')
+    window_days = models.PositiveSmallIntegerField(help_text='Rolling window in days; 0 means all time')
+    units = models.PositiveIntegerField()
+    rank = models.PositiveIntegerField()
+    computed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['rank']
+        indexes = [
+            models.Index(fields=['category', 'window_days', 'rank'], name='salesrank_scope_idx'),
+        ]
+
+    def __str__(self):
+        scope = self.category or 'All products'
+        window = f"{self.window_days} days" if self.window_days else 'all time'
+        return f"#{self.rank} {self.product} ({scope}, {window})"
+
+
+class CatalogueVersion(models.Model):
+    """
+    Singleton row of counters behind the HTTP validators and caches.
+
+    ``catalogue`` moves on every product, brand or category write that can
+    change a page, ``taxonomy`` only on brand and category writes (names in
+    nav, filters and product cards), ``ranks`` when best-seller ranks change.
+    Stock decrements and view counts leave it alone.
+    """
+    catalogue = models.PositiveBigIntegerField(default=0)
+    taxonomy = models.PositiveBigIntegerField(default=0)
+    ranks = models.PositiveBigIntegerField(default=0)
+    modified = models.DateTimeField(default=timezone.now)
+
+    SINGLETON_ID = 1
+
+    def __str__(self):
+        return f"Catalogue v{self.catalogue} (taxonomy v{self.taxonomy}, ranks v{self.ranks})"
+
+    @classmethod
+    def bump(cls, catalogue=True, taxonomy=False, ranks=False):
+        """Increment the given counters in one UPDATE, inside the caller's transaction."""
+        changes = {'modified': timezone.now()}
+        for name, bumped in (('catalogue', catalogue or taxonomy), ('taxonomy', taxonomy), ('ranks', ranks)):
+            if bumped:
+                changes[name] = models.F(name) + 1
+        if not cls.objects.filter(pk=cls.SINGLETON_ID).update(**changes):
+            cls.objects.get_or_create(pk=cls.SINGLETON_ID)
+            cls.objects.filter(pk=cls.SINGLETON_ID).update(**changes)
+
+
+class RequestProfile(models.Model):
+    """A cProfile of one request, triggered by staff (see store/profiling.py)"""
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    queries = models.PositiveIntegerField(default=0)
+    filename = models.CharField(max_length=100, help_text='Name of the .prof/.txt pair in STORE_PROFILE_DIR')
+    summary = models.TextField(help_text='Top frames by cumulative time')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+
 class SiteSettings(models.Model):
     """Singleton model for site-wide settings"""
     email_host_user = models.CharField(
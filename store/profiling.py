@@ -0,0 +1,112 @@
+"""
+On-demand profiling of single requests, for staff.
+
+A staff user adds ``?profile=1`` to a URL, or sends ``X-Profile: 1``, and
+RequestProfilerMiddleware runs the rest of the request under cProfile.
+The raw stats go to settings.STORE_PROFILE_DIR as ``<name>.prof`` (open
+with snakeviz or ``python -m pstats``) next to a ``<name>.txt`` summary of
+the top frames, and a RequestProfile row makes both browsable from the
+admin. Only the newest STORE_PROFILE_KEEP profiles are kept.
+
+The response's ``X-Profile`` header points at the admin page. One request
+is profiled at a time; a second concurrent one is served unprofiled with
+``X-Profile: busy``.
+"""
+import cProfile
+import io
+import pstats
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import RequestProfile
+
+# Frames listed in the text summary
+TOP_FRAMES = 40
+
+_profiler_lock = threading.Lock()
+
+
+def wants_profile(request):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_staff:
+        return False
+    return request.META.get('HTTP_X_PROFILE') == '1' or request.GET.get('profile') == '1'
+
+
+def profile_dir():
+    return Path(getattr(settings, 'STORE_PROFILE_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def profile_paths(filename):
+    directory = profile_dir()
+    return directory / f'{filename}.prof', directory / f'{filename}.txt'
+
+
+def summarize(profiler):
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(TOP_FRAMES)
+    return stream.getvalue()
+
+
+def save_profile(request, response, profiler, duration, user_id):
+    profile_dir().mkdir(parents=True, exist_ok=True)
+    filename = f'{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}'
+    prof_path, text_path = profile_paths(filename)
+    summary = summarize(profiler)
+    profiler.dump_stats(prof_path)
+    text_path.write_text(f'{request.method} {request.get_full_path()}\n\n{summary}')
+
+    metrics = getattr(request, 'metrics', None)
+    profile = RequestProfile.objects.create(
+        method=request.method,
+        path=request.get_full_path()[:500],
+        user_id=user_id,
+        status_code=response.status_code,
+        duration_ms=duration * 1000,
+        queries=metrics.queries if metrics else 0,
+        filename=filename,
+        summary=summary,
+    )
+    rotate_profiles()
+    return profile
+
+
+def rotate_profiles():
+    """Delete all but the newest STORE_PROFILE_KEEP profiles (files go with the rows, see signals)."""
+    keep = getattr(settings, 'STORE_PROFILE_KEEP', 50)
+    stale = RequestProfile.objects.order_by('-created_at', '-id').values_list('id', flat=True)[keep:]
+    RequestProfile.objects.filter(id__in=list(stale)).delete()
+
+
+class RequestProfilerMiddleware:
+    """Goes after AuthenticationMiddleware, which it needs for request.user."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not wants_profile(request):
+            return self.get_response(request)
+        if not _profiler_lock.acquire(blocking=False):
+            response = self.get_response(request)
+            response.headers['X-Profile'] = 'busy'
+            return response
+        # Taken before the view, which may log the user out (request.user is then anonymous)
+        user_id = request.user.pk
+        try:
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            response = profiler.runcall(self.get_response, request)
+            duration = time.perf_counter() - started
+        finally:
+            _profiler_lock.release()
+
+        profile = save_profile(request, response, profiler, duration, user_id)
+        response.headers['X-Profile'] = reverse('admin:store_requestprofile_change', args=[profile.pk])
+        return response
@@ -0,0 +1,134 @@
+"""
+Surrogate keys and purges for a caching reverse proxy (Varnish, Fastly, ...).
+
+Public storefront pages carry a ``Surrogate-Key`` header naming what they
+show: ``product-<id>`` for every product rendered, ``product-list`` on
+listing pages, and the product page also names the ``brand-<id>`` and
+``category-<id>`` it prints. Model signals and bulk updates call
+purge_keys(), which hands the keys to the purger named by
+settings.STORE_CACHE_PURGER once the transaction commits, so a product
+edit drops the pages that display that product, and listings only when
+the set or order of listed products can change.
+"""
+import atexit
+import logging
+import queue
+import threading
+from functools import lru_cache
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Carried by every page that lists products, and purged when the set changes
+LISTING_KEY = 'product-list'
+
+
+def product_key(product_id):
+    return f'product-{product_id}'
+
+
+def brand_key(brand_id):
+    return f'brand-{brand_id}'
+
+
+def category_key(category_id):
+    return f'category-{category_id}'
+
+
+def taxonomy_keys(product):
+    """Keys for the brand and category names shown on a product's own page."""
+    keys = [category_key(product.category_id)]
+    if product.brand_id:
+        keys.append(brand_key(product.brand_id))
+    return keys
+
+
+def add_surrogate_keys(request, keys):
+    if request is None:
+        return
+    if not hasattr(request, 'surrogate_keys'):
+        request.surrogate_keys = set()
+    request.surrogate_keys.update(keys)
+
+
+class LoggingPurger:
+    """Development purger: just records what would be purged."""
+
+    def purge(self, keys):
+        logger.info('Purging surrogate keys: %s', ' '.join(keys))
+
+
+class HttpPurger:
+    """
+    POSTs the keys to settings.STORE_CACHE_PURGE_URL in a Surrogate-Key
+    header, the shape most proxy purge APIs (and a local stand-in) accept.
+
+    purge() only queues the keys; a background thread sends them, merging
+    whatever queued up meanwhile, so a save never waits on the proxy.
+    Keys still queued at exit are sent before the process ends.
+    """
+
+    # Keys per POST, to keep the header well inside proxy limits
+    BATCH_SIZE = 200
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def purge(self, keys):
+        self.queue.put(keys)
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='surrogate-key-purger', daemon=True)
+                self.thread.start()
+                atexit.register(self.drain)
+
+    def run(self):
+        while True:
+            keys = set(self.queue.get())
+            keys.update(self.pending())
+            self.send(sorted(keys))
+
+    def pending(self):
+        keys = set()
+        while True:
+            try:
+                keys.update(self.queue.get_nowait())
+            except queue.Empty:
+                return keys
+
+    def drain(self):
+        keys = self.pending()
+        if keys:
+            self.send(sorted(keys))
+
+    def send(self, keys):
+        url = settings.STORE_CACHE_PURGE_URL
+        for start in range(0, len(keys), self.BATCH_SIZE):
+            batch = ' '.join(keys[start:start + self.BATCH_SIZE])
+            try:
+                response = requests.post(url, headers={'Surrogate-Key': batch}, timeout=2)
+                response.raise_for_status()
+            except requests.RequestException:
+                logger.exception('Surrogate-key purge failed for %s', batch)
+
+
+@lru_cache(maxsize=1)
+def get_purger():
+    return import_string(getattr(settings, 'STORE_CACHE_PURGER', 'store.purging.LoggingPurger'))()
+
+
+def purge_keys(keys):
+    """Purge ``keys`` once the current transaction (if any) commits."""
+    keys = sorted(set(keys))
+    if keys:
+        transaction.on_commit(lambda: get_purger().purge(keys))
+
+
+def purge_products(product_ids):
+    purge_keys(product_key(product_id) for product_id in product_ids)
@@ -0,0 +1,250 @@
+"""
+"Frequently bought together" engine.
+
+Order baskets are folded into a sparse co-occurrence matrix (CoPurchase),
+and the top-K neighbours of every touched product are materialized into
+RelatedProduct so the product page reads them back with one indexed query.
+
+Neighbours are scored with cosine similarity on order counts:
+
+    score(a, b) = co_orders(a, b) / sqrt(orders(a) * orders(b))
+
+which keeps best-sellers from showing up as "related" to everything.
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import combinations, groupby, islice
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .bestsellers import counted_items
+from .models import CoPurchase, CoPurchaseRun, Product, RelatedProduct
+from .purging import purge_products
+
+DEFAULT_TOP_K = 8
+# Very large baskets (bulk/B2B orders) add noise and O(n^2) pairs
+MAX_BASKET_SIZE = 50
+# Orders younger than this may still be getting their items written
+SETTLE_TIME = timedelta(minutes=2)
+# Keep IN (...) lists under SQLite's bound-parameter limit
+ID_CHUNK_SIZE = 900
+
+
+def chunked(ids, size=ID_CHUNK_SIZE):
+    iterator = iter(ids)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def iter_baskets(after_order_id):
+    """
+    Yield (order_id, {product_ids}) for countable orders newer than the
+    watermark: paid or delivered and not cancelled, as for best sellers.
+    """
+    rows = (
+        counted_items()
+        .filter(order_id__gt=after_order_id, order__created_at__lt=timezone.now() - SETTLE_TIME)
+        .order_by('order_id')
+        .values_list('order_id', 'product_id')
+        .iterator(chunk_size=5000)
+    )
+    for order_id, items in groupby(rows, key=lambda row: row[0]):
+        yield order_id, {product_id for _, product_id in items}
+
+
+def count_pairs(baskets):
+    """
+    Fold baskets into a sparse {(a, b): count} delta, diagonal included.
+    Returns (delta, last_order_id, orders_processed).
+
+    Each basket's pairs are counted once, as (a, b) with a < b, by
+    Counter.update() over itertools.combinations, which runs in C; the
+    symmetric half and the diagonal are filled in at the end.
+    """
+    upper = Counter()
+    orders = Counter()
+    last_order_id = None
+    processed = 0
+    for order_id, products in baskets:
+        last_order_id = order_id
+        if len(products) > MAX_BASKET_SIZE:
+            continue
+        processed += 1
+        ordered = sorted(products)
+        orders.update(ordered)
+        upper.update(combinations(ordered, 2))
+
+    delta = Counter({(product_id, product_id): count for product_id, count in orders.items()})
+    for (a, b), count in upper.items():
+        delta[a, b] = delta[b, a] = count
+    return delta, last_order_id, processed
+
+
+def merged_rows(delta, full):
+    """Stored CoPurchase rows of every touched product with the delta added (read only)."""
+    rows = defaultdict(dict)
+    if not full:
+        touched = {a for a, _ in delta}
+        for ids in chunked(touched):
+            for product_id, other_id, count in CoPurchase.objects.filter(
+                product_id__in=ids
+            ).values_list('product_id', 'other_id', 'count'):
+                rows[product_id][other_id] = count
+
+    for (a, b), count in delta.items():
+        rows[a][b] = rows[a].get(b, 0) + count
+    return rows
+
+
+def write_counts(rows, delta):
+    """Upsert the merged count of every pair in the delta."""
+    CoPurchase.objects.bulk_create(
+        [
+            CoPurchase(product_id=a, other_id=b, count=rows[a][b])
+            for a, b in delta
+        ],
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['product', 'other'],
+        update_fields=['count'],
+    )
+
+
+def rank_neighbours(rows, top_k):
+    """Top-K neighbours per touched product as {product_id: [(other_id, score), ...]}."""
+    # Diagonal entries: number of orders containing each product. Touched
+    # products have theirs in the merged rows; the rest are read back
+    frequency = {product_id: row.get(product_id, 0) for product_id, row in rows.items()}
+    needed = {other for row in rows.values() for other in row} - set(frequency)
+    for ids in chunked(needed):
+        frequency.update(
+            CoPurchase.objects.filter(product_id__in=ids, other_id=F('product_id'))
+            .values_list('product_id', 'count')
+        )
+
+    ranked = {}
+    for product_id, row in rows.items():
+        own = row.get(product_id, 0)
+        candidates = (
+            (other_id, count / math.sqrt(own * frequency[other_id]))
+            for other_id, count in row.items()
+            if other_id != product_id and own and frequency.get(other_id)
+        )
+        ranked[product_id] = heapq.nlargest(top_k, candidates, key=lambda pair: pair[1])
+    return ranked
+
+
+def changed_lists(ranked):
+    """
+    Ids of the products whose order of neighbours differs from the stored
+    list. Score drift alone is not visible, so it is not written.
+    """
+    current = defaultdict(list)
+    for ids in chunked(ranked):
+        for product_id, related_id in (
+            RelatedProduct.objects.filter(product_id__in=ids).order_by('product_id', 'rank')
+            .values_list('product_id', 'related_id')
+        ):
+            current[product_id].append(related_id)
+    return [
+        product_id for product_id, neighbours in ranked.items()
+        if current.get(product_id, []) != [other_id for other_id, _ in neighbours]
+    ]
+
+
+def store_neighbours(ranked, changed, dropped=()):
+    """
+    Rewrite the changed lists and delete the dropped ones, and bump their
+    products' related_version: the product page ETag includes it (see
+    caching.product_validator).
+    """
+    for ids in chunked([*changed, *dropped]):
+        RelatedProduct.objects.filter(product_id__in=ids).delete()
+        Product.objects.filter(id__in=ids).update(related_version=F('related_version') + 1)
+    RelatedProduct.objects.bulk_create(
+        [
+            RelatedProduct(product_id=product_id, related_id=other_id, score=score, rank=rank)
+            for product_id in changed
+            for rank, (other_id, score) in enumerate(ranked[product_id], start=1)
+        ],
+        batch_size=1000,
+    )
+
+
+def update_copurchase(full=False, top_k=DEFAULT_TOP_K):
+    """
+    Fold orders placed since the last run into the matrix and refresh the
+    top-K lists of the products they touched. Untouched products keep their
+    lists (their scores drift slightly as neighbour frequencies grow);
+    ``full=True`` starts over, which also drops orders that were cancelled
+    after being counted and adds orders paid or delivered after the
+    watermark passed them.
+
+    Baskets are read, counted and ranked outside any transaction; only the
+    writes run in one, so checkouts are not kept waiting on SQLite's write
+    lock during the scan. A run that finds the watermark moved under it
+    (a concurrent incremental run) writes nothing.
+    """
+    last_run = CoPurchaseRun.objects.first()
+    previous = last_run.last_order_id if last_run else 0
+    watermark = 0 if full else previous
+
+    delta, last_order_id, processed = count_pairs(iter_baskets(watermark))
+    if last_order_id is None and not full:
+        return {'orders': 0, 'products': 0, 'changed': 0, 'last_order_id': watermark}
+
+    rows = merged_rows(delta, full)
+    ranked = rank_neighbours(rows, top_k)
+    changed = changed_lists(ranked)
+    dropped = []
+    if full:
+        # Products no order touches any more lose their lists
+        dropped = sorted(set(RelatedProduct.objects.values_list('product_id', flat=True).distinct()) - set(ranked))
+
+    with transaction.atomic():
+        latest = CoPurchaseRun.objects.first()
+        if not full and (latest.last_order_id if latest else 0) != previous:
+            return {'orders': 0, 'products': 0, 'changed': 0, 'last_order_id': latest.last_order_id}
+        if full:
+            # RelatedProduct is compared against, not wiped: see changed_lists
+            CoPurchase.objects.all().delete()
+        write_counts(rows, delta)
+        store_neighbours(ranked, changed, dropped)
+        # Proxies are purged on commit
+        purge_products([*changed, *dropped])
+        if last_order_id is None:
+            return {'orders': 0, 'products': 0, 'changed': len(changed) + len(dropped), 'last_order_id': watermark}
+        CoPurchaseRun.objects.create(
+            last_order_id=last_order_id,
+            orders_processed=processed,
+            full_rebuild=full,
+        )
+
+    return {
+        'orders': processed, 'products': len(ranked), 'changed': len(changed) + len(dropped),
+        'last_order_id': last_order_id,
+    }
+
+
+def related_products_for(product, limit=4):
+    """
+    Precomputed neighbours for the product page, in one indexed query;
+    new or unsold products fall back to others from the same category.
+    """
+    links = (
+        RelatedProduct.objects
+        .filter(product=product, related__available=True)
+        .select_related('related__brand', 'related__category')
+        .order_by('rank')[:limit]
+    )
+    related = [link.related for link in links]
+    if related:
+        return related
+    return list(
+        Product.objects.filter(category_id=product.category_id, available=True)
+        .select_related('brand', 'category').exclude(id=product.id)[:limit]
+    )
@@ -0,0 +1,313 @@
+"""
+In-process search indexes over the catalogue.
+
+The index lives in each worker's memory. It is built on first use (and
+warmed from wsgi.py), patched immediately through Product/Brand/Category
+signals in the worker that made the change, and rebuilt in every other
+worker once the catalogue version moves. That version is checked at most
+every REFRESH_INTERVAL seconds, so a keystroke normally never touches
+the database.
+
+Two indexes share that lifecycle: a prefix index for typeahead and a
+trigram index that finds products despite typos ("samsng", "iphon").
+"""
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+from urllib.parse import urlencode
+
+from django.urls import reverse
+
+from .models import Brand, Category, Product
+
+REFRESH_INTERVAL = 60
+# Minimum Jaccard similarity between a query word and an indexed word
+TRIGRAM_THRESHOLD = 0.3
+# Exact search returning fewer hits than this falls back to fuzzy matching
+FUZZY_MIN_RESULTS = 3
+FUZZY_MAX_RESULTS = 48
+
+# Letters and digits are separate words, so "note14" matches "Note 14"
+TOKEN_RE = re.compile(r'[^\W\d_]+|\d+')
+
+
+def normalize(text):
+    return ' '.join((text or '').lower().split())
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def trigrams(word):
+    """pg_trgm-style trigrams: two leading blanks, one trailing blank."""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PrefixIndex:
+    """
+    Sorted list of (term, key) pairs searched with bisect. Every word
+    suffix of a label is a term, so 'note 13' finds 'Redmi Note 13 Pro'.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.terms = {}
+
+    @staticmethod
+    def terms_for(label):
+        words = normalize(label).split()
+        return {' '.join(words[i:]) for i in range(len(words))}
+
+    def add(self, key, label):
+        self.remove(key)
+        terms = self.terms_for(label)
+        self.terms[key] = terms
+        for term in terms:
+            insort(self.entries, (term, key))
+
+    def remove(self, key):
+        for term in self.terms.pop(key, ()):
+            position = bisect_left(self.entries, (term, key))
+            if position < len(self.entries) and self.entries[position] == (term, key):
+                del self.entries[position]
+
+    def load(self, items):
+        """Bulk load [(key, label)]: one sort instead of n insertions."""
+        self.terms = {key: self.terms_for(label) for key, label in items}
+        self.entries = sorted((term, key) for key, terms in self.terms.items() for term in terms)
+
+    def search(self, prefix, limit):
+        prefix = normalize(prefix)
+        keys = []
+        position = bisect_left(self.entries, (prefix,))
+        while position < len(self.entries) and len(keys) < limit:
+            term, key = self.entries[position]
+            if not term.startswith(prefix):
+                break
+            if key not in keys:
+                keys.append(key)
+            position += 1
+        return keys
+
+
+class TrigramIndex:
+    """
+    Word-level trigram index over product names (brand name included).
+
+    Trigram postings point at distinct words rather than products, so a
+    lookup scores the vocabulary, which grows far slower than the catalogue;
+    words then map to the products that contain them.
+    """
+
+    def __init__(self):
+        self.word_trigrams = {}
+        self.postings = {}
+        self.word_products = {}
+        self.product_words = {}
+
+    def _add_word(self, word, product_id):
+        products = self.word_products.get(word)
+        if products is None:
+            products = self.word_products[word] = set()
+            grams = self.word_trigrams[word] = trigrams(word)
+            for gram in grams:
+                self.postings.setdefault(gram, set()).add(word)
+        products.add(product_id)
+
+    def _remove_word(self, word, product_id):
+        products = self.word_products.get(word)
+        if products is None:
+            return
+        products.discard(product_id)
+        if products:
+            return
+        del self.word_products[word]
+        for gram in self.word_trigrams.pop(word):
+            words = self.postings[gram]
+            words.discard(word)
+            if not words:
+                del self.postings[gram]
+
+    def add(self, product_id, text):
+        self.remove(product_id)
+        words = set(tokenize(text))
+        self.product_words[product_id] = words
+        for word in words:
+            self._add_word(word, product_id)
+
+    def remove(self, product_id):
+        for word in self.product_words.pop(product_id, ()):
+            self._remove_word(word, product_id)
+
+    def load(self, items):
+        """Bulk load [(product_id, text)] into an empty index."""
+        for product_id, text in items:
+            self.add(product_id, text)
+
+    def similar_words(self, token):
+        """{word: similarity} for indexed words at or above TRIGRAM_THRESHOLD."""
+        query = trigrams(token)
+        shared = Counter()
+        for gram in query:
+            shared.update(self.postings.get(gram, ()))
+        matches = {}
+        for word, common in shared.items():
+            score = common / (len(query) + len(self.word_trigrams[word]) - common)
+            if score >= TRIGRAM_THRESHOLD:
+                matches[word] = score
+        return matches
+
+    def search(self, query, limit):
+        """
+        Product ids ranked by the mean, over query words, of the best
+        similarity any of the product's words reaches.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        scores = Counter()
+        for token in tokens:
+            best = {}
+            for word, score in self.similar_words(token).items():
+                for product_id in self.word_products[word]:
+                    if score > best.get(product_id, 0):
+                        best[product_id] = score
+            scores.update(best)
+        cutoff = TRIGRAM_THRESHOLD * len(tokens)
+        ranked = sorted(
+            (item for item in scores.items() if item[1] >= cutoff),
+            key=lambda item: (-item[1], item[0]),
+        )
+        return [product_id for product_id, _ in ranked[:limit]]
+
+
+class CatalogueSearchIndex:
+    # Brands and categories are listed before products in suggestions
+    KIND_ORDER = {'brand': 0, 'category': 1, 'product': 2}
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.prefix = PrefixIndex()
+        self.trigrams = TrigramIndex()
+        self.documents = {}
+        self.version = None
+        self.checked_at = 0.0
+
+    # -- building -----------------------------------------------------------
+
+    def build(self):
+        from .caching import catalogue_version
+
+        version = catalogue_version()[0]
+        documents = {}
+        fuzzy_texts = []
+        for product_id, name, slug, brand in Product.objects.filter(available=True).values_list('id', 'name', 'slug', 'brand__name'):
+            documents['product', product_id] = self.product_document(name, slug)
+            fuzzy_texts.append((product_id, f'{brand or ""} {name}'))
+        for brand_id, name in Brand.objects.values_list('id', 'name'):
+            documents['brand', brand_id] = self.brand_document(name)
+        for slug, category_id, name in Category.objects.values_list('slug', 'id', 'name'):
+            documents['category', category_id] = self.category_document(name, slug)
+
+        prefix = PrefixIndex()
+        prefix.load((key, document['label']) for key, document in documents.items())
+        fuzzy = TrigramIndex()
+        fuzzy.load(fuzzy_texts)
+        with self.lock:
+            self.documents = documents
+            self.prefix = prefix
+            self.trigrams = fuzzy
+            self.version = version
+            self.checked_at = time.monotonic()
+
+    def ensure_fresh(self):
+        """Build on first use; afterwards re-check the catalogue version at most every REFRESH_INTERVAL."""
+        if self.version is not None and time.monotonic() - self.checked_at < REFRESH_INTERVAL:
+            return
+        from .caching import catalogue_version
+
+        with self.lock:
+            if self.version is not None and time.monotonic() - self.checked_at < REFRESH_INTERVAL:
+                return
+            if self.version is None or catalogue_version()[0] != self.version:
+                self.build()
+            else:
+                self.checked_at = time.monotonic()
+
+    # -- documents ----------------------------------------------------------
+
+    @staticmethod
+    def product_document(name, slug):
+        return {'type': 'product', 'label': name, 'url': reverse('store:product', args=[slug])}
+
+    @staticmethod
+    def brand_document(name):
+        return {'type': 'brand', 'label': name, 'url': f"{reverse('store:category')}?{urlencode({'brand': name})}"}
+
+    @staticmethod
+    def category_document(name, slug):
+        return {'type': 'category', 'label': name, 'url': f"{reverse('store:category')}?{urlencode({'category': slug})}"}
+
+    # -- incremental patching (signals) -------------------------------------
+
+    def put(self, key, document):
+        with self.lock:
+            if self.version is None:
+                return  # Not built yet; the first search builds from the database
+            self.documents[key] = document
+            self.prefix.add(key, document['label'])
+
+    def discard(self, key):
+        with self.lock:
+            if self.version is None:
+                return
+            self.documents.pop(key, None)
+            self.prefix.remove(key)
+            if key[0] == 'product':
+                self.trigrams.remove(key[1])
+
+    def update_product(self, product):
+        if product.available:
+            self.put(('product', product.pk), self.product_document(product.name, product.slug))
+            brand = product.brand.name if product.brand_id else ''
+            with self.lock:
+                if self.version is not None:
+                    self.trigrams.add(product.pk, f'{brand} {product.name}')
+        else:
+            self.discard(('product', product.pk))
+
+    def update_brand(self, brand):
+        self.put(('brand', brand.pk), self.brand_document(brand.name))
+        if self.version is None:
+            return
+        # The brand name is part of every one of its products' fuzzy text
+        products = Product.objects.filter(brand=brand, available=True).values_list('id', 'name')
+        with self.lock:
+            for product_id, name in products:
+                self.trigrams.add(product_id, f'{brand.name} {name}')
+
+    def update_category(self, category):
+        self.put(('category', category.pk), self.category_document(category.name, category.slug))
+
+    # -- queries ------------------------------------------------------------
+
+    def autocomplete(self, query, limit=8):
+        self.ensure_fresh()
+        with self.lock:
+            keys = self.prefix.search(query, limit * 3)
+            documents = [self.documents[key] for key in keys]
+        documents.sort(key=lambda d: (self.KIND_ORDER[d['type']], len(d['label'])))
+        return documents[:limit]
+
+    def fuzzy_search(self, query, limit=FUZZY_MAX_RESULTS):
+        """Available product ids ranked by trigram similarity to the query."""
+        self.ensure_fresh()
+        with self.lock:
+            return self.trigrams.search(query, limit)
+
+
+catalogue_index = CatalogueSearchIndex()
@@ -1,7 +1,17 @@
+import logging
 import os
-from django.db.models.signals import post_delete, post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from .models import Product, Order, AccountingEntry
+from django.contrib.auth.models import User
+from .models import Product, Order, AccountingEntry, Category, Brand, CartItem, CatalogueVersion, RequestProfile
+from .search import catalogue_index
+from .purging import LISTING_KEY, brand_key, category_key, product_key, purge_keys
+from .invalidation import invalidate_on
+from .context_processors import NAV_CACHE_KEY
+
+logger = logging.getLogger(__name__)
+
+invalidate_on(Category, Brand, keys=[NAV_CACHE_KEY])
 
 @receiver(post_delete, sender=Product)
 def delete_product_image(sender, instance, **kwargs):
@@ -9,8 +19,84 @@ def delete_product_image(sender, instance, **kwargs):
         if os.path.isfile(instance.image.path):
             try:
                 os.remove(instance.image.path)
-            except Exception as e:
-                print(f"Error deleting file: {e}")
+            except OSError:
+                logger.exception('Could not delete image of product %s', instance.pk)
+
+@receiver(post_delete, sender=RequestProfile)
+def delete_profile_files(sender, instance, **kwargs):
+    from .profiling import profile_paths
+    for path in profile_paths(instance.filename):
+        path.unlink(missing_ok=True)
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=User)
+def delete_cart_items(sender, instance, **kwargs):
+    """Cart items live in the churn database, out of reach of ON DELETE CASCADE."""
+    field = 'product' if sender is Product else 'user'
+    CartItem.objects.filter(**{field: instance.pk}).delete()
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_catalogue_version(sender, instance, **kwargs):
+    """
+    Move the counters behind the HTTP validators and caches (see
+    caching.catalogue_version). Brand and category names are shown on every
+    page and product card, so they move the taxonomy counter too.
+    """
+    CatalogueVersion.bump(taxonomy=sender is not Product)
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    catalogue_index.update_product(instance)
+
+@receiver(post_save, sender=Brand)
+def index_brand(sender, instance, **kwargs):
+    catalogue_index.update_brand(instance)
+
+@receiver(post_save, sender=Category)
+def index_category(sender, instance, **kwargs):
+    catalogue_index.update_category(instance)
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=Category)
+def unindex_catalogue_object(sender, instance, **kwargs):
+    catalogue_index.discard((sender.__name__.lower(), instance.pk))
+
+# Product fields that decide which listings show a product and in what order
+LISTING_FIELDS = ('available', 'price', 'discount_percentage', 'category_id', 'brand_id', 'name')
+
+@receiver(pre_save, sender=Product)
+def remember_listing_fields(sender, instance, **kwargs):
+    """Keep the stored LISTING_FIELDS so purge_product_pages can tell whether listings changed."""
+    instance._listed_as = Product.objects.filter(pk=instance.pk).values(*LISTING_FIELDS).first() if instance.pk else None
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def purge_product_pages(sender, instance, signal, created=False, **kwargs):
+    """
+    Drop proxy-cached pages that show this product; listings only go too
+    when it is added, removed, or a LISTING_FIELDS value changed.
+    """
+    keys = [product_key(instance.pk)]
+    listed_as = getattr(instance, '_listed_as', None)
+    if (created or signal is post_delete or listed_as is None
+            or any(listed_as[field] != getattr(instance, field) for field in LISTING_FIELDS)):
+        keys.append(LISTING_KEY)
+    purge_keys(keys)
+
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def purge_taxonomy_pages(sender, instance, **kwargs):
+    """Brand and category names appear on their products' pages and in every listing's sidebar."""
+    key = brand_key(instance.pk) if sender is Brand else category_key(instance.pk)
+    purge_keys([key, LISTING_KEY])
 
 @receiver(post_save, sender=Order)
 def sync_order_to_ledger(sender, instance, created, **kwargs):
@@ -0,0 +1,272 @@
+"""
+Optional in-process catalogue snapshot for the listing page.
+
+When settings.STORE_CATALOGUE_SNAPSHOT is on, each worker keeps the
+filterable columns of every product in compact arrays, reloaded whenever
+the catalogue version moves. category() then evaluates its predicates
+here instead of in SQLite and only fetches the current page's rows by id.
+
+Rows are stored in the default listing order (newest first); other sorts
+walk a permutation of row positions built on first use. Predicates are Python
+ints used as bitsets (bit i = row i), so combining filters is a handful
+of big-integer ANDs, and int.bit_count() gives the total for the paginator.
+Price ranges use block prefix masks over the rows in price order: whole
+blocks cost one XOR and only the two edge blocks are checked row by row.
+"""
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+
+from .models import Brand, Category, Product
+from .viewcounts import view_epoch
+
+# Rows per price block; smaller blocks mean more memory, fewer edge checks
+PRICE_BLOCK_SIZE = 512
+
+# store.sorting option -> (column, descending); ties break on id the same way
+SORT_COLUMNS = {
+    'price_asc': ('effective_prices', False),
+    'price_desc': ('effective_prices', True),
+    'best_selling': ('units_sold', True),
+    'discount': ('discounts', True),
+    'popular': ('view_counts', True),
+    'name': ('names', False),
+}
+
+
+def mask_from_positions(positions):
+    mask = 0
+    for position in positions:
+        mask |= 1 << position
+    return mask
+
+
+class CatalogueSnapshot:
+    def __init__(self, version, rows, brand_codes, category_codes):
+        """
+        ``rows`` are (id, price, effective_price, discount, brand_id,
+        category_id, available, created_at, units_sold, name, view_count).
+
+        View counts do not move the catalogue version; they are reloaded
+        on their own when the view-count epoch moves (see refresh_view_counts).
+        """
+        rows = sorted(rows, key=lambda row: (row[7], row[0]), reverse=True)
+        self.version = version
+        self.brand_codes = brand_codes
+        self.category_codes = category_codes
+        self.size = len(rows)
+
+        self.ids = array('q', (row[0] for row in rows))
+        self.prices = array('d', (float(row[1]) for row in rows))
+        self.effective_prices = array('d', (float(row[2]) for row in rows))
+        self.discounts = array('d', (float(row[3]) for row in rows))
+        self.brands = array('q', (row[4] or 0 for row in rows))
+        self.categories = array('q', (row[5] or 0 for row in rows))
+        self.created_at = array('d', (row[7].timestamp() for row in rows))
+        self.units_sold = array('q', (row[8] for row in rows))
+        self.names = [row[9] for row in rows]
+        self.view_counts = array('q', (row[10] for row in rows))
+        self.view_epoch = view_epoch()[0]
+        self.orders = {}
+
+        self.available_mask = mask_from_positions(i for i, row in enumerate(rows) if row[6])
+        self.discounted_mask = mask_from_positions(i for i, row in enumerate(rows) if row[3] > 0)
+        self.brand_masks = self.code_masks(self.brands)
+        self.category_masks = self.code_masks(self.categories)
+
+        # Row positions in price order, plus a prefix mask at every block boundary
+        self.price_order = array('q', sorted(range(self.size), key=self.prices.__getitem__))
+        self.sorted_prices = array('d', (self.prices[i] for i in self.price_order))
+        self.price_prefix = [0]
+        for start in range(0, self.size, PRICE_BLOCK_SIZE):
+            block = self.price_order[start:start + PRICE_BLOCK_SIZE]
+            self.price_prefix.append(self.price_prefix[-1] | mask_from_positions(block))
+
+    @staticmethod
+    def code_masks(codes):
+        positions = {}
+        for position, code in enumerate(codes):
+            positions.setdefault(code, []).append(position)
+        return {code: mask_from_positions(rows) for code, rows in positions.items()}
+
+    @classmethod
+    def load(cls, version):
+        rows = Product.objects.order_by().values_list(
+            'id', 'price', 'effective_price', 'discount_percentage', 'brand_id', 'category_id',
+            'available', 'created_at', 'units_sold', 'name', 'view_count',
+        )
+        return cls(
+            version,
+            list(rows),
+            brand_codes=dict(Brand.objects.values_list('name', 'id')),
+            category_codes=dict(Category.objects.values_list('slug', 'id')),
+        )
+
+    # -- predicates -----------------------------------------------------------
+
+    def price_mask(self, low=None, high=None, below=None):
+        """Rows with low <= price <= high and price < below (each bound optional)."""
+        start = 0 if low is None else bisect_left(self.sorted_prices, low)
+        end = self.size if high is None else bisect_right(self.sorted_prices, high)
+        if below is not None:
+            end = min(end, bisect_left(self.sorted_prices, below))
+        if start >= end:
+            return 0
+        first_block = -(-start // PRICE_BLOCK_SIZE)
+        last_block = end // PRICE_BLOCK_SIZE
+        if first_block >= last_block:
+            return mask_from_positions(self.price_order[start:end])
+        mask = self.price_prefix[last_block] ^ self.price_prefix[first_block]
+        mask |= mask_from_positions(self.price_order[start:first_block * PRICE_BLOCK_SIZE])
+        mask |= mask_from_positions(self.price_order[last_block * PRICE_BLOCK_SIZE:end])
+        return mask
+
+    def union(self, masks, codes):
+        mask = 0
+        for code in codes:
+            mask |= masks.get(code, 0)
+        return mask
+
+    @staticmethod
+    def bound(value):
+        return None if value is None else float(value)
+
+    def filter(self, brands=(), categories=(), min_price=None, max_price=None, below=None, discounted=False):
+        """
+        Bitset of available rows matching the listing filters (names/slugs
+        as in the URL; unknown ones are ignored, as by the ORM path).
+        """
+        mask = self.available_mask
+        brand_codes = [self.brand_codes[name] for name in brands if name in self.brand_codes]
+        if brand_codes:
+            mask &= self.union(self.brand_masks, brand_codes)
+        category_codes = [self.category_codes[slug] for slug in categories if slug in self.category_codes]
+        if category_codes:
+            mask &= self.union(self.category_masks, category_codes)
+        if min_price is not None or max_price is not None or below is not None:
+            mask &= self.price_mask(self.bound(min_price), self.bound(max_price), self.bound(below))
+        if discounted:
+            mask &= self.discounted_mask
+        return mask
+
+    def refresh_view_counts(self):
+        """Reload view counts (and drop the "popular" order) once per view-count epoch."""
+        epoch = view_epoch()[0]
+        if epoch == self.view_epoch:
+            return
+        counts = dict(Product.objects.order_by().values_list('id', 'view_count'))
+        self.view_counts = array('q', (counts.get(pk, 0) for pk in self.ids))
+        self.orders.pop('popular', None)
+        self.view_epoch = epoch
+
+    # -- paging ---------------------------------------------------------------
+
+    def sort_order(self, sort):
+        """Row positions in ``sort`` order, or None for the stored (newest first) order."""
+        if sort not in SORT_COLUMNS:
+            return None
+        if sort == 'popular':
+            self.refresh_view_counts()
+        order = self.orders.get(sort)
+        if order is None:
+            column, descending = SORT_COLUMNS[sort]
+            values, ids = getattr(self, column), self.ids
+            order = array('q', sorted(range(self.size), key=lambda i: (values[i], ids[i]), reverse=descending))
+            self.orders[sort] = order
+        return order
+
+    def page_ids(self, mask, offset, limit, sort=None):
+        """Product ids of matching rows offset..offset+limit, in ``sort`` order."""
+        if limit <= 0:
+            return []
+        data = mask.to_bytes(((self.size + 63) // 64) * 8, sys.byteorder)
+        order = self.sort_order(sort)
+        if order is not None:
+            ids = []
+            skip = offset
+            for position in order:
+                if data[position >> 3] >> (position & 7) & 1:
+                    if skip:
+                        skip -= 1
+                    else:
+                        ids.append(self.ids[position])
+                        if len(ids) >= limit:
+                            break
+            return ids
+
+        words = array('Q', data)
+        ids = []
+        skip = offset
+        for index, word in enumerate(words):
+            if not word:
+                continue
+            count = word.bit_count()
+            if skip >= count:
+                skip -= count
+                continue
+            base = index * 64
+            while word and len(ids) < limit:
+                low = word & -word
+                if skip:
+                    skip -= 1
+                else:
+                    ids.append(self.ids[base + low.bit_length() - 1])
+                word ^= low
+            if len(ids) >= limit:
+                break
+        return ids
+
+
+class SnapshotResult:
+    """
+    Sliceable stand-in for a queryset, for Paginator: count() is a
+    popcount and a slice loads just those products by id.
+    """
+
+    def __init__(self, snapshot, mask, queryset, sort=None):
+        self.snapshot = snapshot
+        self.mask = mask
+        self.queryset = queryset
+        self.sort = sort
+
+    def count(self):
+        return self.mask.bit_count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop, _ = index.indices(self.count())
+        ids = self.snapshot.page_ids(self.mask, start, max(stop - start, 0), self.sort)
+        products = self.queryset.in_bulk(ids)
+        return [products[pk] for pk in ids if pk in products]
+
+
+class SnapshotHolder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot = None
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, 'STORE_CATALOGUE_SNAPSHOT', False)
+
+    def current(self, version):
+        """Snapshot for ``version``, (re)loading it if the catalogue moved; None when disabled."""
+        if not self.enabled():
+            return None
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self.lock:
+            if self.snapshot is None or self.snapshot.version != version:
+                self.snapshot = CatalogueSnapshot.load(version)
+            return self.snapshot
+
+
+catalogue_snapshot = SnapshotHolder()
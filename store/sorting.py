@@ -0,0 +1,44 @@
+"""
+Listing sort options, selected with ?sort= so the choice is part of the
+page URL (and therefore of the page cache key).
+
+Each ordering is (column, id), matching a partial index on available
+products (see Product.Meta.indexes), also per category and per brand, so
+SQLite walks the index instead of sorting the filtered set. id breaks
+ties the same way in SQL and in the catalogue snapshot.
+
+Two cases still sort, each bounded by its own result set rather than the
+catalogue:
+
+- Several categories or brands selected at once (category_id IN (...)):
+  SQLite reads each id's range of the index but cannot merge them in
+  order, so the plan adds USE TEMP B-TREE FOR ORDER BY over the selected
+  products.
+- Search: exact matches walk the store-wide index with the search as a
+  residual filter, but fuzzy results (id IN (...)) are sorted the same
+  way, over a few dozen rows (search.FUZZY_MAX_RESULTS).
+
+The catalogue snapshot (settings.STORE_CATALOGUE_SNAPSHOT) answers
+multi-select filters from presorted permutations with no sort step.
+"""
+
+DEFAULT_SORT = 'newest'
+
+SORT_OPTIONS = {
+    'newest': ('Newest', ['-created_at', '-id']),
+    'price_asc': ('Price: Low to High', ['effective_price', 'id']),
+    'price_desc': ('Price: High to Low', ['-effective_price', '-id']),
+    'best_selling': ('Best Selling', ['-units_sold', '-id']),
+    'discount': ('Biggest Discount', ['-discount_percentage', '-id']),
+    'popular': ('Most Viewed', ['-view_count', '-id']),
+    'name': ('Name: A to Z', ['name', 'id']),
+}
+
+
+def get_sort(request):
+    sort = request.GET.get('sort', '')
+    return sort if sort in SORT_OPTIONS else DEFAULT_SORT
+
+
+def sort_choices():
+    return [(key, label) for key, (label, _) in SORT_OPTIONS.items()]
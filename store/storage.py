@@ -0,0 +1,52 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Static storage that writes content-hashed filenames (via the manifest)
+    and a precompressed ``.gz`` sibling for every hashed text asset.
+
+    Hashed names never change content, so they can be served with a
+    far-future ``Cache-Control: immutable`` header, and the web server
+    (e.g. nginx ``gzip_static on``) can send the ``.gz`` file directly
+    instead of compressing on every request.
+    """
+    compress_extensions = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.xml', '.ttf', '.eot')
+    # Tiny files are not worth a second request header + disk entry
+    min_compress_size = 256
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.add(hashed_name)
+            yield name, hashed_name, processed
+
+        if dry_run:
+            return
+
+        for hashed_name in sorted(hashed_names):
+            if hashed_name.endswith(self.compress_extensions):
+                self.compress_file(hashed_name)
+
+    def compress_file(self, name):
+        """Write ``<name>.gz`` next to ``name`` if it actually saves bytes."""
+        path = self.path(name)
+        if not os.path.isfile(path) or os.path.getsize(path) < self.min_compress_size:
+            return None
+
+        with open(path, 'rb') as source:
+            data = source.read()
+
+        # mtime=0 keeps the output byte-identical between collectstatic runs
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) >= len(data) * 0.95:
+            return None
+
+        gz_path = path + '.gz'
+        with open(gz_path, 'wb') as target:
+            target.write(compressed)
+        return gz_path
@@ -0,0 +1,60 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from store.caching import request_taxonomy_version
+from store.purging import add_surrogate_keys, product_key
+
+register = template.Library()
+
+# Bump when product_card.html changes so stale markup is not served
+PRODUCT_CARD_VERSION = 2
+
+
+def product_card_key(product, taxonomy):
+    """Cards show the brand and category names, so a taxonomy change renews them all."""
+    stamp = int(product.updated_at.timestamp() * 1000000)
+    return f'store:card:v{PRODUCT_CARD_VERSION}:{taxonomy}:{product.pk}:{stamp:x}'
+
+
+def render_product_cards(products, request=None):
+    """
+    Render product cards, reusing cached markup keyed on (id, updated_at)
+    and the taxonomy version.
+
+    All keys are fetched with one get_many() call and only the misses are
+    rendered, so a warm 12-card grid costs a single cache round trip. The
+    cards' surrogate keys are added to ``request`` for the page's headers.
+    """
+    products = list(products)
+    add_surrogate_keys(request, [product_key(product.pk) for product in products])
+    taxonomy = request_taxonomy_version(request)
+    keys = [product_card_key(product, taxonomy) for product in products]
+    cached = cache.get_many(keys)
+
+    fresh = {}
+    cards = []
+    for key, product in zip(keys, products):
+        html = cached.get(key)
+        if html is None:
+            html = render_to_string('store/includes/product_card.html', {'product': product})
+            fresh[key] = html
+        cards.append(html)
+
+    if fresh:
+        cache.set_many(fresh, getattr(settings, 'STORE_FRAGMENT_CACHE_TIMEOUT', 86400))
+    return mark_safe('\n'.join(cards))
+
+
+@register.simple_tag(takes_context=True)
+def product_cards(context, products):
+    """{% product_cards products %} renders a cached card for each product."""
+    return render_product_cards(products, context.get('request'))
+
+
+@register.simple_tag(takes_context=True)
+def product_card(context, product):
+    """{% product_card product %} renders one cached card."""
+    return render_product_cards([product], context.get('request'))
@@ -1,3 +1,985 @@
-from django.test import TestCase
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from io import StringIO
+from pathlib import Path
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.db.models import QuerySet
+from django.contrib.sessions.models import Session
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.log import AdminEmailHandler
+
+from .caching import get_page_cache_stats
+from .datagen import DatasetGenerator
+from .bestsellers import best_sellers, refresh_sales_ranks
+from ecommerce_project.cache_backends import FileCache, TwoLevelCache
+from ecommerce_project.db_routers import CHURN_DB, ChurnRouter
+from ecommerce_project.logconfig import BackgroundHandler, RequestContextFilter, bind, request_context
+from ecommerce_project.sessions import SessionStore
+
+from .metrics import RETIRED_FILE, orders_placed, registry, write_json
+from .models import (
+    AccountingEntry, Brand, CartItem, CatalogueVersion, Category, CoPurchase, Order, OrderItem, Product, RelatedProduct, RequestProfile, SalesRank, VerificationCode,
+)
+from .profiling import _profiler_lock
+from .purging import HttpPurger, LoggingPurger
+from .recommendations import count_pairs, update_copurchase
+from .search import catalogue_index
+from .snapshot import catalogue_snapshot
+from .viewcounts import ViewCounter, view_counter
+
+# Plain static storage (no collectstatic manifest), in-memory caches and no
+# metrics files, so the suite runs on a fresh checkout. Buffered views are
+# only flushed when a test asks for it
+TEST_SETTINGS = {
+    'STORAGES': {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+    'CACHES': {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'store-tests'},
+        'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'store-tests-sessions'},
+    },
+    'STORE_METRICS_DIR': None,
+    'STORE_CATALOGUE_SNAPSHOT': False,
+    'STORE_VIEW_FLUSH_INTERVAL': 24 * 60 * 60,
+}
+
+# (name, category slug, brand, price, discount %)
+CATALOGUE = [
+    ('Samsung Galaxy S24', 'phones', 'Samsung', '85000', '10'),
+    ('Galaxy Buds 2', 'audio', 'Samsung', '12000', '0'),
+    ('Apple iPhone 15', 'phones', 'Apple', '120000', '5'),
+    ('AirPods Pro', 'audio', 'Apple', '999.50', '0'),
+    ('Redmi Note 13 Pro', 'phones', 'Xiaomi', '1000', '20'),
+    ('Redmi Buds 5', 'audio', 'Xiaomi', '4999.99', '0'),
+    ('Xiaomi Band 8', 'audio', 'Xiaomi', '5000', '15'),
+]
+
+
+@override_settings(**TEST_SETTINGS)
+class StoreTestCase(TestCase):
+    databases = {'default', 'churn'}
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = {slug: Category.objects.create(name=slug.title(), slug=slug) for slug in ('phones', 'audio')}
+        brands = {name: Brand.objects.create(name=name) for name in ('Samsung', 'Apple', 'Xiaomi')}
+        cls.products = [
+            Product.objects.create(
+                name=name, category=categories[category], brand=brands[brand], description=name,
+                price=Decimal(price), discount_percentage=Decimal(discount), stock=10,
+            )
+            for name, category, brand, price, discount in CATALOGUE
+        ]
+        Product.objects.create(
+            name='Retired Phone', category=categories['phones'], brand=brands['Apple'], description='Old',
+            price=Decimal('500'), stock=0, available=False,
+        )
+        for position, product in enumerate(cls.products):
+            Product.objects.filter(pk=product.pk).update(view_count=(position * 7) % 5, units_sold=position % 3)
+
+    def setUp(self):
+        cache.clear()
+        catalogue_index.version = None
+        catalogue_snapshot.snapshot = None
+        # A log line per request (and per 404) would bury the test output
+        for name in ('store.requests', 'django.request'):
+            quiet = mock.patch.object(logging.getLogger(name), 'disabled', True)
+            quiet.start()
+            self.addCleanup(quiet.stop)
+        # Views buffered by a test must not be flushed into the real database at exit
+        self.addCleanup(view_counter.pending.clear)
+
+    def place_order(self, products, status='pending', payment_status='paid', age=timedelta(hours=1)):
+        """An order for one of each product, placed ``age`` ago."""
+        if not hasattr(self, 'customer'):
+            self.customer = User.objects.create_user('customer', password='pw')
+        order = Order.objects.create(
+            user=self.customer, total=0, shipping_address='Dhaka', status=status, payment_status=payment_status,
+        )
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - age)
+        return order
+
+    def listing(self, params=None, **settings):
+        with self.settings(STORE_PAGE_CACHE_TIMEOUT=0, **settings):
+            return self.client.get(reverse('store:category'), params or {})
+
+    @staticmethod
+    def listed_ids(response):
+        return [product.pk for product in response.context['products']]
+
+
+class ConditionalPageTests(StoreTestCase):
+    def revalidate(self, url, etag):
+        """One conditional request, with the queries it ran on the default database."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        return response, len(queries)
+
+    def test_matching_etag_gets_304_for_one_query(self):
+        for url in (reverse('store:category'), reverse('store:index'), self.products[0].get_absolute_url()):
+            etag = self.client.get(url)['ETag']
+            response, queries = self.revalidate(url, etag)
+            with self.subTest(url=url):
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(queries, 1)
+
+    def test_second_request_is_served_from_the_page_cache(self):
+        url = reverse('store:category')
+        first = self.client.get(url)
+        hits = get_page_cache_stats().get('hit', 0)
+        second = self.client.get(url)
+        self.assertEqual(get_page_cache_stats().get('hit', 0), hits + 1)
+        self.assertEqual(second.content, first.content)
+
+    def test_tracking_parameters_share_the_cached_page(self):
+        url = reverse('store:category')
+        self.client.get(url, {'category': 'audio', 'sort': 'name'})
+        hits = get_page_cache_stats().get('hit', 0)
+        self.client.get(url, {'sort': 'name', 'utm_source': 'mail', 'category': 'audio', 'search': ''})
+        self.assertEqual(get_page_cache_stats().get('hit', 0), hits + 1)
+
+    def test_logged_in_pages_are_not_cached(self):
+        User.objects.create_user('shopper', password='pw')
+        self.client.login(username='shopper', password='pw')
+        response = self.client.get(reverse('store:category'))
+        self.assertFalse(response.has_header('ETag'))
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_product_change_moves_the_etags(self):
+        listing_url, product_url = reverse('store:category'), self.products[1].get_absolute_url()
+        listing_etag, product_etag = self.client.get(listing_url)['ETag'], self.client.get(product_url)['ETag']
+        product = self.products[0]
+        product.price = Decimal('80000')
+        product.save()
+        for url, etag in ((listing_url, listing_etag), (product_url, product_etag)):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            with self.subTest(url=url):
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_stock_change_only_moves_that_products_etag(self):
+        listing_url = reverse('store:category')
+        sold, other = self.products[0].get_absolute_url(), self.products[1].get_absolute_url()
+        etags = {url: self.client.get(url)['ETag'] for url in (listing_url, sold, other)}
+        # As checkout does it: an UPDATE that fires no signals
+        Product.objects.filter(pk=self.products[0].pk).update(stock=9)
+        self.assertEqual(self.client.get(sold, HTTP_IF_NONE_MATCH=etags[sold]).status_code, 200)
+        self.assertEqual(self.client.get(listing_url, HTTP_IF_NONE_MATCH=etags[listing_url]).status_code, 304)
+        self.assertEqual(self.client.get(other, HTTP_IF_NONE_MATCH=etags[other]).status_code, 304)
+
+    def test_taxonomy_change_moves_the_etags(self):
+        urls = (reverse('store:category'), self.products[0].get_absolute_url())
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+        Brand.objects.create(name='Nokia')
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etags[url]).status_code, 200)
+
+
+class CoPurchaseTests(StoreTestCase):
+    def baskets(self):
+        phone, buds, iphone, airpods, redmi, redmi_buds, band = self.products
+        return [
+            [phone, buds], [phone, buds, band], [iphone, airpods], [iphone, airpods, buds],
+            [redmi, redmi_buds], [redmi, redmi_buds, band], [phone, band],
+        ]
+
+    @staticmethod
+    def matrix():
+        return set(CoPurchase.objects.values_list('product_id', 'other_id', 'count'))
+
+    @staticmethod
+    def related_lists():
+        return list(RelatedProduct.objects.order_by('product_id', 'rank').values_list('product_id', 'related_id', 'rank'))
+
+    def test_count_pairs_is_symmetric_with_order_counts_on_the_diagonal(self):
+        delta, last_order_id, processed = count_pairs([(1, {1, 2, 3}), (2, {2, 3})])
+        self.assertEqual((last_order_id, processed), (2, 2))
+        self.assertEqual(delta[2, 3], 2)
+        self.assertEqual(delta[3, 2], 2)
+        self.assertEqual(delta[1, 3], 1)
+        self.assertEqual(delta[2, 2], 2)
+        self.assertNotIn((1, 1, 1), delta)
+
+    def test_incremental_runs_match_a_full_rebuild(self):
+        baskets = self.baskets()
+        for basket in baskets[:4]:
+            self.place_order(basket)
+        self.assertEqual(update_copurchase()['orders'], 4)
+        for basket in baskets[4:]:
+            self.place_order(basket)
+        self.assertEqual(update_copurchase()['orders'], 3)
+        self.assertEqual(update_copurchase()['orders'], 0)
+        # Lists of products the second run did not touch are left as they were
+        touched = {product.pk for basket in baskets[4:] for product in basket}
+        matrix, lists = self.matrix(), [entry for entry in self.related_lists() if entry[0] in touched]
+
+        update_copurchase(full=True)
+        self.assertEqual(self.matrix(), matrix)
+        self.assertEqual([entry for entry in self.related_lists() if entry[0] in touched], lists)
+
+    def test_only_paid_or_delivered_orders_are_counted(self):
+        phone, buds, iphone = self.products[:3]
+        self.place_order([phone, buds])
+        self.place_order([phone, iphone], payment_status='pending')
+        self.place_order([buds, iphone], status='delivered', payment_status='pending')
+        self.place_order([phone, buds, iphone], status='cancelled')
+        self.place_order([phone, iphone], age=timedelta(0))  # Not settled yet
+        self.assertEqual(update_copurchase()['orders'], 2)
+        counts = {(a, b): count for a, b, count in self.matrix()}
+        self.assertEqual(counts[phone.pk, buds.pk], 1)
+        self.assertEqual(counts[buds.pk, iphone.pk], 1)
+        self.assertNotIn((phone.pk, iphone.pk), counts)
+
+    def test_full_rebuild_drops_orders_cancelled_after_counting(self):
+        phone, buds, iphone = self.products[:3]
+        self.place_order([phone, buds])
+        cancelled = self.place_order([phone, iphone])
+        update_copurchase()
+        Order.objects.filter(pk=cancelled.pk).update(status='cancelled')
+        update_copurchase(full=True)
+        self.assertEqual(self.related_lists(), [(phone.pk, buds.pk, 1), (buds.pk, phone.pk, 1)])
+
+    def test_new_related_list_moves_the_product_etag(self):
+        phone, buds = self.products[:2]
+        url = phone.get_absolute_url()
+        etag = self.client.get(url)['ETag']
+        self.place_order([phone, buds])
+        update_copurchase()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['related_products'], [buds])
+
+
+class SearchTests(StoreTestCase):
+    def test_prefix_search_matches_any_word(self):
+        labels = [document['label'] for document in catalogue_index.autocomplete('note 13')]
+        self.assertIn('Redmi Note 13 Pro', labels)
+        labels = [document['label'] for document in catalogue_index.autocomplete('gal')]
+        self.assertEqual(labels[:2], ['Galaxy Buds 2', 'Samsung Galaxy S24'])
+
+    def test_brands_and_categories_come_first(self):
+        suggestions = catalogue_index.autocomplete('a')
+        self.assertEqual([document['type'] for document in suggestions[:2]], ['brand', 'category'])
+
+    def test_trigram_search_survives_typos(self):
+        self.assertIn(self.products[0].pk, catalogue_index.fuzzy_search('samsng galxy'))
+        self.assertIn(self.products[2].pk, catalogue_index.fuzzy_search('iphon'))
+
+    def test_unavailable_products_are_not_suggested(self):
+        labels = [document['label'] for document in catalogue_index.autocomplete('retired')]
+        self.assertEqual(labels, [])
+
+    def test_renamed_product_is_suggested_under_its_new_name(self):
+        catalogue_index.autocomplete('x')  # Build the index
+        product = self.products[4]
+        product.name = 'Poco X6'
+        product.save()
+        labels = [document['label'] for document in catalogue_index.autocomplete('poco')]
+        self.assertEqual(labels, ['Poco X6'])
+
+    def test_autocomplete_view(self):
+        response = self.client.get(reverse('store:autocomplete'), {'q': 'airp'})
+        self.assertEqual([document['label'] for document in response.json()['results']], ['AirPods Pro'])
+
+    def test_listing_falls_back_to_fuzzy_matches(self):
+        response = self.listing({'search': 'samsng'})
+        self.assertTrue(response.context['fuzzy_search'])
+        self.assertIn(self.products[0].pk, self.listed_ids(response))
+
+    def test_exact_matches_do_not_fall_back(self):
+        response = self.listing({'search': 'redmi'})
+        self.assertFalse(response.context['fuzzy_search'])
+        self.assertEqual(sorted(self.listed_ids(response)), [self.products[4].pk, self.products[5].pk])
+
+
+class FacetTests(StoreTestCase):
+    def assertFacetsMatchResults(self, params):
+        facets = self.listing(params).context['facets']
+        for kind, entries in facets.items():
+            if kind in params:
+                continue  # Toggling a second value widens the selection
+            for entry in entries:
+                response = self.client.get(reverse('store:category') + entry['url'])
+                with self.subTest(params=params, facet=kind, label=entry['label']):
+                    self.assertEqual(response.context['products'].paginator.count, entry['count'])
+
+    def test_counts_match_results(self):
+        with self.settings(STORE_PAGE_CACHE_TIMEOUT=0):
+            for params in ({}, {'category': 'audio'}, {'brand': 'Xiaomi'}, {'search': 'buds'}, {'price': '1'}):
+                self.assertFacetsMatchResults(params)
+
+    def test_bucket_boundaries_are_half_open(self):
+        facets = self.listing().context['facets']
+        counts = {entry['label']: entry['count'] for entry in facets['price']}
+        # 999.50 is under 1,000; 1,000 and 4,999.99 are in the next bucket, 5,000 above it
+        self.assertEqual(counts['Tk 0 - 1,000'], 1)
+        self.assertEqual(counts['Tk 1,000 - 5,000'], 2)
+        self.assertEqual(counts['Tk 5,000 - 20,000'], 2)
+
+    def test_unknown_brand_is_ignored(self):
+        response = self.listing({'brand': 'Nokia'})
+        self.assertEqual(response.context['products'].paginator.count, len(self.products))
+
+    def test_multi_select_widens_within_a_facet(self):
+        response = self.listing({'brand': ['Apple', 'Xiaomi']})
+        self.assertEqual(response.context['products'].paginator.count, 5)
+        counts = {entry['label']: entry['count'] for entry in response.context['facets']['brand']}
+        # Brand counts ignore the brand selection itself
+        self.assertEqual(counts, {'Apple': 2, 'Samsung': 2, 'Xiaomi': 3})
+
+
+class SnapshotTests(StoreTestCase):
+    QUERIES = [
+        {},
+        {'brand': ['Apple', 'Xiaomi']},
+        {'category': 'audio'},
+        {'category': 'phones', 'brand': 'Samsung'},
+        {'price': '1'},
+        {'price': '4'},
+        {'min_price': '999.50', 'max_price': '5000'},
+        {'brand': 'Nokia', 'category': 'unknown'},
+    ]
+
+    def test_snapshot_matches_the_orm(self):
+        for params in self.QUERIES:
+            for sort in ('newest', 'price_asc', 'price_desc', 'best_selling', 'discount', 'popular', 'name'):
+                query = {**params, 'sort': sort}
+                orm = self.listing(query)
+                snapshot = self.listing(query, STORE_CATALOGUE_SNAPSHOT=True)
+                with self.subTest(query=query):
+                    self.assertEqual(self.listed_ids(snapshot), self.listed_ids(orm))
+                    self.assertEqual(
+                        snapshot.context['products'].paginator.count, orm.context['products'].paginator.count,
+                    )
+
+    def test_snapshot_follows_the_catalogue_version(self):
+        self.listing(STORE_CATALOGUE_SNAPSHOT=True)
+        product = self.products[0]
+        product.available = False
+        product.save()
+        response = self.listing(STORE_CATALOGUE_SNAPSHOT=True)
+        self.assertNotIn(product.pk, self.listed_ids(response))
+
+
+class SalesRankTests(StoreTestCase):
+    def ranks(self, category=None, window_days=30):
+        return list(
+            SalesRank.objects.filter(category=category, window_days=window_days)
+            .order_by('rank').values_list('product_id', 'units', 'rank')
+        )
+
+    def test_windows_and_categories_are_ranked_separately(self):
+        phone, buds, iphone, airpods = self.products[:4]
+        self.place_order([phone, buds], age=timedelta(days=2))
+        self.place_order([phone], age=timedelta(days=2))
+        self.place_order([iphone, airpods], age=timedelta(days=20))
+        self.place_order([iphone, airpods, buds], age=timedelta(days=60))
+        self.place_order([iphone, airpods], age=timedelta(days=200))
+        refresh_sales_ranks()
+
+        self.assertEqual(self.ranks(window_days=7), [(phone.pk, 2, 1), (buds.pk, 1, 2)])
+        self.assertEqual(self.ranks(window_days=30), [(phone.pk, 2, 1), (buds.pk, 1, 2), (iphone.pk, 1, 3), (airpods.pk, 1, 4)])
+        self.assertEqual(self.ranks(window_days=0)[:2], [(iphone.pk, 3, 1), (airpods.pk, 3, 2)])
+        phones = phone.category
+        self.assertEqual(self.ranks(phones, window_days=90), [(phone.pk, 2, 1), (iphone.pk, 2, 2)])
+        # Ties go to the lower id
+        self.assertEqual(self.ranks(buds.category, window_days=90), [(buds.pk, 2, 1), (airpods.pk, 2, 2)])
+
+    def test_only_paid_or_delivered_orders_count(self):
+        phone, buds, iphone = self.products[:3]
+        self.place_order([phone])
+        self.place_order([buds], status='delivered', payment_status='pending')
+        self.place_order([iphone], payment_status='pending')
+        self.place_order([iphone], status='cancelled')
+        refresh_sales_ranks()
+        self.assertEqual([product_id for product_id, _, _ in self.ranks()], [phone.pk, buds.pk])
+
+    def test_units_sold_and_best_sellers_follow_the_sort_window(self):
+        phone, buds = self.products[:2]
+        self.place_order([buds], age=timedelta(days=2))
+        self.place_order([phone], age=timedelta(days=45))
+        refresh_sales_ranks()
+        self.assertEqual(best_sellers(), [buds])
+        self.assertEqual(Product.objects.get(pk=buds.pk).units_sold, 1)
+        self.assertEqual(Product.objects.get(pk=phone.pk).units_sold, 0)
+
+    def test_new_ranks_move_the_listing_etag(self):
+        url = reverse('store:category')
+        etag = self.client.get(url, {'sort': 'best_selling'})['ETag']
+        self.place_order([self.products[6]])
+        refresh_sales_ranks()
+        response = self.client.get(url, {'sort': 'best_selling'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        # Nothing sold since: the next refresh leaves the version alone
+        refresh_sales_ranks()
+        self.assertEqual(
+            self.client.get(url, {'sort': 'best_selling'}, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304,
+        )
+
+
+class ViewCountFlushTests(StoreTestCase):
+    def test_failed_chunk_is_retried_without_double_counting(self):
+        counter = ViewCounter()
+        counter.pending = Counter({product.slug: 2 for product in self.products})
+        real_update = QuerySet.update
+        calls = []
+
+        def update_failing_second_chunk(queryset, **kwargs):
+            calls.append(queryset)
+            if len(calls) == 2:
+                raise DatabaseError('database is locked')
+            return real_update(queryset, **kwargs)
+
+        with mock.patch('store.viewcounts.FLUSH_CHUNK_SIZE', 3), \
+                mock.patch.object(QuerySet, 'update', update_failing_second_chunk), \
+                self.assertLogs('store.viewcounts', 'ERROR'):
+            self.assertEqual(counter.flush(), 6)
+        # The first chunk was written; the failed chunk and the rest wait for the next flush
+        self.assertEqual(sorted(counter.pending), sorted(product.slug for product in self.products[3:]))
+
+        self.assertEqual(counter.flush(), 8)
+        for position, product in enumerate(self.products):
+            product.refresh_from_db()
+            self.assertEqual(product.view_count, (position * 7) % 5 + 2)
+
+    def test_product_views_are_buffered_until_flushed(self):
+        product = self.products[0]
+        before = Product.objects.get(pk=product.pk).view_count
+        for _ in range(3):
+            self.client.get(product.get_absolute_url())
+        self.assertEqual(view_counter.pending[product.slug], 3)
+        self.assertEqual(Product.objects.get(pk=product.pk).view_count, before)
+        view_counter.flush()
+        self.assertEqual(Product.objects.get(pk=product.pk).view_count, before + 3)
+
+
+class ProductUrlTests(StoreTestCase):
+    def test_old_id_urls_redirect_permanently(self):
+        product = self.products[0]
+        response = self.client.get(reverse('store:product_by_id'), {'id': product.pk})
+        self.assertRedirects(response, f'/product/{product.slug}/', status_code=301)
+
+    def test_bad_ids_are_not_found(self):
+        retired = Product.objects.get(available=False)
+        for product_id in ('', 'abc', '-1', '999999', str(retired.pk)):
+            with self.subTest(product_id=product_id):
+                self.assertEqual(self.client.get(reverse('store:product_by_id'), {'id': product_id}).status_code, 404)
+
+    def test_unknown_or_unavailable_slug_is_not_found(self):
+        retired = Product.objects.get(available=False)
+        for slug in ('no-such-phone', retired.slug):
+            with self.subTest(slug=slug):
+                self.assertEqual(self.client.get(reverse('store:product', args=[slug])).status_code, 404)
+
+
+class SurrogateKeyTests(StoreTestCase):
+    def purged(self, change):
+        """Keys purged by ``change()``, once its transaction commits."""
+        with mock.patch.object(LoggingPurger, 'purge') as purge, self.captureOnCommitCallbacks(execute=True):
+            change()
+        return [set(call.args[0]) for call in purge.call_args_list]
+
+    def test_listing_names_its_products(self):
+        response = self.client.get(reverse('store:category'), {'category': 'audio'})
+        keys = set(response['Surrogate-Key'].split())
+        audio = {f'product-{product.pk}' for product in self.products if product.category.slug == 'audio'}
+        self.assertEqual(keys, {'product-list'} | audio)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('s-maxage=600', response['Cache-Control'])
+
+    def test_product_page_names_its_brand_category_and_related_cards(self):
+        product = self.products[0]
+        response = self.client.get(product.get_absolute_url())
+        keys = set(response['Surrogate-Key'].split())
+        self.assertTrue({f'product-{product.pk}', f'brand-{product.brand_id}', f'category-{product.category_id}'} <= keys)
+        for related in response.context['related_products']:
+            self.assertIn(f'product-{related.pk}', keys)
+
+    def test_cached_page_keeps_its_keys(self):
+        url = reverse('store:category')
+        first = self.client.get(url)
+        self.assertEqual(self.client.get(url)['Surrogate-Key'], first['Surrogate-Key'])
+
+    def test_logged_in_pages_have_no_keys(self):
+        User.objects.create_user('shopper', password='pw')
+        self.client.login(username='shopper', password='pw')
+        self.assertFalse(self.client.get(reverse('store:category')).has_header('Surrogate-Key'))
+
+    def test_listing_edits_purge_listings(self):
+        product = self.products[0]
+        product.price = Decimal('70000')
+        self.assertEqual(self.purged(product.save), [{f'product-{product.pk}', 'product-list'}])
+
+    def test_other_edits_purge_only_the_product(self):
+        product = self.products[0]
+        product.description = 'Now with more camera'
+        self.assertEqual(self.purged(product.save), [{f'product-{product.pk}'}])
+
+    def test_brand_edits_purge_the_brand_and_listings(self):
+        brand = self.products[0].brand
+        brand.name = 'Samsung Electronics'
+        self.assertEqual(self.purged(brand.save), [{f'brand-{brand.pk}', 'product-list'}])
+
+    def test_http_purger_posts_keys_in_batches(self):
+        purger = HttpPurger()
+        keys = [f'product-{number}' for number in range(HttpPurger.BATCH_SIZE + 1)]
+        with mock.patch('store.purging.requests.post') as post:
+            purger.send(keys)
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(post.call_args_list[1].kwargs['headers'], {'Surrogate-Key': keys[-1]})
+
+
+class ChurnRouterTests(StoreTestCase):
+    def test_churn_models_use_the_churn_database(self):
+        router = ChurnRouter()
+        self.assertEqual(router.db_for_read(CartItem), 'churn')
+        self.assertEqual(router.db_for_write(Session), 'churn')
+        self.assertIsNone(router.db_for_read(Product))
+
+    def test_relations_from_churn_rows_resolve_on_default(self):
+        user = User.objects.create_user('shopper', password='pw')
+        item = CartItem.objects.create(user=user, product=self.products[0])
+        self.assertEqual(item._state.db, 'churn')
+        self.assertEqual(ChurnRouter().db_for_read(Product, instance=item), 'default')
+        self.assertEqual(CartItem.objects.get(pk=item.pk).product, self.products[0])
+
+    def test_migrations_are_split(self):
+        router = ChurnRouter()
+        self.assertTrue(router.allow_migrate('churn', 'store', 'cartitem'))
+        self.assertFalse(router.allow_migrate('default', 'store', 'cartitem'))
+        self.assertTrue(router.allow_migrate('churn', 'sessions'))
+        self.assertFalse(router.allow_migrate('churn', 'store', 'product'))
+        self.assertTrue(router.allow_migrate('default', 'store', 'product'))
+
+
+
+class SessionTests(StoreTestCase):
+    def test_unchanged_session_is_not_saved(self):
+        session = SessionStore()
+        session['shipping_address'] = 'Dhaka'
+        session.save()
+
+        again = SessionStore(session.session_key)
+        again['shipping_address'] = 'Dhaka'
+        with self.assertNumQueries(0, using='churn'):
+            again.save()
+
+    def test_changed_session_is_saved(self):
+        session = SessionStore()
+        session['shipping_address'] = 'Dhaka'
+        session.save()
+
+        again = SessionStore(session.session_key)
+        again['shipping_address'] = 'Chittagong'
+        again.save()
+        row = Session.objects.get(session_key=session.session_key)
+        self.assertEqual(SessionStore().decode(row.session_data)['shipping_address'], 'Chittagong')
+
+    def test_unchanged_session_is_saved_again_past_half_its_lifetime(self):
+        session = SessionStore()
+        session['shipping_address'] = 'Dhaka'
+        session.save()
+
+        again = SessionStore(session.session_key)
+        again['shipping_address'] = 'Dhaka'
+        later = time.time() + again.get_expiry_age() / 2 + 1
+        with mock.patch('ecommerce_project.sessions.time.time', return_value=later):
+            again.save()
+        row = Session.objects.get(session_key=session.session_key)
+        self.assertEqual(SessionStore().decode(row.session_data)['_session_saved_at'], int(later))
+
+    def test_new_sessions_do_not_delete_expired_ones(self):
+        with mock.patch.object(SessionStore, 'clear_expired') as clear_expired:
+            for _ in range(200):
+                SessionStore().create()
+        clear_expired.assert_not_called()
+
+
+class RequestProfileTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        overridden = self.settings(STORE_PROFILE_DIR=self.directory, STORE_PROFILE_KEEP=2)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        self.staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        self.client.login(username='staff', password='pw')
+
+    def test_staff_request_is_profiled(self):
+        response = self.client.get(reverse('store:category'), {'profile': '1'})
+        profile = RequestProfile.objects.get()
+        self.assertEqual(response['X-Profile'], reverse('admin:store_requestprofile_change', args=[profile.pk]))
+        self.assertEqual(
+            (profile.user, profile.status_code, profile.path),
+            (self.staff, 200, f"{reverse('store:category')}?profile=1"),
+        )
+        self.assertGreater(profile.queries, 0)
+        for suffix in ('.prof', '.txt'):
+            self.assertTrue((self.directory / f'{profile.filename}{suffix}').exists())
+
+    def test_header_also_asks_for_a_profile(self):
+        self.client.get(reverse('store:category'), HTTP_X_PROFILE='1')
+        self.assertEqual(RequestProfile.objects.count(), 1)
+
+    def test_other_users_are_not_profiled(self):
+        self.client.logout()
+        User.objects.create_user('shopper', password='pw')
+        self.client.login(username='shopper', password='pw')
+        response = self.client.get(reverse('store:category'), {'profile': '1'})
+        self.assertFalse(response.has_header('X-Profile'))
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_profiled_logout_keeps_the_user(self):
+        self.client.get(reverse('accounts:logout'), {'profile': '1'})
+        self.assertEqual(RequestProfile.objects.get().user, self.staff)
+
+    def test_only_the_newest_profiles_are_kept(self):
+        for _ in range(3):
+            self.client.get(reverse('store:category'), {'profile': '1'})
+        self.assertEqual(RequestProfile.objects.count(), 2)
+        self.assertEqual(len(list(self.directory.iterdir())), 4)
+
+    def test_concurrent_request_is_served_unprofiled(self):
+        with _profiler_lock:
+            response = self.client.get(reverse('store:category'), {'profile': '1'})
+        self.assertEqual(response['X-Profile'], 'busy')
+        self.assertFalse(RequestProfile.objects.exists())
+
+
+class MetricsTests(StoreTestCase):
+    METRIC = 'store_orders_placed_total'
+    KEY = json.dumps(['metrics-test'])
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        overridden = self.settings(STORE_METRICS_DIR=self.directory, STORE_METRICS_TOKEN='secret')
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+    def worker_file(self, name, count, age=0):
+        path = self.directory / name
+        write_json(path, {self.METRIC: {self.KEY: count}})
+        if age:
+            moment = time.time() - age
+            os.utime(path, (moment, moment))
+        return path
+
+    def total(self):
+        return registry.collect()[self.METRIC].get(self.KEY, 0)
+
+    def test_workers_files_are_summed(self):
+        self.worker_file('1-1.json', 2)
+        self.worker_file('2-1.json', 3)
+        orders_placed.inc(payment_method='metrics-test')
+        self.assertEqual(self.total(), 6)
+
+    def test_exited_workers_are_retired_without_changing_totals(self):
+        self.worker_file('1-1.json', 2)
+        stale = self.worker_file('2-1.json', 3, age=3600)
+        before = self.total()
+        self.assertFalse(stale.exists())
+        self.assertEqual(json.loads((self.directory / RETIRED_FILE).read_text())['values'][self.METRIC][self.KEY], 3)
+        self.assertEqual(self.total(), before)
+
+    def test_interrupted_retire_does_not_count_twice(self):
+        # A scrape died after writing retired.json but before deleting the file it folded
+        write_json(self.directory / RETIRED_FILE, {'folded': ['2-1.json'], 'values': {self.METRIC: {self.KEY: 3}}})
+        self.worker_file('2-1.json', 3, age=3600)
+        self.assertEqual(self.total(), 3)
+        self.assertFalse((self.directory / '2-1.json').exists())
+
+    def test_endpoint_needs_the_token_or_staff(self):
+        url = reverse('store:metrics')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertContains(response, '# TYPE store_orders_placed_total counter')
+        User.objects.create_user('staff', password='pw', is_staff=True)
+        self.client.login(username='staff', password='pw')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+
+class RequestIdTests(StoreTestCase):
+    def test_request_id_is_echoed(self):
+        response = self.client.get(reverse('store:category'), HTTP_X_REQUEST_ID='edge-42')
+        self.assertEqual(response['X-Request-ID'], 'edge-42')
+
+    def test_malformed_request_id_is_replaced(self):
+        response = self.client.get(reverse('store:category'), HTTP_X_REQUEST_ID='bad id\n')
+        self.assertRegex(response['X-Request-ID'], r'^[0-9a-f]{32}$')
+
+
+class JsonLoggingTests(SimpleTestCase):
+    def background_handler(self, **kwargs):
+        # Each test stops its own listener; not stopped again at exit
+        with mock.patch('atexit.register'):
+            handler = BackgroundHandler(**kwargs)
+        handler.addFilter(RequestContextFilter())
+        return handler
+
+    def test_records_carry_request_context(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / 'store.log'
+        handler = self.background_handler(filename=path)
+        logger = logging.Logger('store.tests')
+        logger.addHandler(handler)
+
+        token = request_context.set({'request_id': 'abc'})
+        bind(order_id=7)
+        try:
+            logger.info('paid %s', 'order', extra={'amount': '10.00'})
+            try:
+                raise ValueError('declined')
+            except ValueError:
+                logger.exception('failed')
+        finally:
+            request_context.reset(token)
+        handler.stop()
+        handler.listener.handlers[0].close()
+
+        paid, failed = [json.loads(line) for line in path.read_text().splitlines()]
+        self.assertEqual(
+            {name: paid[name] for name in ('level', 'logger', 'message', 'request_id', 'order_id', 'amount')},
+            {'level': 'INFO', 'logger': 'store.tests', 'message': 'paid order',
+             'request_id': 'abc', 'order_id': 7, 'amount': '10.00'},
+        )
+        self.assertIn('ValueError: declined', failed['exception'])
+
+    def test_full_queue_drops_records(self):
+        handler = self.background_handler(queue_size=1)
+        handler.stop()
+        for _ in range(3):
+            handler.handle(logging.makeLogRecord({'msg': 'line'}))
+        self.assertEqual(handler.dropped, 2)
+
+    @override_settings(ADMINS=[('Ops', 'ops@example.com')])
+    def test_server_errors_still_email_admins(self):
+        handlers = [
+            handler for handler in logging.getLogger('django.request').handlers
+            if isinstance(handler, AdminEmailHandler)
+        ]
+        self.assertEqual(len(handlers), 1)
+        handlers[0].handle(logging.makeLogRecord({'name': 'django.request', 'levelno': logging.ERROR,
+                                                  'levelname': 'ERROR', 'msg': 'Internal Server Error: /'}))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Internal Server Error', mail.outbox[0].subject)
+
+
+
+@override_settings(**TEST_SETTINGS)
+class GenerateDataTests(TestCase):
+    databases = {'default', CHURN_DB}
+    SIZES = {'brands': 3, 'categories': 4, 'products': 30, 'users': 12, 'carts': 4, 'orders': 60}
+
+    def generate(self, seed=1):
+        generator = DatasetGenerator(random.Random(seed), days=90, batch_size=25, now=timezone.now())
+        with mock.patch.object(LoggingPurger, 'purge') as purge, self.captureOnCommitCallbacks(execute=True):
+            counts = generator.generate(**self.SIZES)
+        return counts, purge
+
+    @staticmethod
+    def dataset():
+        return (
+            list(Product.objects.order_by('pk').values_list('name', 'price', 'effective_price', 'stock')),
+            list(Order.objects.order_by('pk').values_list('user__username', 'total', 'status', 'payment_status')),
+        )
+
+    def test_same_seed_gives_same_data(self):
+        self.generate()
+        first = self.dataset()
+        for model in (AccountingEntry, OrderItem, Order, Product, Brand, Category, User):
+            model.objects.all().delete()
+        CartItem.objects.all().delete()
+        self.generate()
+        self.assertEqual(self.dataset(), first)
+
+    def test_rows_are_consistent(self):
+        counts, _ = self.generate()
+        self.assertEqual(
+            (counts['products'], counts['orders'], Order.objects.count(), OrderItem.objects.count()),
+            (30, 60, 60, counts['order_items']),
+        )
+        self.assertTrue(CartItem.objects.exists())
+        for order in Order.objects.prefetch_related('items'):
+            self.assertEqual(order.total, sum(item.price * item.quantity for item in order.items.all()))
+        # The ledger entries sync_order_to_ledger would have written
+        self.assertEqual(
+            AccountingEntry.objects.filter(entry_type='income').count(),
+            Order.objects.filter(payment_status='paid').count(),
+        )
+        self.assertEqual(
+            AccountingEntry.objects.filter(entry_type='expense').count(),
+            Order.objects.filter(payment_status='paid', status='cancelled').count(),
+        )
+
+    def test_listings_are_purged_once(self):
+        before = CatalogueVersion.objects.get()
+        _, purge = self.generate()
+        after = CatalogueVersion.objects.get()
+        self.assertEqual(after.taxonomy, before.taxonomy + 1)
+        self.assertEqual(purge.call_count, 1)
+        self.assertEqual(
+            set(purge.call_args.args[0]),
+            {'product-list'}
+            | {f'brand-{pk}' for pk in Brand.objects.values_list('pk', flat=True)}
+            | {f'category-{pk}' for pk in Category.objects.values_list('pk', flat=True)},
+        )
+
+    def test_command_refuses_a_filled_catalogue(self):
+        Category.objects.create(name='Phones', slug='phones')
+        with self.assertRaisesMessage(CommandError, 'not empty'):
+            call_command('generate_data', stdout=StringIO())
+
+
+@override_settings(**TEST_SETTINGS)
+class MoveChurnDataTests(TransactionTestCase):
+    """move_churn_data against churn tables recreated in the default database, as before the split."""
+    databases = {'default', CHURN_DB}
+    models = (Session, CartItem, VerificationCode)
+
+    def setUp(self):
+        with connection.schema_editor() as editor:
+            for model in self.models:
+                editor.create_model(model)
+        self.addCleanup(self.drop_default_tables)
+
+    def drop_default_tables(self):
+        with connection.schema_editor() as editor:
+            for model in self.models:
+                editor.delete_model(model)
+
+    def move(self, *args):
+        call_command('move_churn_data', *args, stdout=StringIO())
+
+    def test_rows_are_copied_with_fresh_ids_and_only_moved_rows_deleted(self):
+        # churn already uses id 1, and the (user, product) pair of the second row
+        CartItem.objects.using(CHURN_DB).create(user_id=7, product_id=7, quantity=5)
+        CartItem.objects.using(CHURN_DB).create(user_id=1, product_id=2, quantity=9)
+        CartItem.objects.using('default').create(user_id=1, product_id=1, quantity=1)
+        CartItem.objects.using('default').create(user_id=1, product_id=2, quantity=3)
+
+        self.move('--delete')
+
+        self.assertEqual(
+            sorted(CartItem.objects.using(CHURN_DB).values_list('user_id', 'product_id', 'quantity')),
+            [(1, 1, 1), (1, 2, 9), (7, 7, 5)],
+        )
+        # The conflicting row is kept where it was
+        self.assertEqual(list(CartItem.objects.using('default').values_list('product_id', 'quantity')), [(2, 3)])
+
+    def test_reruns_do_not_duplicate_rows(self):
+        code = VerificationCode.objects.using('default').create(email='a@example.com', code='123456')
+        Session.objects.using('default').create(session_key='k' * 32, session_data='data', expire_date=code.created_at)
+
+        self.move()
+        self.move('--delete')
+
+        self.assertEqual(VerificationCode.objects.using(CHURN_DB).count(), 1)
+        self.assertEqual(VerificationCode.objects.using(CHURN_DB).get().created_at, code.created_at)
+        self.assertEqual(Session.objects.using(CHURN_DB).count(), 1)
+        self.assertFalse(VerificationCode.objects.using('default').exists())
+        self.assertFalse(Session.objects.using('default').exists())
+
+
+class CacheBackendTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        shared = {'BACKEND': 'ecommerce_project.cache_backends.FileCache', 'LOCATION': self.directory}
+        overridden = self.settings(CACHES={**TEST_SETTINGS['CACHES'], 'cache-tests-shared': shared})
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+    @staticmethod
+    def in_threads(count, target):
+        """Run ``target()`` in ``count`` threads released together; returns their results."""
+        barrier = threading.Barrier(count)
+        results = [None] * count
+
+        def run(position):
+            barrier.wait()
+            results[position] = target()
+
+        threads = [threading.Thread(target=run, args=(position,)) for position in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_file_cache_add_has_exactly_one_winner(self):
+        def add():
+            # One instance per thread, as separate workers would have
+            thread_id = threading.get_ident()
+            return thread_id, FileCache(self.directory, {}).add('lock', thread_id)
+
+        winners = [thread_id for thread_id, added in self.in_threads(8, add) if added]
+        self.assertEqual(len(winners), 1)
+        self.assertEqual(FileCache(self.directory, {}).get('lock'), winners[0])
+
+    def test_file_cache_add_replaces_an_expired_entry(self):
+        cache = FileCache(self.directory, {})
+        self.assertTrue(cache.add('key', 'first', timeout=1))
+        self.assertFalse(cache.add('key', 'second'))
+        with mock.patch('django.core.cache.backends.filebased.time.time', return_value=time.time() + 2):
+            self.assertTrue(cache.add('key', 'third'))
+        self.assertEqual(cache.get('key'), 'third')
+
+    def two_level(self):
+        cache = TwoLevelCache('cache-tests-shared', {'OPTIONS': {'LOCK_TIMEOUT': 2}})
+        # The local LRU is shared by every instance in the process
+        cache.store.entries.clear()
+        return cache
+
+    def test_get_or_set_computes_once_for_concurrent_misses(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'value'
+
+        cache = self.two_level()
+        self.assertEqual(self.in_threads(8, lambda: cache.get_or_set('key', compute)), ['value'] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_get_or_set_waits_for_another_process(self):
+        cache = self.two_level()
+        # Another worker holds the lock and stores the value shortly after
+        cache.shared.add('key:computing', True)
+        threading.Timer(0.1, cache.shared.set, args=('key', 'theirs')).start()
+        self.assertEqual(cache.get_or_set('key', lambda: 'ours'), 'theirs')
+
+    def test_none_is_not_cached(self):
+        cache = self.two_level()
+        self.assertIsNone(cache.get_or_set('key', lambda: None))
+        self.assertEqual(cache.get_or_set('key', lambda: 'value'), 'value')
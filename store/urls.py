@@ -5,12 +5,16 @@ app_name = 'store'
 
 urlpatterns = [
     path('', views.index, name='index'),
-    path('product/', views.product, name='product'),
+    path('product/<slug:slug>/', views.product, name='product'),
+    path('product/', views.product_by_id, name='product_by_id'),
     path('category/', views.category, name='category'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
     path('cart/', views.cart, name='cart'),
     path('add-to-cart/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
     path('update-cart/<int:item_id>/', views.update_cart, name='update_cart'),
     path('remove-from-cart/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('order-invoice/<int:order_id>/', views.admin_order_invoice, name='admin_order_invoice'),
     path('track-order/<int:order_id>/', views.track_order, name='track_order'),
+    path('cache-stats/', views.cache_stats, name='cache_stats'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
\ No newline at end of file
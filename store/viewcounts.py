@@ -0,0 +1,108 @@
+"""
+Buffered product view counters.
+
+Views are counted in process memory and written by a background thread
+every STORE_VIEW_FLUSH_INTERVAL seconds as one statement per chunk:
+
+    UPDATE store_product SET view_count = view_count + CASE slug WHEN ... END
+    WHERE slug IN (...)
+
+so a product page never waits on a write. Each worker adds its own
+increments, which keeps totals correct with several processes; at most
+one interval of views is lost if a worker is killed outright.
+
+Flushes do not move the catalogue version, so pages that depend on the
+counts (the "Most Viewed" sort) are versioned by view_epoch(): a
+STORE_VIEW_COUNT_EPOCH-second window that every worker agrees on.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Product
+from .recommendations import chunked
+
+logger = logging.getLogger(__name__)
+
+def view_epoch():
+    """(number, start) of the current view-count window."""
+    length = getattr(settings, 'STORE_VIEW_COUNT_EPOCH', 300)
+    number = int(time.time() // length)
+    return number, datetime.fromtimestamp(number * length, tz=timezone.utc)
+
+
+# Each product slug takes three bound parameters (WHEN, THEN and IN)
+FLUSH_CHUNK_SIZE = 300
+
+
+class ViewCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = Counter()
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def record(self, slug):
+        with self.lock:
+            self.pending[slug] += 1
+            if self.thread is None:
+                self.start()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='product-view-flusher', daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def run(self):
+        interval = getattr(settings, 'STORE_VIEW_FLUSH_INTERVAL', 30)
+        while not self.stopped.wait(interval):
+            close_old_connections()
+            self.flush()
+        close_old_connections()
+
+    def flush(self):
+        """Write buffered counts; chunks that fail are kept for the next attempt."""
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+        flushed = 0
+        chunks = list(chunked(pending, FLUSH_CHUNK_SIZE))
+        for index, slugs in enumerate(chunks):
+            try:
+                Product.objects.filter(slug__in=slugs).update(view_count=F('view_count') + Case(
+                    *[When(slug=slug, then=Value(pending[slug])) for slug in slugs],
+                    output_field=IntegerField(),
+                ))
+            except DatabaseError:
+                logger.exception('Could not flush product view counts; retrying next interval')
+                # Earlier chunks are committed; only the rest goes back
+                with self.lock:
+                    for unsaved in chunks[index:]:
+                        self.pending.update({slug: pending[slug] for slug in unsaved})
+                break
+            flushed += sum(pending[slug] for slug in slugs)
+        return flushed
+
+
+view_counter = ViewCounter()
+
+
+def counts_product_views(view_func):
+    """
+    Count a view for every successful product page response, including
+    ones answered by conditional_page from the page cache or with a 304.
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, slug, *args, **kwargs):
+        response = view_func(request, slug, *args, **kwargs)
+        if request.method == 'GET' and response.status_code in (200, 304):
+            view_counter.record(slug)
+        return response
+    return _wrapped_view
@@ -1,69 +1,123 @@
+import hmac
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
 from django.core.mail import send_mail
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Q
+from django.http import Http404, HttpResponse, JsonResponse
+from django.db.models import Case, IntegerField, Q, When
 from django.conf import settings
 from .models import Product, Category, CartItem, Order, SiteSettings, Brand
-from decimal import Decimal
+from .recommendations import related_products_for
+from .bestsellers import best_sellers
+from .search import catalogue_index, FUZZY_MIN_RESULTS
+from .caching import conditional_page, listing_validator, product_validator, get_page_cache_stats, request_catalogue_version
+from .facets import build_facets, price_lookups, selected_bucket
+from .snapshot import catalogue_snapshot, SnapshotResult
+from .sorting import SORT_OPTIONS, get_sort, sort_choices
+from .viewcounts import counts_product_views
+from .purging import LISTING_KEY, add_surrogate_keys, product_key, taxonomy_keys
+from .metrics import cart_adds, registry as metrics_registry
+from django.views.decorators.cache import cache_control
 from django.contrib.auth.models import User
 
+@conditional_page(listing_validator, 'listing')
 def index(request):
     """Homepage with latest products and special offers"""
     # Slider: Show latest 5 products so new uploads appear immediately
-    latest_products = Product.objects.filter(available=True).order_by('-created_at')[:5]
+    latest_products = list(Product.objects.filter(available=True).order_by('-created_at')[:5])
     
     # Special Offers: Show ONLY discounted products
-    discounted_products = Product.objects.filter(discount_percentage__gt=0, available=True)[:12]
+    discounted_products = Product.objects.filter(discount_percentage__gt=0, available=True).select_related('brand', 'category')[:12]
     
     categories = Category.objects.all()[:6]
     context = {
         'slider_products': latest_products,     # For Hero Slider
+        'best_sellers': best_sellers(),         # Materialized by refresh_sales_ranks
         'special_offers': discounted_products,  # For 'Special Offers' Grid
         'categories': categories,
     }
+    # Cards add their own surrogate keys; the slider is rendered inline
+    add_surrogate_keys(request, [LISTING_KEY, *(product_key(p.pk) for p in latest_products)])
     return render(request, 'store/index.html', context)
 
 
+@conditional_page(listing_validator, 'listing')
 def category(request):
     """Product listing with filters"""
-    products = Product.objects.filter(available=True)
+    products = Product.objects.filter(available=True).select_related('brand', 'category')
     categories = Category.objects.all()
     
     # Get all unique brands for filter
     brands = Brand.objects.all()
     
-    # Filter by category
-    category_slug = request.GET.get('category')
-    if category_slug:
-        # Removed hardcoded 'phones' -> 'smartphones' conversion for better dynamic behavior
-        products = products.filter(category__slug=category_slug)
-    
-    # Filter by brand
-    brand_name = request.GET.get('brand')
-    if brand_name:
-        products = products.filter(brand__name=brand_name)
-    
     # Filter by search
     search = request.GET.get('search')
+    fuzzy_search = False
     if search:
-        products = products.filter(
+        matches = products.filter(
             Q(name__icontains=search) | 
             Q(description__icontains=search) |
             Q(brand__name__icontains=search) |
             Q(category__name__icontains=search)
         )
-    
-    # Filter by price range
+        exact_ids = list(matches.values_list('id', flat=True)[:FUZZY_MIN_RESULTS])
+        fuzzy_ids = []
+        if len(exact_ids) < FUZZY_MIN_RESULTS:
+            # Too few exact hits (typos, "note14"): add trigram matches after them
+            fuzzy_ids = [pk for pk in catalogue_index.fuzzy_search(search) if pk not in exact_ids]
+        if fuzzy_ids:
+            fuzzy_search = True
+            ranked_ids = exact_ids + fuzzy_ids
+            products = products.filter(id__in=ranked_ids).order_by(Case(
+                *[When(id=pk, then=position) for position, pk in enumerate(ranked_ids)],
+                output_field=IntegerField(),
+            ))
+        else:
+            products = matches
+
+    # Facet counts are taken over the searched set, before the sidebar filters
+    facets = build_facets(request, products, request_catalogue_version(request), search, brands, categories)
+
+    # Unknown brands and categories are ignored, as in the facet counts
+    known_slugs = {category.slug for category in categories}
+    known_brands = {brand.name for brand in brands}
+    category_slugs = [slug for slug in request.GET.getlist('category') if slug in known_slugs]
+    brand_names = [name for name in request.GET.getlist('brand') if name in known_brands]
     min_price = request.GET.get('min_price')
     max_price = request.GET.get('max_price')
-    if min_price:
-        products = products.filter(price__gte=Decimal(min_price))
-    if max_price:
-        products = products.filter(price__lte=Decimal(max_price))
+    prices = price_lookups(request.GET)
+    # A typed range replaces the bucket (see price_lookups)
+    price_bucket = None if min_price or max_price else selected_bucket(request.GET)
+    sort = get_sort(request)
+
+    snapshot = None if search else catalogue_snapshot.current(request_catalogue_version(request))
+    if snapshot is not None:
+        # Filter in memory; only the requested page is read from the database
+        products = SnapshotResult(snapshot, snapshot.filter(
+            brands=brand_names,
+            categories=category_slugs,
+            min_price=prices.get('price__gte'),
+            max_price=prices.get('price__lte'),
+            below=prices.get('price__lt'),
+        ), products, sort)
+    else:
+        # Filter by category and brand ids (several may be selected), not
+        # through a join, so a single one reads its (category|brand, sort)
+        # index; several are sorted after reading (see store.sorting)
+        if category_slugs:
+            products = products.filter(category_id__in=[c.id for c in categories if c.slug in category_slugs])
+        if brand_names:
+            products = products.filter(brand_id__in=[b.id for b in brands if b.name in brand_names])
+
+        # Filter by price range or bucket
+        products = products.filter(**prices)
+
+        # Fuzzy results stay in relevance order unless a sort was picked
+        if not fuzzy_search or 'sort' in request.GET:
+            products = products.order_by(*SORT_OPTIONS[sort][1])
     
     # Pagination
     paginator = Paginator(products, 12)  # Show 12 products per page
@@ -79,33 +133,56 @@ def category(request):
         'products': products,
         'categories': categories,
         'brands': brands,
-        'selected_brand': brand_name,
+        'selected_brands': brand_names,
+        'selected_categories': category_slugs,
+        'facets': facets,
+        'fuzzy_search': fuzzy_search,
+        'sort': sort,
+        'sort_choices': sort_choices(),
         'min_price': min_price or '',
         'max_price': max_price or '',
+        'price_bucket': price_bucket,
     }
+    add_surrogate_keys(request, [LISTING_KEY])
     return render(request, 'store/category_v2.html', context)
 
 
-def product(request):
+@counts_product_views
+@conditional_page(product_validator, 'product')
+def product(request, slug):
     """Product detail page"""
-    product_id = request.GET.get('id')
-    product_obj = get_object_or_404(Product, id=product_id, available=True)
-    related_products = Product.objects.filter(
-        category=product_obj.category,
-        available=True
-    ).exclude(id=product_id)[:4]
+    product_obj = get_object_or_404(Product.objects.select_related('brand', 'category'), slug=slug, available=True)
     
     context = {
         'product': product_obj,
-        'related_products': related_products,
+        'related_products': related_products_for(product_obj),
     }
+    add_surrogate_keys(request, [product_key(product_obj.pk), *taxonomy_keys(product_obj)])
     return render(request, 'store/product.html', context)
 
 
+def product_by_id(request):
+    """Permanent redirect from the old /product/?id=<id> URLs"""
+    product_id = request.GET.get('id', '')
+    if not product_id.isdigit():
+        raise Http404('Product not found')
+    slug = get_object_or_404(Product.objects.values_list('slug', flat=True), id=product_id, available=True)
+    return redirect('store:product', slug=slug, permanent=True)
+
+
+@cache_control(public=True, max_age=60)
+def autocomplete(request):
+    """Search-box suggestions, answered from the in-memory prefix index"""
+    query = request.GET.get('q', '').strip()
+    if len(query) < 2:
+        return JsonResponse({'query': query, 'results': []})
+    return JsonResponse({'query': query, 'results': catalogue_index.autocomplete(query)})
+
+
 @login_required
 def cart(request):
     """Shopping cart page"""
-    cart_items = CartItem.objects.filter(user=request.user)
+    cart_items = CartItem.objects.filter(user=request.user).prefetch_related('product')
     total = sum(item.subtotal for item in cart_items)
     
     context = {
@@ -151,6 +228,7 @@ def add_to_cart(request, product_id):
             cart_item.quantity += quantity
             
         cart_item.save()
+        cart_adds.inc()
         
         return JsonResponse({
             'success': True,
@@ -197,6 +275,23 @@ def remove_from_cart(request, item_id):
 
 from django.contrib.admin.views.decorators import staff_member_required
 
+@staff_member_required
+def cache_stats(request):
+    """Page cache hit/miss counters for this worker process (for tuning)"""
+    return JsonResponse({'page_cache': get_page_cache_stats()})
+
+
+def metrics(request):
+    """Prometheus scrape endpoint; staff, or a scraper sending the STORE_METRICS_TOKEN bearer token"""
+    token = getattr(settings, 'STORE_METRICS_TOKEN', '')
+    sent = request.META.get('HTTP_AUTHORIZATION', '')
+    # Not REMOTE_ADDR: behind a reverse proxy every request comes from 127.0.0.1
+    allowed = bool(token) and hmac.compare_digest(sent.encode(), f'Bearer {token}'.encode())
+    if not (allowed or request.user.is_staff):
+        raise Http404
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @staff_member_required
 def admin_order_invoice(request, order_id):
     order = get_object_or_404(Order, id=order_id)